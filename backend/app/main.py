@@ -1,20 +1,31 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
-from .database import engine, get_db, Base
-from .routers import samples, ws
+from .database import async_engine, engine, get_db
+from .routers import aggregates, samples, sweeps, ws
 # Ensure models are imported so that Base.metadata has all tables
 from .models import sample as sample_model  # noqa: F401
+from .models import rollup as rollup_model  # noqa: F401
+from .models import sweep as sweep_model  # noqa: F401
+from .models import diode_fit as diode_fit_model  # noqa: F401
+from .services.events import MPP_UPDATED, SAMPLES_COMMITTED, SAMPLES_DELETED, bus
+from .services.group_commit import committer
+from .services.mpp import mpp_cache
+from .services.response_cache import response_cache
+from .services.schema import create_schema
+from .services.websocket import manager
+from .utils import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables (partitioned on PostgreSQL) and upgrade older ones
+create_schema(engine)
 
 app = FastAPI(
     title="Solar Panel Monitoring API",
@@ -32,6 +43,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-route latency and DB query histograms (outermost: CORS time included)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+metrics.Gauge("pv_event_bus_dropped_total", "Events dropped for background subscribers that fell behind.",
+              lambda: bus.dropped, kind="counter")
 
 # Security
 security = HTTPBearer()
@@ -45,14 +62,43 @@ def get_api_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         )
     return token
 
+# Consumers of committed sample batches. The MPP cache is updated inline so
+# the next /api/mpp sees the batch; WebSocket fan-out runs in the background.
+bus.subscribe(SAMPLES_COMMITTED, mpp_cache.on_committed, inline=True)
+bus.subscribe(SAMPLES_COMMITTED, manager.on_committed)
+bus.subscribe(SAMPLES_DELETED, mpp_cache.on_deleted, inline=True)
+bus.subscribe(SAMPLES_DELETED, manager.on_deleted)
+# New maxima found by the MPP cache feed the "mpp" WebSocket stream
+bus.subscribe(MPP_UPDATED, manager.on_mpp)
+bus.subscribe(SAMPLES_COMMITTED, metrics.on_committed, inline=True)
+# Cached /api/samples and /api/mpp responses whose window a write touches
+bus.subscribe(SAMPLES_COMMITTED, response_cache.on_committed, inline=True)
+bus.subscribe(SAMPLES_DELETED, response_cache.on_deleted, inline=True)
+
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    # Commit what /ws/ingest connections submitted last, then deliver its events
+    await committer.flush()
+    await bus.stop()
+    # aiosqlite connections hold non-daemon threads until the pool is disposed
+    await async_engine.dispose()
+
 # Include routers
 app.include_router(samples.router)
+app.include_router(aggregates.router)
+app.include_router(sweeps.router)
 app.include_router(ws.router)
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Process metrics in the Prometheus text format (see ``utils.metrics``)."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return {
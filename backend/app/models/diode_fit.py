@@ -0,0 +1,34 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, String
+
+from ..database import Base
+
+
+class DiodeFit(Base):
+    """Single-diode model parameters fitted to one closed sweep.
+
+    One row per sweep (``sweep_id`` is ``sweeps.id``), written by the batch
+    extraction job; the series over time tracks panel degradation.
+    """
+    __tablename__ = "diode_fits"
+
+    sweep_id = Column(Integer, primary_key=True)
+    device_id = Column(String(64), nullable=False)
+    start_time = Column(DateTime(timezone=False), nullable=False, index=True)
+    n_points = Column(Integer, nullable=False)      # samples used by the fit
+
+    photo_current = Column(Float, nullable=False)   # IL, A
+    saturation_current = Column(Float, nullable=False)  # I0, A
+    series_resistance = Column(Float, nullable=False)   # Rs, ohm
+    shunt_resistance = Column(Float, nullable=False)    # Rsh, ohm
+    modified_ideality = Column(Float, nullable=False)   # a = n Ns k T / q, V
+    # Per-cell ideality factor n, from PV_CELLS_IN_SERIES and the sweep temperature
+    ideality = Column(Float, nullable=True)
+    temperature = Column(Float, nullable=True)      # mean sample temperature, °C
+
+    rmse = Column(Float, nullable=True)             # RMS current residual, A
+    iterations = Column(Integer, nullable=False)    # Levenberg-Marquardt iterations spent
+    converged = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        Index('idx_diode_fit_device_time', 'device_id', 'start_time'),
+    )
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, Integer, Float, DateTime, String
+
+from ..database import Base
+
+
+class SampleRollup(Base):
+    """Per-bucket aggregates of ``samples`` (1 min, 15 min, 1 h, 1 day).
+
+    Sums and counts are stored rather than means so batches merge with a
+    plain upsert; the peak-power sample of the bucket is kept alongside.
+    Buckets are per device.
+    """
+    __tablename__ = "sample_rollups"
+
+    device_id = Column(String(64), primary_key=True)
+    bucket = Column(String(8), primary_key=True)            # "1m", "15m", "1h", "1d"
+    bucket_start = Column(DateTime(timezone=False), primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    v_min = Column(Float, nullable=False)
+    v_max = Column(Float, nullable=False)
+    v_sum = Column(Float, nullable=False)
+    i_min = Column(Float, nullable=False)
+    i_max = Column(Float, nullable=False)
+    i_sum = Column(Float, nullable=False)
+    p_min = Column(Float, nullable=False)
+    p_max = Column(Float, nullable=False)
+    p_sum = Column(Float, nullable=False)
+    # Temperature is optional per sample, so it has its own count
+    temp_min = Column(Float, nullable=True)
+    temp_max = Column(Float, nullable=True)
+    temp_sum = Column(Float, nullable=False, default=0.0)
+    temp_count = Column(Integer, nullable=False, default=0)
+
+    # Sample with the highest power in the bucket
+    peak_id = Column(Integer, nullable=False)
+    peak_time = Column(DateTime(timezone=False), nullable=False)
+    peak_v = Column(Float, nullable=False)
+    peak_i = Column(Float, nullable=False)
+    peak_p = Column(Float, nullable=False)
@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, Float, DateTime, String, func, Index
 from sqlalchemy import Enum as SAEnum
 from datetime import datetime
 from enum import Enum
+import os
 
 from ..database import Base
 
@@ -11,11 +12,16 @@ class SampleSource(str, Enum):
     IMPORT = "IMPORT"
     MANUAL = "MANUAL"
 
+# Device of samples ingested without one (single-panel setups, older clients)
+DEFAULT_DEVICE_ID = os.getenv("DEFAULT_DEVICE_ID", "default")
+
 class Sample(Base):
     """Database model for storing solar panel measurement samples."""
     __tablename__ = "samples"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Panel / array the measurement comes from
+    device_id = Column(String(64), nullable=False, default=DEFAULT_DEVICE_ID, server_default=DEFAULT_DEVICE_ID)
     timestamp = Column(DateTime(timezone=False), default=datetime.utcnow, index=True)
     voltage = Column(Float, nullable=False)  # in Volts
     current = Column(Float, nullable=False)  # in Amperes
@@ -27,9 +33,12 @@ class Sample(Base):
         default=SampleSource.MANUAL
     )
 
-    # Add a composite index on (timestamp, voltage, current) to speed up queries
+    # Per-device windows, keyset pages and duplicate lookups scan (device_id, timestamp);
+    # the MPP is an index lookup per device or over all of them
     __table_args__ = (
-        Index('idx_sample_composite', 'timestamp', 'voltage', 'current'),
+        Index('idx_sample_device_time', 'device_id', 'timestamp', 'id'),
+        Index('idx_sample_device_power', 'device_id', 'power', 'timestamp'),
+        Index('idx_sample_power', 'power', 'timestamp'),
     )
 
     def calculate_power(self):
@@ -42,6 +51,7 @@ class Sample(Base):
         """Convert model to dictionary."""
         return {
             "id": self.id,
+            "device_id": self.device_id,
             "t": self.timestamp.isoformat() if self.timestamp else None,
             "V": self.voltage,
             "I": self.current,
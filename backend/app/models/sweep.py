@@ -0,0 +1,41 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, String
+
+from ..database import Base
+
+
+class Sweep(Base):
+    """One I-V sweep found in the sample stream, with its characteristic points.
+
+    Each device's stream is segmented on its own. Its last sweep is kept with
+    ``closed = False`` and is recomputed as samples arrive, until a reversal
+    or a time gap ends it.
+    """
+    __tablename__ = "sweeps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String(64), nullable=False)
+    closed = Column(Boolean, nullable=False, default=True)
+    start_time = Column(DateTime(timezone=False), nullable=False)
+    end_time = Column(DateTime(timezone=False), nullable=False)
+    start_id = Column(Integer, nullable=False)   # first and last sample ids
+    end_id = Column(Integer, nullable=False)
+    n_points = Column(Integer, nullable=False)
+    direction = Column(Integer, nullable=False)  # +1 rising voltage, -1 falling
+
+    vmp = Column(Float, nullable=False)
+    imp = Column(Float, nullable=False)
+    pmp = Column(Float, nullable=False)
+    mpp_id = Column(Integer, nullable=False)
+    voc = Column(Float, nullable=True)
+    isc = Column(Float, nullable=True)
+    fill_factor = Column(Float, nullable=True)
+    # Quadratic fit around the peak (services.mppfit); NULL when it did not apply
+    vmp_fit = Column(Float, nullable=True)
+    imp_fit = Column(Float, nullable=True)
+    pmp_fit = Column(Float, nullable=True)
+    fit_residual = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index('idx_sweep_time', 'start_time', 'end_time'),
+        Index('idx_sweep_device_time', 'device_id', 'start_time', 'end_time'),
+    )
@@ -0,0 +1,53 @@
+from typing import List, Optional
+
+from dateutil import parser as dtparser
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_db
+from ..models.rollup import SampleRollup
+from ..schemas.sample import AggregateOut, DEVICE_ID_REGEX
+from ..services.rollup import BUCKETS, query_rollups
+
+router = APIRouter()
+
+
+def _to_out(r: SampleRollup) -> AggregateOut:
+    return AggregateOut(
+        t=r.bucket_start,
+        bucket=r.bucket,
+        device_id=r.device_id,
+        count=r.count,
+        V_min=r.v_min, V_max=r.v_max, V_mean=r.v_sum / r.count,
+        I_min=r.i_min, I_max=r.i_max, I_mean=r.i_sum / r.count,
+        P_min=r.p_min, P_max=r.p_max, P_mean=r.p_sum / r.count,
+        T_min=r.temp_min, T_max=r.temp_max,
+        T_mean=r.temp_sum / r.temp_count if r.temp_count else None,
+        peak_id=r.peak_id, peak_t=r.peak_time, peak_V=r.peak_v, peak_I=r.peak_i, peak_P=r.peak_p,
+    )
+
+
+@router.get("/api/aggregates", response_model=List[AggregateOut])
+async def list_aggregates(
+    bucket: str = Query("1h", regex="^(" + "|".join(BUCKETS) + ")$", description="Bucket width: " + ", ".join(BUCKETS)),
+    from_: Optional[str] = Query(None, alias="from"),
+    to_: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=100000),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="One device; all devices merged when omitted"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Rollup buckets in time order, maintained at ingest (see ``services.rollup``)."""
+    dt_from = dt_to = None
+    if from_:
+        try:
+            dt_from = dtparser.isoparse(from_)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'from' datetime format")
+    if to_:
+        try:
+            dt_to = dtparser.isoparse(to_)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'to' datetime format")
+
+    rows = await db.run_sync(query_rollups, bucket, dt_from, dt_to, limit, device_id)
+    return [_to_out(r) for r in rows]
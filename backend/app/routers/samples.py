@@ -1,37 +1,46 @@
+import os
+import re
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import parse_obj_as
+from pydantic.error_wrappers import ErrorWrapper
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Union
 from datetime import datetime
 from dateutil import parser as dtparser
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.sample import Sample, SampleSource
-from ..schemas.sample import SampleIn, SampleOut, MPPResponse, SampleImportText
+from ..schemas.sample import SampleIn, SampleOut, MPPResponse, SampleImportText, ImportSummary, LineError, DEVICE_ID_REGEX
 from ..utils.security import verify_write_access
-from ..utils.parser import parse_text_samples, parse_csv_bytes, parse_xlsx_bytes
-from ..services.mpp import compute_mpp
-from ..services.websocket import manager, sample_to_message
+from ..utils import metrics, wire
+from ..utils.columnar import MAX_LINE_ERRORS, iter_csv_columns, parse_text_columns
+from ..services.events import SAMPLES_COMMITTED, SAMPLES_DELETED, SamplesCommitted, bus
+from ..services.mpp import fit_mpp, mpp_cache, query_mpp
+from ..services.mppfit import METHODS
+from ..services.downsample import downsample_indices
+from ..services.rollup import clear_rollups
+from ..services.sweeps import clear_sweeps
+from ..services.export import iter_export_lines
+from ..services.response_cache import REQUESTS, CachedResponse, narrow, response_cache, window
+from ..utils.cursor import decode_cursor, encode_cursor
+from ..utils.xlsx import iter_xlsx_columns
+from ..services.ingest import ingest_columns, ingest_rows, make_row
 
 router = APIRouter()
 
-
-def _to_model(item: SampleIn) -> Sample:
-    # Do not set timestamp=None so that server_default applies when not provided
-    s = Sample(
-        voltage=item.V,
-        current=item.I,
-        power=item.P if item.P is not None else item.V * item.I,
-        temperature=item.T,
-        source=item.source or SampleSource.MANUAL,
-    )
-    if item.t:
-        s.timestamp = item.t
-    return s
+# Rows committed per transaction by /api/import/file
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "10000"))
 
 
 def _to_out(model: Sample) -> SampleOut:
     return SampleOut(
         id=model.id,
+        device_id=model.device_id,
         t=model.timestamp,
         V=model.voltage,
         I=model.current,
@@ -41,185 +50,373 @@ def _to_out(model: Sample) -> SampleOut:
     )
 
 
-@router.post("/api/samples", response_model=List[SampleOut], dependencies=[Depends(verify_write_access)])
+# Read path columns: plain tuples, no ORM objects
+_ROW_COLUMNS = (Sample.id, Sample.timestamp, Sample.voltage, Sample.current,
+                Sample.power, Sample.temperature, Sample.source, Sample.device_id)
+
+
+def _samples_response(rows, format: str) -> ORJSONResponse:
+    """Encode ``_ROW_COLUMNS`` tuples as SampleOut objects, or as one array per field."""
+    if format == "columns":
+        ids, t, V, I, P, T, source, device = zip(*rows) if rows else ((),) * 8
+        P = [v * i if p is None else p for v, i, p in zip(V, I, P)]
+        return ORJSONResponse({"id": ids, "t": t, "V": V, "I": I, "P": P, "T": T,
+                               "source": source, "device_id": device})
+    return ORJSONResponse([
+        {"t": t, "V": V, "I": I, "P": V * I if P is None else P, "T": T, "source": source,
+         "device_id": device, "id": id_}
+        for id_, t, V, I, P, T, source, device in rows
+    ])
+
+
+def _respond(request: Request, entry: CachedResponse, endpoint: str, hit: bool) -> Response:
+    out = entry.respond(request)
+    REQUESTS.inc(endpoint, "not_modified" if out.status_code == 304 else "hit" if hit else "miss")
+    return out
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    # Cache key form of a query datetime: spellings of the same value agree
+    return dt.isoformat() if dt is not None else None
+
+
+async def _ingest_binary(body: bytes, device_id: Optional[str], source: SampleSource,
+                         db: AsyncSession) -> ImportSummary:
+    """Ingest a ``utils.wire`` message, one transaction for all of its blocks."""
+    try:
+        with metrics.PARSE_SECONDS.time("wire"):
+            blocks = list(wire.decode(body))
+        for cols, block_source in blocks:
+            if cols.device_id is not None and not re.match(DEVICE_ID_REGEX, cols.device_id):
+                raise ValueError(f"Invalid device id {cols.device_id!r}")
+            if block_source is not None and block_source not in SampleSource.__members__:
+                raise ValueError(f"Invalid source {block_source!r}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid binary samples: {e}")
+
+    committed = []
+    for cols, block_source in blocks:
+        cols.device_id = cols.device_id or device_id
+        src = SampleSource(block_source) if block_source else source
+        await db.run_sync(ingest_columns, cols, src)
+        committed.append(SamplesCommitted(columns=cols, source=src.value))
+    await db.commit()
+    for batch in committed:
+        bus.publish(SAMPLES_COMMITTED, batch)
+    return ImportSummary(imported=sum(len(b) for b in committed), chunks=len(committed))
+
+
+@router.post(
+    "/api/samples",
+    response_model=Union[List[SampleOut], ImportSummary],
+    dependencies=[Depends(verify_write_access)],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"description": "A SampleIn object or a list of them"}},
+        wire.MEDIA_TYPE: {"schema": {"type": "string", "format": "binary",
+                                     "description": "utils.wire blocks; answered with an ImportSummary"}},
+    }}},
+)
 async def create_samples(
-    payload: Union[SampleIn, List[SampleIn]],
-    db: Session = Depends(get_db),
+    request: Request,
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="Device of binary blocks without one"),
+    source: SampleSource = Query(SampleSource.MANUAL, description="Source of binary blocks without one"),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """Store samples sent as JSON (deduplicated, echoed back) or as ``utils.wire`` binary blocks.
+
+    Binary bodies (Content-Type ``utils.wire.MEDIA_TYPE``) are decoded
+    straight into columns and inserted in bulk without deduplication, like
+    imports.
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() == wire.MEDIA_TYPE:
+        return await _ingest_binary(await request.body(), device_id, source, db)
+    try:
+        payload = parse_obj_as(Union[SampleIn, List[SampleIn]], await request.json())
+    except ValueError as e:
+        # Malformed JSON or invalid samples: the 422 of a declared body
+        raise RequestValidationError([ErrorWrapper(e, loc=("body",))])
     items = payload if isinstance(payload, list) else [payload]
-    created: List[Sample] = []
-
-    for it in items:
-        # Deduplicate by (t,V,I) if t provided
-        existing = None
-        if it.t is not None:
-            existing = (
-                db.query(Sample)
-                .filter(Sample.timestamp == it.t, Sample.voltage == it.V, Sample.current == it.I)
-                .first()
-            )
-        if existing:
-            # Update if power missing
-            if existing.power is None:
-                existing.power = it.P if it.P is not None else it.V * it.I
-            if it.T is not None:
-                existing.temperature = it.T
-            db.add(existing)
-            db.flush()
-            created.append(existing)
-        else:
-            obj = _to_model(it)
-            db.add(obj)
-            db.flush()
-            created.append(obj)
-
-    db.commit()
-
-    # Broadcast over WebSocket
-    for s in created:
-        await manager.broadcast(sample_to_message(s.to_dict()))
-
-    return [_to_out(s) for s in created]
-
-
-@router.post("/api/import/file", response_model=List[SampleOut], dependencies=[Depends(verify_write_access)])
+
+    # Deduplicate by (t,V,I) if t provided, in bulk
+    created = await db.run_sync(ingest_rows, [make_row(it.V, it.I, it.P, it.T, it.t, it.source, it.device_id) for it in items])
+    await db.commit()
+    # WebSocket fan-out and the MPP cache follow from the event
+    bus.publish(SAMPLES_COMMITTED, SamplesCommitted(rows=created))
+
+    return [SampleOut(**s) for s in created]
+
+
+@router.post("/api/import/file", response_model=ImportSummary, dependencies=[Depends(verify_write_access)])
 async def import_file(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="Device the samples belong to"),
+    sheet: Optional[List[str]] = Query(None, description="XLSX sheets to import, in order ('*' for all); default: the active sheet"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Import CSV or XLSX from an uploaded file."""
+    """Import CSV or XLSX from an uploaded file.
+
+    The spooled upload is parsed as a stream and committed every
+    IMPORT_CHUNK_SIZE rows, so memory stays flat whatever the file size.
+    """
     import logging
     logger = logging.getLogger(__name__)
-    
-    content = await file.read()
+
     filename = (file.filename or "").lower()
     ctype = (file.content_type or "").lower()
-    
-    logger.info(f"Importing file: {filename}, content-type: {ctype}, size: {len(content)} bytes")
-
-    try:
-        if filename.endswith(".xlsx") or "spreadsheetml" in ctype:
-            logger.info("Parsing as XLSX")
-            parsed = parse_xlsx_bytes(content)
-        else:
-            logger.info("Parsing as CSV")
-            parsed = parse_csv_bytes(content)
-        logger.info(f"Parsed {len(parsed)} rows")
-    except Exception as e:
-        logger.error(f"Parse error: {e}")
-        raise HTTPException(status_code=400, detail=f"Failed to parse file: {e}")
 
-    if not parsed:
-        logger.error("No valid rows found")
-        raise HTTPException(status_code=400, detail="No valid rows found in file")
+    logger.info(f"Importing file: {filename}, content-type: {ctype}")
 
-    items: List[SampleIn] = []
-    for d in parsed:
-        try:
-            items.append(SampleIn(**d, source=SampleSource.IMPORT))
-        except Exception as e:
-            logger.error(f"Error creating SampleIn: {e}, data: {d}")
-            continue
-    
-    logger.info(f"Created {len(items)} SampleIn objects")
+    if filename.endswith(".xlsx") or "spreadsheetml" in ctype:
+        logger.info("Parsing as XLSX")
+        batches = iter_xlsx_columns(file.file, sheet, IMPORT_CHUNK_SIZE)
+    else:
+        logger.info("Parsing as CSV")
+        batches = iter_csv_columns(file.file, IMPORT_CHUNK_SIZE)
 
-    created: List[Sample] = []
-    for it in items:
-        obj = _to_model(it)
-        db.add(obj)
-        db.flush()
-        created.append(obj)
+    imported = skipped = chunks = 0
+    errors = []
 
-    db.commit()
-    logger.info(f"Committed {len(created)} samples to database")
+    def failed(status: int, detail: str) -> HTTPException:
+        # Committed chunks stay: tell the client so a retry does not duplicate them
+        return HTTPException(
+            status_code=status,
+            detail=f"{detail} ({imported} rows in {chunks} chunks were already imported)",
+            headers={"X-Imported-Rows": str(imported), "X-Imported-Chunks": str(chunks)},
+        )
 
-    for s in created:
-        await manager.broadcast(sample_to_message(s.to_dict()))
+    while True:
+        try:
+            # Parsing reads the spooled upload; keep it off the event loop too
+            cols = await run_in_threadpool(next, batches, None)
+        except Exception as e:
+            logger.error(f"Import parse error after {imported} rows: {e}")
+            raise failed(400, f"Failed to parse file: {e}")
+        if cols is None:
+            break
+        skipped += cols.skipped
+        errors.extend(cols.errors[:MAX_LINE_ERRORS - len(errors)])
+        cols.device_id = device_id
+        try:
+            await db.run_sync(ingest_columns, cols, SampleSource.IMPORT)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.exception(f"Import storage error after {imported} rows")
+            raise failed(500, f"Failed to store samples: {e}")
+        bus.publish(SAMPLES_COMMITTED, SamplesCommitted(columns=cols, source=SampleSource.IMPORT.value))
+        imported += len(cols)
+        chunks += 1
+        logger.info(f"Committed chunk {chunks}: {imported} samples so far")
+
+    if not imported:
+        logger.error("No valid rows found")
+        raise HTTPException(status_code=400, detail="No valid rows found in file")
 
-    return [_to_out(s) for s in created]
+    return ImportSummary(filename=file.filename, imported=imported, skipped=skipped, chunks=chunks,
+                         errors=[LineError(line=line, reason=reason) for line, reason in errors])
 
 
 @router.delete("/api/samples", dependencies=[Depends(verify_write_access)])
-async def delete_all_samples(db: Session = Depends(get_db)):
+async def delete_all_samples(db: AsyncSession = Depends(get_async_db)):
     """Delete all samples (reset)."""
     try:
-        count = db.query(Sample).delete()
-        db.commit()
+        count = (await db.execute(delete(Sample))).rowcount
+        await db.run_sync(clear_rollups)
+        await db.run_sync(clear_sweeps)
+        await db.commit()
+        bus.publish(SAMPLES_DELETED, count)
         return {"deleted": count}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/api/samples", response_model=List[SampleOut])
 async def list_samples(
+    request: Request,
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
     limit: Optional[int] = Query(None, ge=1, le=10000),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    max_points: Optional[int] = Query(None, ge=3, le=100000, description="Downsample the window to about this many points"),
+    method: str = Query("lttb", regex="^(lttb|minmax)$", description="Downsampling method: lttb or minmax"),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="Only this device's samples"),
+    format: str = Query("rows", regex="^(rows|columns)$",
+                        description="rows: a list of samples; columns: one array per field (Plotly traces)"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = db.query(Sample)
-
+    """Samples in (timestamp, id) order.
+
+    A full page (``limit`` rows read, before any downsampling) sets the
+    X-Next-Cursor header; pass it back as ``cursor`` to get the following page
+    (keyset pagination, no OFFSET).
+    Rows are selected as plain tuples and written with orjson, without a
+    model per sample. Responses are cached until a write touches their
+    window (``services.response_cache``) and carry an ETag.
+    """
+    q = select(*_ROW_COLUMNS)
+    if device_id is not None:
+        q = q.where(Sample.device_id == device_id)
+
+    dt_from = dt_to = after_t = None
     if from_:
         try:
             dt_from = dtparser.isoparse(from_)
-            q = q.filter(Sample.timestamp >= dt_from)
+            q = q.where(Sample.timestamp >= dt_from)
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid 'from' datetime format")
 
     if to_:
         try:
             dt_to = dtparser.isoparse(to_)
-            q = q.filter(Sample.timestamp <= dt_to)
+            q = q.where(Sample.timestamp <= dt_to)
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid 'to' datetime format")
 
-    q = q.order_by(Sample.timestamp.asc())
+    if cursor:
+        try:
+            after_t, after_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid 'cursor'")
+        q = q.where(
+            Sample.timestamp >= after_t,
+            or_(Sample.timestamp > after_t, Sample.id > after_id),
+        )
+
+    key = ("samples", device_id, _iso(dt_from), _iso(dt_to), limit, cursor, max_points,
+           method if max_points else None, format)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached, "samples", True)
+    since = response_cache.version
+    win = narrow(window(device_id, dt_from, dt_to), lo=after_t)
+
+    q = q.order_by(Sample.timestamp.asc(), Sample.id.asc())
     if limit:
         q = q.limit(limit)
 
-    rows = q.all()
-    return [_to_out(r) for r in rows]
+    if max_points:
+        # Pick the points on (id, t, P) only, then load just those rows
+        keys = (await db.execute(
+            q.with_only_columns(Sample.id, Sample.timestamp,
+                                func.coalesce(Sample.power, Sample.voltage * Sample.current))
+        )).all()
+        if len(keys) > max_points:
+            ids = np.fromiter((k[0] for k in keys), dtype=np.int64, count=len(keys))
+            # Epoch seconds: LTTB works on the time axis the chart draws
+            t = np.array([k[1] for k in keys], dtype="datetime64[us]").astype(np.int64) / 1e6
+            power = np.fromiter((k[2] for k in keys), dtype=np.float64, count=len(keys))
+            keep = ids[downsample_indices(power, max_points, method, t)].tolist()
+            by_id = {}
+            for i in range(0, len(keep), 500):
+                for r in (await db.execute(select(*_ROW_COLUMNS).where(Sample.id.in_(keep[i:i + 500])))):
+                    by_id[r[0]] = r
+            headers = {}
+            if limit and len(keys) == limit:
+                # The page ends at the last row read, not at the last point kept
+                headers["X-Next-Cursor"] = encode_cursor(keys[-1][1], keys[-1][0])
+                win = narrow(win, hi=keys[-1][1])
+            body = _samples_response([by_id[i] for i in keep], format).body
+            return _respond(request, response_cache.store(key, since, win, body, headers=headers), "samples", False)
+
+    rows = (await db.execute(q)).all()
+    headers = {}
+    if limit and len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1][1], rows[-1][0])
+        # Later samples belong to the next page
+        win = narrow(win, hi=rows[-1][1])
+    body = _samples_response(rows, format).body
+    return _respond(request, response_cache.store(key, since, win, body, headers=headers), "samples", False)
+
+
+@router.get("/api/samples/export")
+async def export_samples(
+    from_: Optional[str] = Query(None, alias="from"),
+    to_: Optional[str] = Query(None, alias="to"),
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="Only this device's samples"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Stream every sample of the window as NDJSON or CSV, in constant memory."""
+    window = [] if device_id is None else [Sample.device_id == device_id]
+    if from_:
+        try:
+            window.append(Sample.timestamp >= dtparser.isoparse(from_))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'from' datetime format")
+    if to_:
+        try:
+            window.append(Sample.timestamp <= dtparser.isoparse(to_))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'to' datetime format")
+
+    stmt = (
+        select(*_ROW_COLUMNS)
+        .where(*window)
+        .order_by(Sample.timestamp.asc(), Sample.id.asc())
+    )
+    # Own connection: the generator runs after the endpoint has returned
+    lines = iter_export_lines(db.bind, stmt, format)
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        lines,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="samples.{format}"'},
+    )
 
 
 @router.get("/api/mpp", response_model=MPPResponse)
 async def get_mpp(
+    request: Request,
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
-    db: Session = Depends(get_db),
+    method: str = Query("measured", regex="^(" + "|".join(METHODS) + ")$",
+                        description="measured sample, quadratic fit around it, or single-diode fit of its sweep"),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="MPP of this device; of all devices when omitted"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = db.query(Sample)
-
+    dt_from = dt_to = None
     if from_:
         try:
             dt_from = dtparser.isoparse(from_)
-            q = q.filter(Sample.timestamp >= dt_from)
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid 'from' datetime format")
 
     if to_:
         try:
             dt_to = dtparser.isoparse(to_)
-            q = q.filter(Sample.timestamp <= dt_to)
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid 'to' datetime format")
 
-    q = q.order_by(Sample.timestamp.asc())
-    rows = q.all()
+    key = ("mpp", device_id, _iso(dt_from), _iso(dt_to), method)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return _respond(request, cached, "mpp", True)
+    since = response_cache.version
 
-    series = [r.to_dict() for r in rows]
-    mpp = compute_mpp(series)
-    if not mpp:
+    # Whole history: running maximum kept by ingestion
+    if dt_from is None and dt_to is None:
+        s = await db.run_sync(mpp_cache.get, device_id)
+    else:
+        s = await db.run_sync(query_mpp, dt_from, dt_to, device_id)
+    if not s:
         raise HTTPException(status_code=404, detail="No data to compute MPP")
+    if method != "measured":
+        s = await db.run_sync(fit_mpp, s, method, dt_from, dt_to)
 
-    idx, s = mpp
-    return MPPResponse(Vmp=s['V'], Imp=s['I'], Pmp=s['P'], index=idx, t=dtparser.isoparse(s['t']) if isinstance(s['t'], str) else s['t'])
+    out = MPPResponse(Vmp=s['V'], Imp=s['I'], Pmp=s['P'], index=s['index'], t=s['t'],
+                      device_id=s['device_id'], method=s.get('method', method), residual=s.get('residual'))
+    body = ORJSONResponse(out.dict()).body
+    # Fits read the stored sweeps, and later samples can close the sweep of the MPP
+    win = window(device_id, dt_from, dt_to if method == "measured" else None)
+    return _respond(request, response_cache.store(key, since, win, body), "mpp", False)
 
 
 @router.post("/api/import/text", response_model=List[SampleOut], dependencies=[Depends(verify_write_access)])
 async def import_text(
     request: Request,
-    db: Session = Depends(get_db),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="Device the samples belong to"),
+    db: AsyncSession = Depends(get_async_db),
 ):
     content_type = request.headers.get('content-type', '')
     text_data: str
@@ -228,32 +425,24 @@ async def import_text(
         raw = await request.body()
         text_data = raw.decode('utf-8', errors='ignore')
     else:
-        # Expect JSON with {"text": "...", "source"?: "IMPORT"}
+        # Expect JSON with {"text": "...", "source"?: "IMPORT", "device_id"?: "..."}
         body = await request.json()
         text_data = body.get('text', '') if isinstance(body, dict) else ''
         if 'source' in body and body['source'] in SampleSource.__members__:
             source = SampleSource[body['source']]
-
-    parsed = parse_text_samples(text_data)
-    if not parsed:
+        if isinstance(body, dict) and body.get('device_id'):
+            device_id = str(body['device_id'])
+            if not re.match(DEVICE_ID_REGEX, device_id):
+                raise HTTPException(status_code=400, detail="Invalid 'device_id'")
+
+    # Columnar parse straight into a bulk insert, no per-row models or dicts
+    cols = parse_text_columns(text_data)
+    if not len(cols):
         raise HTTPException(status_code=400, detail="No valid lines found in input text")
+    cols.device_id = device_id
 
-    # Convert parsed dicts to SampleIn models
-    items: List[SampleIn] = []
-    for d in parsed:
-        items.append(SampleIn(**d, source=source))
-
-    # Insert
-    created: List[Sample] = []
-    for it in items:
-        obj = _to_model(it)
-        db.add(obj)
-        db.flush()
-        created.append(obj)
-
-    db.commit()
-
-    for s in created:
-        await manager.broadcast(sample_to_message(s.to_dict()))
+    await db.run_sync(ingest_columns, cols, source)
+    await db.commit()
+    bus.publish(SAMPLES_COMMITTED, SamplesCommitted(columns=cols, source=source.value))
 
-    return [_to_out(s) for s in created]
+    return [SampleOut(**s) for s in cols.iter_dicts(source.value)]
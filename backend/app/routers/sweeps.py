@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+from dateutil import parser as dtparser
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_db
+from ..models.sweep import Sweep
+from ..schemas.sample import SweepOut, DEVICE_ID_REGEX
+from ..services.sweeps import query_sweeps
+
+router = APIRouter()
+
+
+def _to_out(s: Sweep) -> SweepOut:
+    return SweepOut(
+        id=s.id, device_id=s.device_id, closed=s.closed, start=s.start_time, end=s.end_time, n_points=s.n_points,
+        direction=s.direction, Vmp=s.vmp, Imp=s.imp, Pmp=s.pmp, mpp_id=s.mpp_id,
+        Voc=s.voc, Isc=s.isc, FF=s.fill_factor,
+        Vmp_fit=s.vmp_fit, Imp_fit=s.imp_fit, Pmp_fit=s.pmp_fit, fit_residual=s.fit_residual,
+    )
+
+
+@router.get("/api/sweeps", response_model=List[SweepOut])
+async def list_sweeps(
+    from_: Optional[str] = Query(None, alias="from"),
+    to_: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=100000),
+    include_open: bool = Query(False, description="Also return the sweep still being recorded"),
+    device_id: Optional[str] = Query(None, regex=DEVICE_ID_REGEX, description="Only this device's sweeps"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Sweeps overlapping the window, in time order, as segmented at ingest."""
+    dt_from = dt_to = None
+    if from_:
+        try:
+            dt_from = dtparser.isoparse(from_)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'from' datetime format")
+    if to_:
+        try:
+            dt_to = dtparser.isoparse(to_)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'to' datetime format")
+
+    rows = await db.run_sync(query_sweeps, dt_from, dt_to, limit, include_open, device_id)
+    return [_to_out(s) for s in rows]
@@ -1,14 +1,178 @@
+import asyncio
+import json
+import os
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from ..services.websocket import manager
+from starlette.concurrency import run_in_threadpool
+
+from ..database import AsyncSessionLocal
+from ..models.sample import SampleSource
+from ..schemas.sample import DEVICE_ID_REGEX
+from ..services.group_commit import committer
+from ..services.mpp import mpp_cache
+from ..services.websocket import Subscription, manager, mpp_to_message
+from ..utils import metrics, wire
+from ..utils.columnar import SampleColumns, TextParser, parse_text_columns
+from ..utils.security import token_is_valid
 
 router = APIRouter()
 
+# Frames an ingest connection may have awaiting their commit before reads pause
+INGEST_MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", "64"))
+# Text frames larger than this are parsed off the event loop
+INGEST_THREAD_BYTES = 64 * 1024
+
+INGEST_CONNECTIONS = metrics.Gauge("pv_ws_ingest_connections", "Open /ws/ingest connections.")
+
+# Sessions for the current MPPs sent on subscription; live sockets hold none
+session_factory = AsyncSessionLocal
+
+
+async def _send_current_mpp(websocket: WebSocket, sub: Subscription):
+    # Start the mpp stream from the current maxima; the cache publishes the next ones
+    async with session_factory() as db:
+        for key in [None] if sub.devices is None else sorted(sub.devices):
+            best = await db.run_sync(mpp_cache.get, key)
+            if best is not None:
+                manager.send(websocket, mpp_to_message(dict(best, key=key)))
+
+
 @router.websocket("/ws/live")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, device_id: Optional[str] = None):
+    """Live samples; ``?device_id=`` follows a single device.
+
+    Clients narrow or widen what they receive by sending
+    ``{"type": "subscribe", "devices": [...], "sources": [...], "max_rate": 10,
+    "streams": ["samples", "mpp"]}`` (omitted filters mean all); the server
+    answers ``subscribed`` or ``error``. ``{"type": "unsubscribe"}`` stops
+    every stream. Other messages are ignored. Clients offering the
+    ``utils.wire.WS_SUBPROTOCOL`` subprotocol get samples as binary frames.
+    """
+    if device_id is not None and not re.match(DEVICE_ID_REGEX, device_id):
+        await websocket.close(code=1008)
+        return
+    await manager.connect(websocket, device_id, binary=wire.WS_SUBPROTOCOL in websocket.scope.get("subprotocols", ()))
     try:
         while True:
-            # Keep the connection alive by reading messages; ignore their content
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            try:
+                msg = json.loads(text)
+            except ValueError:
+                continue  # keepalive
+            if not isinstance(msg, dict):
+                continue
+            if msg.get("type") == "unsubscribe":
+                manager.subscribe(websocket, Subscription(streams=()))
+            elif msg.get("type") == "subscribe":
+                try:
+                    sub = Subscription.parse(msg)
+                except ValueError as e:
+                    manager.send(websocket, {"type": "error", "detail": str(e)})
+                    continue
+                manager.subscribe(websocket, sub)
+                if "mpp" in sub.streams:
+                    await _send_current_mpp(websocket, sub)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+
+
+def _frame_batches(msg: dict, device_id: Optional[str], source: SampleSource,
+                   parser: TextParser) -> Tuple[List[Tuple[SampleColumns, str]], SampleColumns]:
+    """Column batches of one ingest frame, and the columns holding its line errors; ValueError when invalid."""
+    if msg.get("bytes") is not None:
+        batches = []
+        with metrics.PARSE_SECONDS.time("wire"):
+            blocks = list(wire.decode(msg["bytes"]))
+        for cols, block_source in blocks:
+            metrics.PARSED_LINES.inc("wire", amount=len(cols))
+            if cols.device_id is not None and not re.match(DEVICE_ID_REGEX, cols.device_id):
+                raise ValueError(f"Invalid device id {cols.device_id!r}")
+            if block_source is not None and block_source not in SampleSource.__members__:
+                raise ValueError(f"Invalid source {block_source!r}")
+            cols.device_id = cols.device_id or device_id
+            batches.append((cols, block_source or source.value))
+        parsed = SampleColumns.empty()
+    else:
+        # The connection's parser keeps the format sniffed from earlier frames
+        parsed = parse_text_columns(msg.get("text") or "", parser)
+        parsed.device_id = device_id
+        batches = [(parsed, source.value)]
+    now = np.datetime64(datetime.utcnow(), "us")
+    for cols, _ in batches:
+        # Untimed samples are stamped on arrival, not when the group is committed
+        if cols.t is None:
+            cols.t = np.full(len(cols), now)
+    return [(c, s) for c, s in batches if len(c)], parsed
+
+
+async def _send_acks(websocket: WebSocket, acks: "asyncio.Queue"):
+    while True:
+        seq, futures, parsed, error = await acks.get()
+        if error is None:
+            try:
+                accepted = sum(await asyncio.gather(*futures))
+            except Exception:
+                error = "Commit failed; frame not stored"
+        if error is None:
+            reply = {"type": "ack", "seq": seq, "accepted": accepted, "skipped": parsed.skipped}
+            if parsed.errors:
+                reply["errors"] = [{"line": line, "reason": reason} for line, reason in parsed.errors]
+        else:
+            reply = {"type": "error", "seq": seq, "detail": error}
+        try:
+            await websocket.send_text(json.dumps(reply))
+        except Exception:
+            pass  # client gone; keep draining so the reader never blocks
+
+
+@router.websocket("/ws/ingest")
+async def ingest_endpoint(websocket: WebSocket, device_id: Optional[str] = None,
+                          source: SampleSource = SampleSource.SERIAL, token: Optional[str] = None):
+    """Persistent ingest channel for devices.
+
+    Authenticated like the write endpoints (``Authorization: Bearer`` header,
+    or ``?token=`` for clients that cannot set headers). Each frame is either
+    text in any /api/import/text format (e.g. ``V:20.2V I:0.10A`` lines) or
+    binary ``utils.wire`` blocks. Frames are numbered from 1 and acknowledged
+    in order once committed, ``{"type": "ack", "seq", "accepted", "skipped"}``
+    (plus ``errors``, ``[{"line", "reason"}]``, when text lines were rejected),
+    or answered ``{"type": "error", "seq", "detail"}``. The text format is
+    sniffed on the first frame and reused while frames keep to it. Commits are grouped
+    across frames and connections (``services.group_commit``); samples are
+    not deduplicated.
+    """
+    header = websocket.headers.get("authorization", "")
+    bearer = header[7:].strip() if header[:7].lower() == "bearer " else None
+    if not token_is_valid(bearer or token) or (device_id is not None and not re.match(DEVICE_ID_REGEX, device_id)):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    acks: asyncio.Queue = asyncio.Queue(maxsize=INGEST_MAX_INFLIGHT)
+    writer = asyncio.create_task(_send_acks(websocket, acks))
+    parser = TextParser()
+    seq = 0
+    INGEST_CONNECTIONS.inc()
+    try:
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            seq += 1
+            try:
+                if len(msg.get("text") or "") > INGEST_THREAD_BYTES:
+                    batches, parsed = await run_in_threadpool(_frame_batches, msg, device_id, source, parser)
+                else:
+                    batches, parsed = _frame_batches(msg, device_id, source, parser)
+            except ValueError as e:
+                await acks.put((seq, None, None, f"Invalid frame: {e}"))
+                continue
+            # Waits here while INGEST_MAX_INFLIGHT frames are still uncommitted
+            await acks.put((seq, [committer.submit(cols, src) for cols, src in batches], parsed, None))
+    finally:
+        # Frames already submitted are still committed
+        writer.cancel()
+        INGEST_CONNECTIONS.dec()
@@ -3,6 +3,9 @@ from datetime import datetime
 from typing import Optional, List
 from enum import Enum
 
+# Device ids: short, URL- and CSV-safe names
+DEVICE_ID_REGEX = r"^[A-Za-z0-9_.:-]{1,64}$"
+
 class SampleSource(str, Enum):
     SERIAL = "SERIAL"
     BLYNK = "BLYNK"
@@ -10,13 +13,14 @@ class SampleSource(str, Enum):
     MANUAL = "MANUAL"
 
 class SampleIn(BaseModel):
-    """Input schema matching API contract (t, V, I, P, T)."""
+    """Input schema matching API contract (t, V, I, P, T, device_id)."""
     t: Optional[datetime] = Field(default=None, description="ISO timestamp of the measurement")
     V: float = Field(..., description="Voltage in Volts (V)")
     I: float = Field(..., description="Current in Amperes (A)")
     P: Optional[float] = Field(None, description="Power in Watts (W)")
     T: Optional[float] = Field(None, description="Temperature in Celsius (°C)")
     source: Optional[SampleSource] = Field(default=SampleSource.MANUAL)
+    device_id: Optional[str] = Field(None, regex=DEVICE_ID_REGEX, description="Panel / array id (default device when omitted)")
 
     @validator('P', pre=True, always=True)
     def calculate_power(cls, v, values):
@@ -37,6 +41,7 @@ class SampleOut(SampleIn):
 class SampleImportText(BaseModel):
     text: str
     source: Optional[SampleSource] = Field(default=SampleSource.IMPORT)
+    device_id: Optional[str] = Field(None, regex=DEVICE_ID_REGEX)
 
 class MPPResponse(BaseModel):
     Vmp: float
@@ -44,3 +49,64 @@ class MPPResponse(BaseModel):
     Pmp: float
     index: int
     t: Optional[datetime] = None
+    device_id: Optional[str] = Field(None, description="Device of the MPP sample")
+    method: str = Field("measured", description="Method that produced the point; 'measured' when a fit was rejected")
+    residual: Optional[float] = Field(None, description="RMS power residual of the fit (W)")
+
+class LineError(BaseModel):
+    """An input line that was not imported."""
+    line: int
+    reason: str
+
+class ImportSummary(BaseModel):
+    """Outcome of a chunked file import."""
+    filename: Optional[str] = None
+    imported: int
+    skipped: int = 0
+    chunks: int
+    errors: List[LineError] = Field([], description="First rejected lines (skipped counts them all)")
+
+class AggregateOut(BaseModel):
+    """One rollup bucket: statistics of its samples and its peak-power sample."""
+    t: datetime = Field(..., description="Bucket start")
+    bucket: str
+    device_id: Optional[str] = Field(None, description="None when the buckets of all devices are merged")
+    count: int
+    V_min: float
+    V_max: float
+    V_mean: float
+    I_min: float
+    I_max: float
+    I_mean: float
+    P_min: float
+    P_max: float
+    P_mean: float
+    T_min: Optional[float] = None
+    T_max: Optional[float] = None
+    T_mean: Optional[float] = None
+    peak_id: int
+    peak_t: datetime
+    peak_V: float
+    peak_I: float
+    peak_P: float
+
+class SweepOut(BaseModel):
+    """One I-V sweep and its characteristic points."""
+    id: int
+    device_id: str
+    closed: bool
+    start: datetime
+    end: datetime
+    n_points: int
+    direction: int = Field(..., description="+1 rising voltage, -1 falling")
+    Vmp: float
+    Imp: float
+    Pmp: float
+    mpp_id: int
+    Voc: Optional[float] = None
+    Isc: Optional[float] = None
+    FF: Optional[float] = Field(None, description="Fill factor Pmp / (Voc * Isc)")
+    Vmp_fit: Optional[float] = Field(None, description="Peak of a parabola fitted around the measured MPP")
+    Imp_fit: Optional[float] = None
+    Pmp_fit: Optional[float] = None
+    fit_residual: Optional[float] = Field(None, description="RMS power residual of the fit (W)")
@@ -0,0 +1,36 @@
+"""
+Fit the single-diode model to every closed sweep without a stored fit.
+
+Results go to the ``diode_fits`` table (IL, I0, Rs, Rsh, ideality per
+sweep); rerunning only fits new sweeps unless ``--refit`` is given.
+
+Usage (from backend/):
+    python -m app.scripts.extract_diode_params [--workers N] [--limit N] [--refit]
+"""
+import argparse
+
+from ..database import SessionLocal, engine
+from ..services.extraction import DIODE_FIT_LANES, DIODE_FIT_WORKERS, clear_diode_fits, extract_diode_params
+from ..services.schema import create_schema
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--workers", type=int, default=DIODE_FIT_WORKERS, help="fitting processes (1: no pool)")
+    p.add_argument("--lanes", type=int, default=DIODE_FIT_LANES, help="sweeps per batched fit")
+    p.add_argument("--limit", type=int, default=None, help="fit at most this many sweeps")
+    p.add_argument("--refit", action="store_true", help="drop the stored fits first")
+    args = p.parse_args()
+
+    create_schema(engine)
+    with SessionLocal() as db:
+        if args.refit:
+            clear_diode_fits(db)
+            db.commit()
+        r = extract_diode_params(db, workers=args.workers, limit=args.limit, lanes=args.lanes)
+    print(f"Fitted {r['sweeps']} sweeps ({r['converged']} converged) in {r['seconds']:.1f}s "
+          f"({r['sweeps_per_s']:,.0f} sweeps/s, {args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
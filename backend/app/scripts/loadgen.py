@@ -0,0 +1,325 @@
+"""
+Load generator: a fleet of simulated panels against a running backend.
+
+Usage (from backend/):
+    python -m app.scripts.loadgen --devices 100 --rate 20 --duration 60 --listeners 10 --token devtoken \\
+        [--api http://localhost:8000] [--transport json|wire|ws] [--serve]
+
+Each device traces I-V sweeps of a 60-cell module with the single-diode
+model (services.diode), under irradiance that drifts as a random walk and
+a cell temperature that follows it with a lag. Every --interval seconds a
+device sends the --rate * --interval samples it measured since the last
+send, timestamped along the interval:
+
+    json   POST /api/samples with a JSON list (deduplicated by the API)
+    wire   POST /api/samples with a utils.wire binary block
+    ws     a binary frame on the device's own /ws/ingest connection
+
+--listeners /ws/live clients receive everything. For the last sample of
+each send, every listener records the delay between the send and its
+arrival: the end-to-end delivery latency. Send latency is the request
+time (json, wire) or the time to the frame's ack (ws). With --serve,
+uvicorn is started on a scratch SQLite database for the run.
+
+The generator, the listeners and a --serve backend share the machine:
+on few cores the report measures them together.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import httpx
+import numpy as np
+import websockets
+
+from ..services.diode import diode_current
+from ..utils import wire
+from ..utils.columnar import SampleColumns
+
+# 60-cell module at 1000 W/m2 and 25 C
+ISC_REF = 9.0
+I0_REF = 1e-7
+IDEALITY = 1.3
+CELLS = 60
+RS = 0.3
+RSH = 300.0
+ALPHA_ISC = 0.0005  # 1/K
+BANDGAP_EV = 1.12
+K_OVER_Q = 8.617e-5  # V/K
+
+# Sent batches older than this are not matched to received samples anymore
+MATCH_WINDOW = 120.0
+
+
+class Panel:
+    """One simulated module, one sweep of ``points`` samples after the other."""
+
+    def __init__(self, device_id: str, points: int, rng: np.random.Generator):
+        self.device_id = device_id
+        self.points = points
+        self.rng = rng
+        self.G = rng.uniform(300.0, 1000.0)
+        self.Tc = 20.0 + 0.03 * self.G
+        self.V = self.I = np.empty(0)
+        self.pos = 0
+        self._sweep()
+        # Devices do not all start their sweeps together
+        self.pos = int(rng.integers(0, points))
+
+    def _sweep(self):
+        self.G = float(np.clip(self.G + self.rng.normal(0.0, 15.0), 50.0, 1100.0))
+        self.Tc += 0.1 * (20.0 + 0.03 * self.G - self.Tc) + self.rng.normal(0.0, 0.2)
+        T = self.Tc + 273.15
+        IL = ISC_REF * self.G / 1000.0 * (1 + ALPHA_ISC * (self.Tc - 25.0))
+        I0 = I0_REF * (T / 298.15) ** 3 * np.exp(BANDGAP_EV / (IDEALITY * K_OVER_Q) * (1 / 298.15 - 1 / T))
+        a = IDEALITY * CELLS * K_OVER_Q * T
+        voc = a * np.log(IL / I0 + 1)
+        V = np.linspace(0.0, voc, self.points)
+        I = diode_current(V[None, :], [IL], [I0], [RS], [RSH], [a])[0]
+        self.V = V.round(3)
+        self.I = np.clip(I + self.rng.normal(0.0, 0.005, self.points), 0.0, None).round(4)
+        self.pos = 0
+
+    def take(self, n: int) -> Tuple[np.ndarray, np.ndarray, float]:
+        """The next ``n`` samples (V, I) and the cell temperature."""
+        V, I = [], []
+        while n > 0:
+            if self.pos >= self.points:
+                self._sweep()
+            k = min(n, self.points - self.pos)
+            V.append(self.V[self.pos:self.pos + k])
+            I.append(self.I[self.pos:self.pos + k])
+            self.pos += k
+            n -= k
+        return np.concatenate(V), np.concatenate(I), round(self.Tc, 2)
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.requests = 0
+        self.failed = 0
+        self.send_latency: List[float] = []
+        self.delivery_latency: List[float] = []
+        self.received = 0
+        self.behind = 0.0
+        self.elapsed = 0.0
+        # (device, last t of a send) -> wall-clock time of the send
+        self.pending: Dict[Tuple[str, datetime], float] = {}
+
+
+def _samples(panel: Panel, n: int, interval: float) -> Tuple[SampleColumns, List[datetime]]:
+    V, I, T = panel.take(n)
+    end = datetime.utcnow()
+    step = timedelta(seconds=interval / n)
+    times = [end - step * (n - 1 - k) for k in range(n)]
+    cols = SampleColumns(V, I, V * I, np.full(n, T), t=np.array(times, dtype="datetime64[us]"))
+    cols.device_id = panel.device_id
+    return cols, times
+
+
+async def _device(panel: Panel, args, stats: Stats, client: httpx.AsyncClient, stop: asyncio.Event):
+    n = max(1, round(args.rate * args.interval))
+    headers = {"Authorization": f"Bearer {args.token}"}
+    ws = None
+    acks: Dict[int, float] = {}
+    reader = None
+    if args.transport == "ws":
+        url = f"{_ws_base(args.api)}/ws/ingest?device_id={panel.device_id}&token={args.token}"
+        ws = await websockets.connect(url, max_size=None)
+
+        async def read_acks():
+            async for msg in ws:
+                reply = json.loads(msg)
+                sent = acks.pop(reply.get("seq"), None)
+                if reply.get("type") != "ack":
+                    stats.failed += 1
+                elif sent is not None:
+                    stats.send_latency.append(time.perf_counter() - sent)
+
+        reader = asyncio.create_task(read_acks())
+
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time() + panel.rng.uniform(0.0, args.interval)
+    seq = 0
+    try:
+        while not stop.is_set():
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if stop.is_set():
+                    break
+            else:
+                stats.behind = max(stats.behind, -delay)
+            next_tick += args.interval
+            cols, times = _samples(panel, n, args.interval)
+            stats.pending[(panel.device_id, times[-1])] = time.time()
+            start = time.perf_counter()
+            try:
+                if ws is not None:
+                    seq += 1
+                    acks[seq] = start
+                    await ws.send(wire.encode_columns(cols, "SERIAL"))
+                else:
+                    if args.transport == "wire":
+                        r = await client.post("/api/samples", content=wire.encode_columns(cols, "SERIAL"),
+                                              headers={**headers, "Content-Type": wire.MEDIA_TYPE})
+                    else:
+                        body = [{"t": t.isoformat(), "V": v, "I": i, "T": T, "device_id": panel.device_id,
+                                 "source": "SERIAL"}
+                                for t, v, i, T in zip(times, cols.V.tolist(), cols.I.tolist(), cols.T.tolist())]
+                        r = await client.post("/api/samples", json=body, headers=headers)
+                    stats.send_latency.append(time.perf_counter() - start)
+                    if r.status_code >= 400:
+                        stats.failed += 1
+                        continue
+                stats.sent += n
+                stats.requests += 1
+            except (httpx.HTTPError, websockets.ConnectionClosed):
+                stats.failed += 1
+    finally:
+        if ws is not None:
+            await asyncio.sleep(args.settle)
+            reader.cancel()
+            await ws.close()
+
+
+async def _listener(args, stats: Stats, ready: asyncio.Event):
+    async with websockets.connect(f"{_ws_base(args.api)}/ws/live", max_size=None) as ws:
+        ready.set()
+        async for msg in ws:
+            now = time.time()
+            frame = json.loads(msg)
+            if frame.get("type") != "samples":
+                continue
+            stats.received += len(frame["data"])
+            for s in frame["data"]:
+                sent = stats.pending.get((s.get("device_id"), datetime.fromisoformat(s["t"])))
+                if sent is not None:
+                    stats.delivery_latency.append(now - sent)
+
+
+def _ws_base(api: str) -> str:
+    return "ws" + api.rstrip("/")[4:] if api.startswith("http") else api.rstrip("/")
+
+
+async def _prune(stats: Stats, stop: asyncio.Event):
+    while not stop.is_set():
+        await asyncio.sleep(10.0)
+        cutoff = time.time() - MATCH_WINDOW
+        for key in [k for k, sent in stats.pending.items() if sent < cutoff]:
+            del stats.pending[key]
+
+
+def _percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    p50, p95, p99 = np.percentile(np.array(values) * 1e3, [50, 95, 99])
+    return f"p50 {p50:.1f} ms  p95 {p95:.1f} ms  p99 {p99:.1f} ms"
+
+
+async def run(args) -> Stats:
+    stats = Stats()
+    stop = asyncio.Event()
+    rng = np.random.default_rng(args.seed)
+    panels = [Panel(f"{args.prefix}{k:04d}", args.points, np.random.default_rng(rng.integers(1 << 32)))
+              for k in range(args.devices)]
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.api, limits=limits, timeout=30.0) as client:
+        listeners = []
+        for _ in range(args.listeners):
+            ready = asyncio.Event()
+            listeners.append(asyncio.create_task(_listener(args, stats, ready)))
+            await ready.wait()
+        pruner = asyncio.create_task(_prune(stats, stop))
+        devices = [asyncio.create_task(_device(p, args, stats, client, stop)) for p in panels]
+        start = time.monotonic()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        stats.elapsed = time.monotonic() - start
+        await asyncio.gather(*devices)
+        # Frames still on their way to the listeners
+        await asyncio.sleep(args.settle)
+        for task in listeners + [pruner]:
+            task.cancel()
+        await asyncio.gather(*listeners, pruner, return_exceptions=True)
+    return stats
+
+
+def _serve(args) -> Tuple[subprocess.Popen, tempfile.TemporaryDirectory]:
+    tmp = tempfile.TemporaryDirectory()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp.name}/loadgen.db", API_TOKEN=args.token)
+    env.pop("ASYNC_DATABASE_URL", None)
+    port = args.api.rstrip("/").rsplit(":", 1)[-1]
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", port,
+                             "--log-level", "warning"], env=env)
+    deadline = time.monotonic() + 30.0
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{args.api}/api/health", timeout=1.0).status_code == 200:
+                return proc, tmp
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.2)
+    proc.terminate()
+    tmp.cleanup()
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--api", default="http://localhost:8000")
+    p.add_argument("--token", required=True)
+    p.add_argument("--devices", type=int, default=10)
+    p.add_argument("--rate", type=float, default=10.0, help="samples per second per device")
+    p.add_argument("--interval", type=float, default=1.0, help="seconds between the sends of a device")
+    p.add_argument("--points", type=int, default=100, help="samples per I-V sweep")
+    p.add_argument("--transport", choices=["json", "wire", "ws"], default="json")
+    p.add_argument("--listeners", type=int, default=1, help="/ws/live clients measuring delivery latency")
+    p.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    p.add_argument("--settle", type=float, default=2.0, help="seconds to wait for the last acks and frames")
+    p.add_argument("--connections", type=int, default=20, help="HTTP connections shared by the devices")
+    p.add_argument("--prefix", default="sim-", help="device_id prefix")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--serve", action="store_true", help="start uvicorn on a scratch database for the run")
+    args = p.parse_args()
+
+    server = None
+    if args.serve:
+        server = _serve(args)
+    print(f"{args.devices} devices x {args.rate:g} samples/s over {args.transport}, "
+          f"{args.listeners} listeners, {args.duration:g} s against {args.api}")
+    try:
+        stats = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Exiting...")
+        return
+    finally:
+        if server is not None:
+            proc, tmp = server
+            proc.terminate()
+            proc.wait()
+            tmp.cleanup()
+
+    target = args.devices * args.rate
+    print(f"sent {stats.sent} samples in {stats.requests} sends, {stats.failed} failed, "
+          f"{stats.sent / stats.elapsed:.0f} samples/s (target {target:.0f})")
+    print(f"send latency      {_percentiles(stats.send_latency)}")
+    print(f"delivery latency  {_percentiles(stats.delivery_latency)}")
+    if args.listeners:
+        print(f"received {stats.received / args.listeners:.0f} samples per listener "
+              f"({stats.received / args.listeners / max(stats.sent, 1):.1%} of sent)")
+    print(f"max schedule lag  {stats.behind * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
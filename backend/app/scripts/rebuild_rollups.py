@@ -0,0 +1,26 @@
+"""
+Recompute the time-bucket rollups (1m, 15m, 1h, 1d) from the samples table.
+
+Ingestion keeps them up to date; run this after bulk changes made outside the
+API, or to backfill an existing database.
+
+Usage (from backend/):
+    python -m app.scripts.rebuild_rollups
+"""
+import time
+
+from ..database import engine
+from ..services.rollup import rebuild
+from ..services.schema import create_schema
+
+
+def main():
+    create_schema(engine)
+    start = time.perf_counter()
+    n = rebuild(engine)
+    elapsed = time.perf_counter() - start
+    print(f"Rebuilt rollups from {n} samples in {elapsed:.1f}s ({n / max(elapsed, 1e-9):,.0f} samples/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Re-segment the whole samples table into I-V sweeps.
+
+Ingestion keeps the sweeps up to date for data arriving in time order; run
+this after backfilling older samples or changing the SWEEP_* settings.
+
+Usage (from backend/):
+    python -m app.scripts.rebuild_sweeps
+"""
+import time
+
+from ..database import SessionLocal, engine
+from ..services.schema import create_schema
+from ..services.sweeps import rebuild_sweeps
+
+
+def main():
+    create_schema(engine)
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        n = rebuild_sweeps(db)
+        db.commit()
+    print(f"Found {n} sweeps in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
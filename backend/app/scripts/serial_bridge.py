@@ -1,82 +1,450 @@
 """
-Optional serial bridge script to read from a COM port (Proteus/ESP32) and push samples to the API.
+Serial bridge: read samples from a COM port (Proteus/ESP32) and push them to the API.
 
-Usage (local):
-    python serial_bridge.py --port COM3 --baud 115200 --api http://localhost:8000 --token devtoken
+Usage (from backend/):
+    python -m app.scripts.serial_bridge --port COM3 --baud 115200 --api http://localhost:8000 --token devtoken [--device roof-east]
 
 Expected incoming lines (examples):
     V:20.2V I:0.10A P:2.1W
+    20.2,0.10
 or JSON:
     {"V":20.2, "I":0.10, "P":2.1}
 
-The script will parse and POST to /api/samples (JSON), or forward raw text to /api/import/text.
+A reader thread parses lines into samples, timestamped on arrival, and
+feeds a bounded queue. The main thread sends them to /api/samples in
+batches of --batch-size samples or every --batch-delay seconds, over one
+keep-alive HTTP session, retrying failures with exponential backoff. Batches
+that still fail (backend down) are appended to an on-disk journal and
+replayed, oldest first, once the backend answers again; every sample carries
+its timestamp, so the API drops the duplicates of a batch sent twice.
+
+Without hardware:
+    python -m app.scripts.serial_bridge --replay capture.txt --rate 2000 --token devtoken
+    python -m app.scripts.serial_bridge --replay capture.txt --pty --token devtoken
+
+--replay feeds the lines of a file (--loop times, at --rate lines/s) instead
+of a port; with --pty they are written to a pseudo-terminal that the bridge
+reads through pyserial like a real port (stop it with Ctrl-C, like a port).
+Statistics (samples read, sent, journaled, ...) are printed on exit.
 """
 import argparse
 import json
+import logging
+import os
+import queue
+import random
+import re
 import sys
+import threading
 import time
-from typing import Optional
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 try:
     import serial  # pyserial
 except Exception:
     serial = None
 
-import requests
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except Exception:
+    requests = None
+
+from pydantic.datetime_parse import parse_datetime
+
+from ..schemas.sample import DEVICE_ID_REGEX, SampleSource
+from ..utils.columnar import TextParser, json_sample
+
+logger = logging.getLogger("serial_bridge")
+
+Batch = List[Dict[str, Any]]
+
+# HTTP statuses worth retrying; other 4xx mean the batch itself is rejected
+RETRY_STATUSES = {408, 425, 429}
+
+
+class SendError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class HttpSender:
+    """POST batches to /api/samples over one pooled keep-alive session."""
+
+    def __init__(self, api: str, token: str, timeout: float = 10.0):
+        self.url = f"{api.rstrip('/')}/api/samples"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        self.session.mount(self.url.split("/api/")[0], HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def __call__(self, batch: Batch):
+        try:
+            r = self.session.post(self.url, json=batch, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise SendError(str(e)) from e
+        if r.status_code >= 500 or r.status_code in RETRY_STATUSES:
+            raise SendError(f"HTTP {r.status_code}")
+        if r.status_code >= 400:
+            raise SendError(f"HTTP {r.status_code}: {r.text[:200]}", retryable=False)
+
+    def close(self):
+        self.session.close()
+
 
+class Journal:
+    """Append-only NDJSON file of undelivered batches, consumed from the front.
 
-def post_samples(api: str, token: str, payload):
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    r = requests.post(f"{api}/api/samples", headers=headers, json=payload, timeout=5)
-    r.raise_for_status()
+    The consumed byte offset lives next to it in ``<path>.offset``; it is
+    advanced only after a batch was delivered, so a crash replays at most a
+    batch twice. Both files are removed once everything is replayed.
+    """
 
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.offset = 0
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                self.offset = int(f.read().strip() or 0)
 
-def post_text(api: str, token: str, text: str):
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "text/plain"}
-    r = requests.post(f"{api}/api/import/text", headers=headers, data=text.encode("utf-8"), timeout=5)
-    r.raise_for_status()
+    def __bool__(self) -> bool:
+        return os.path.exists(self.path) and os.path.getsize(self.path) > self.offset
+
+    def append(self, batch: Batch):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(batch) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self, send: Callable[[Batch], None], max_batches: Optional[int] = None) -> int:
+        """Send journaled batches in order until one fails; returns the samples delivered."""
+        sent = batches = 0
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if max_batches is not None and batches >= max_batches:
+                    break
+                batch = json.loads(line)
+                try:
+                    send(batch)
+                except SendError as e:
+                    if e.retryable:
+                        raise
+                    logger.error("Dropping a journaled batch of %d samples rejected by the API: %s", len(batch), e)
+                else:
+                    sent += len(batch)
+                self.offset += len(line)
+                self._save_offset()
+                batches += 1
+        if not self:
+            os.remove(self.path)
+            if os.path.exists(self.offset_path):
+                os.remove(self.offset_path)
+            self.offset = 0
+        return sent
+
+    def _save_offset(self):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.offset))
+        os.replace(tmp, self.offset_path)
+
+
+def _json_samples(obj: Any, errors: Optional[List[str]]) -> Batch:
+    """The valid samples of a decoded JSON line: one bad sample would get its whole batch rejected."""
+    samples = []
+    for item in obj if isinstance(obj, list) else [obj]:
+        try:
+            s = json_sample(item)
+            if item.get("source") is not None and item["source"] not in SampleSource.__members__:
+                raise ValueError(f"unknown source {item['source']!r}")
+            if item.get("device_id") is not None and not re.match(DEVICE_ID_REGEX, str(item["device_id"])):
+                raise ValueError(f"invalid device id {item['device_id']!r}")
+            if s["t"] is not None:
+                parse_datetime(s["t"])
+        except (ValueError, TypeError) as e:
+            if errors is not None:
+                errors.append(str(e))
+            continue
+        samples.append({**s, **{k: item[k] for k in ("source", "device_id") if item.get(k) is not None}})
+    return samples
+
+
+def parse_line(line: str, device: Optional[str] = None, parser: Optional[TextParser] = None,
+               errors: Optional[List[str]] = None) -> Batch:
+    """Samples of one serial line (JSON object/list, key-value or V,I[,P][,T]), stamped now if untimed.
+
+    Pass the same ``parser`` for every line of a port so its format is only sniffed once.
+    JSON samples the API would reject are left out, their reasons appended to ``errors``.
+    """
+    samples = None
+    if line[:1] in ("{", "["):
+        try:
+            samples = _json_samples(json.loads(line), errors)
+        except ValueError:
+            pass
+    if samples is None:
+        samples = list((parser or TextParser()).rows([line]))
+    now = datetime.utcnow().isoformat()
+    out = []
+    for s in samples:
+        if s.get("t") is None:
+            s["t"] = now
+        s.setdefault("source", "SERIAL")
+        if device:
+            s["device_id"] = device
+        out.append(s)
+    return out
+
+
+class Bridge:
+    """Bounded queue between a line reader thread and a batching sender."""
+
+    def __init__(self, send: Callable[[Batch], None], journal: Journal, device: Optional[str] = None,
+                 batch_size: int = 500, batch_delay: float = 0.5, queue_size: int = 100_000,
+                 retries: int = 5, backoff: float = 0.5, max_backoff: float = 30.0,
+                 replay_per_batch: int = 4):
+        self.send = send
+        self.journal = journal
+        self.device = device
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.replay_per_batch = replay_per_batch
+        self.stop = threading.Event()
+        self.reading = False
+        # While the backend is down, batches go to the journal until this time
+        self._retry_at = 0.0
+        self.stats = {"read": 0, "sent": 0, "journaled": 0, "replayed": 0, "rejected": 0, "dropped": 0,
+                      "invalid": 0}
+        # Format of the port's lines, sniffed on the first ones
+        self.parser = TextParser()
+
+    def read(self, lines: Iterator[str]):
+        """Reader thread body: parse lines and queue their samples."""
+        try:
+            for line in lines:
+                if self.stop.is_set():
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                errors: List[str] = []
+                for sample in parse_line(line, self.device, self.parser, errors):
+                    self.stats["read"] += 1
+                    try:
+                        # A full queue means the sender fell far behind; don't stall the port for long
+                        self.queue.put(sample, timeout=1.0)
+                    except queue.Full:
+                        self.stats["dropped"] += 1
+                if errors:
+                    self.stats["invalid"] += len(errors)
+                    logger.warning("Skipping %d invalid sample(s) in %r: %s", len(errors), line[:200], errors[0])
+        except Exception:
+            logger.exception("Reader stopped")
+        finally:
+            self.reading = False
+
+    def start_reader(self, lines: Iterator[str]) -> threading.Thread:
+        self.reading = True
+        thread = threading.Thread(target=self.read, args=(lines,), name="serial-reader", daemon=True)
+        thread.start()
+        return thread
+
+    def _next_batch(self) -> Batch:
+        batch: Batch = []
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                # Short waits, so the end of the input is noticed without waiting out the delay
+                batch.append(self.queue.get(timeout=min(timeout, 0.1)))
+            except queue.Empty:
+                if not self.reading:
+                    break
+        return batch
+
+    def _deliver(self, batch: Batch) -> bool:
+        """Send with retries; True when delivered or rejected, False when the backend is unreachable."""
+        for attempt in range(self.retries + 1):
+            try:
+                self.send(batch)
+                return True
+            except SendError as e:
+                if not e.retryable:
+                    logger.error("Dropping a batch of %d samples rejected by the API: %s", len(batch), e)
+                    self.stats["rejected"] += len(batch)
+                    return True
+                if attempt == self.retries or self.stop.is_set():
+                    logger.warning("Backend unavailable (%s); journaling", e)
+                    return False
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                self.stop.wait(delay * random.uniform(0.5, 1.0))
+        return False
+
+    def _flush(self, batch: Batch):
+        if time.monotonic() < self._retry_at:
+            self.journal.append(batch)
+            self.stats["journaled"] += len(batch)
+            return
+        if self._deliver(batch):
+            self.stats["sent"] += len(batch)
+            self._retry_at = 0.0
+            self._replay(self.replay_per_batch)
+        else:
+            self.journal.append(batch)
+            self.stats["journaled"] += len(batch)
+            self._retry_at = time.monotonic() + self.max_backoff
+
+    def _replay(self, max_batches: Optional[int] = None):
+        if not self.journal:
+            return
+        try:
+            self.stats["replayed"] += self.journal.replay(self.send, max_batches)
+        except SendError as e:
+            logger.warning("Journal replay paused: %s", e)
+
+    def run(self):
+        """Send until the reader is done and the queue is empty (or ``stop`` is set)."""
+        self._replay()
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._flush(batch)
+                except KeyboardInterrupt:
+                    self.journal.append(batch)
+                    self.stats["journaled"] += len(batch)
+                    raise
+            elif not self.reading and self.queue.empty():
+                break
+            if self.stop.is_set():
+                self._drain_to_journal()
+                break
+        if not self.stop.is_set():
+            # Reader done: try to empty the journal before exiting
+            self._replay()
+
+    def _drain_to_journal(self):
+        batch: Batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.journal.append(batch)
+            self.stats["journaled"] += len(batch)
+
+
+def serial_lines(ser, stop: threading.Event) -> Iterator[str]:
+    while not stop.is_set():
+        raw = ser.readline()
+        if raw:
+            yield raw.decode("utf-8", errors="ignore")
+
+
+def replay_lines(path: str, rate: float = 0.0, loop: int = 1) -> Iterator[str]:
+    """Lines of ``path``, ``loop`` times, paced to ``rate`` lines/s (0: as fast as possible)."""
+    start = time.monotonic()
+    n = 0
+    for _ in range(loop):
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if rate > 0:
+                    ahead = start + n / rate - time.monotonic()
+                    if ahead > 0:
+                        time.sleep(ahead)
+                n += 1
+                yield line
+
+
+def open_pty(lines: Iterator[str]) -> str:
+    """Write ``lines`` to a new pseudo-terminal from a thread; returns the port to open."""
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+
+    def feed():
+        for line in lines:
+            os.write(master, line.rstrip("\r\n").encode() + b"\n")
+
+    threading.Thread(target=feed, name="pty-feeder", daemon=True).start()
+    return os.ttyname(slave)
 
 
 def main():
     p = argparse.ArgumentParser()
-    p.add_argument("--port", required=True, help="Serial port, e.g., COM3")
+    p.add_argument("--port", help="Serial port, e.g., COM3")
     p.add_argument("--baud", type=int, default=115200)
     p.add_argument("--api", default="http://localhost:8000")
     p.add_argument("--token", required=True)
+    p.add_argument("--device", default=None, help="device_id of the panel on this port")
+    p.add_argument("--batch-size", type=int, default=500, help="samples per POST")
+    p.add_argument("--batch-delay", type=float, default=0.5, help="seconds before a partial batch is sent")
+    p.add_argument("--queue-size", type=int, default=100_000, help="samples buffered between reader and sender")
+    p.add_argument("--retries", type=int, default=5)
+    p.add_argument("--journal", default="serial_bridge.journal", help="spill file for undelivered batches")
+    p.add_argument("--replay", metavar="FILE", help="read lines from FILE instead of a serial port")
+    p.add_argument("--rate", type=float, default=0.0, help="--replay lines per second (0: as fast as possible)")
+    p.add_argument("--loop", type=int, default=1, help="--replay the file this many times")
+    p.add_argument("--pty", action="store_true", help="--replay through a pseudo-terminal and pyserial")
     args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-    if serial is None:
+    if requests is None:
+        print("requests not installed. Install with: pip install requests", file=sys.stderr)
+        sys.exit(2)
+    if not args.port and not args.replay:
+        p.error("--port or --replay is required")
+    use_serial = args.port or args.pty
+    if use_serial and serial is None:
         print("pyserial not installed. Install with: pip install pyserial", file=sys.stderr)
         sys.exit(2)
 
-    ser = serial.Serial(args.port, args.baud, timeout=1)
-    print(f"Reading from {args.port} at {args.baud} baud. Forwarding to {args.api}")
+    sender = HttpSender(args.api, args.token)
+    bridge = Bridge(sender, Journal(args.journal), args.device, args.batch_size, args.batch_delay,
+                    args.queue_size, args.retries)
+    ser = None
+    if args.replay and not args.pty:
+        lines = replay_lines(args.replay, args.rate, args.loop)
+        source = args.replay
+    else:
+        port = open_pty(replay_lines(args.replay, args.rate, args.loop)) if args.pty else args.port
+        ser = serial.Serial(port, args.baud, timeout=1)
+        lines = serial_lines(ser, bridge.stop)
+        source = f"{port} at {args.baud} baud"
+    print(f"Reading from {source}. Forwarding to {args.api}")
 
+    start = time.monotonic()
+    bridge.start_reader(lines)
     try:
-        while True:
-            line = ser.readline().decode("utf-8", errors="ignore").strip()
-            if not line:
-                continue
-            # Try JSON first
-            try:
-                obj = json.loads(line)
-                if isinstance(obj, dict) or isinstance(obj, list):
-                    post_samples(args.api, args.token, obj)
-                    continue
-            except Exception:
-                pass
-            # Fallback to raw text
-            try:
-                post_text(args.api, args.token, line)
-            except Exception as e:
-                print(f"Error posting: {e}")
+        bridge.run()
     except KeyboardInterrupt:
         print("Exiting...")
+        bridge.stop.set()
+        bridge._drain_to_journal()
     finally:
-        try:
-            ser.close()
-        except Exception:
-            pass
+        sender.close()
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+    elapsed = time.monotonic() - start
+    stats = bridge.stats
+    print(", ".join(f"{k} {v}" for k, v in stats.items()) + f" in {elapsed:.1f}s "
+          f"({stats['sent'] / max(elapsed, 1e-9):.0f} samples/s sent)")
 
 
 if __name__ == "__main__":
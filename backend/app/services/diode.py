@@ -0,0 +1,219 @@
+"""Single-diode PV model: explicit I(V) through Lambert W, and batched fits.
+
+    I = IL - I0 * (exp((V + I*Rs) / a) - 1) - (V + I*Rs) / Rsh
+
+with ``a = n * Ns * k * T / q`` (the modified ideality factor, in volts).
+Every function works on a batch of curves at once: parameters are arrays
+of shape ``(B,)`` and points are ``(B, M)`` arrays with a validity mask, so
+thousands of sweeps are fitted with a handful of NumPy calls per iteration
+instead of one optimizer call per sweep. Only NumPy is needed.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+PARAMS = ("IL", "I0", "Rs", "Rsh", "a")
+
+# Levenberg-Marquardt settings
+FIT_MAX_ITER = 100
+# Stop when an accepted step lowers the squared error by less than this fraction
+FIT_TOL = 1e-6
+# Also stop once the RMS residual is this small relative to the largest current
+FIT_ATOL = 1e-10
+_LAMBDA0 = 1e-3
+# Forward-difference step on the fitted parameters
+_STEP = 1e-6
+# Bounds of the fitted parameters (IL, Voc, log Rs, 1/Rsh, log a), see _pack
+_LOWER = np.array([-np.inf, 1e-6, -14.0, 0.0, -7.0])
+_UPPER = np.array([np.inf, np.inf, 7.0, 10.0, 7.0])
+
+
+def lambertw_exp(z):
+    """``W(exp(z))`` elementwise for real ``z``, without evaluating ``exp(z)``.
+
+    Solves ``w + log(w) = z`` with the Fritsch-Shafer-Crowley iteration, which
+    is exact to double precision after two steps from this starting point.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    with np.errstate(over="ignore"):
+        w = np.where(z > 1.0, z - np.log(np.maximum(z, 1.0)), np.log1p(np.exp(np.minimum(z, 1.0))))
+    for _ in range(3):
+        zn = z - w - np.log(w)
+        q = 2.0 * (1.0 + w) * (1.0 + w + 2.0 / 3.0 * zn)
+        w = w * (1.0 + zn / (1.0 + w) * (q - zn) / (q - 2.0 * zn))
+    return w
+
+
+def diode_current(V, IL, I0, Rs, Rsh, a):
+    """Model current at voltages ``V`` (``(B, M)``) for per-curve parameters (``(B,)``)."""
+    V = np.asarray(V, dtype=np.float64)
+    IL, I0, Rs, Rsh, a = (np.asarray(x, dtype=np.float64)[..., None] for x in (IL, I0, Rs, Rsh, a))
+    k = 1.0 + Rs / Rsh
+    log_theta = np.log(Rs * I0 / (a * k)) + (Rs * (IL + I0) + V) / (a * k)
+    return (IL + I0 - V / Rsh) / k - a / Rs * lambertw_exp(log_theta)
+
+
+def initial_guess(V, I, mask=None, grid: int = 8) -> Dict[str, np.ndarray]:
+    """Starting parameters for every curve of the batch.
+
+    For fixed Rs and a, the implicit model is linear in IL, I0 and 1/Rsh, so
+    those come from a 3x3 least-squares solve at each point of a small
+    (Rs, a) grid; the grid point whose explicit residual is smallest wins.
+    """
+    V = np.atleast_2d(np.asarray(V, dtype=np.float64))
+    I = np.atleast_2d(np.asarray(I, dtype=np.float64))
+    mask = np.ones(V.shape, dtype=bool) if mask is None else np.broadcast_to(mask, V.shape)
+    voc = np.nanmax(np.where(mask, V, np.nan), axis=1)
+    isc = np.nanmax(np.where(mask, I, np.nan), axis=1)
+    scale = voc / isc
+
+    rs_f, a_f = np.meshgrid(np.logspace(-3, -0.3, grid), np.logspace(-2, -0.2, grid + 2))
+    Rs = scale[:, None] * rs_f.ravel()[None, :]  # (B, G)
+    a = voc[:, None] * a_f.ravel()[None, :]
+    m = mask[:, None, :]
+    x = V[:, None, :] + I[:, None, :] * Rs[..., None]  # (B, G, M)
+    with np.errstate(over="ignore"):
+        e = np.expm1(np.minimum(x / a[..., None], 300.0))
+    # I = IL - I0 * e - Gsh * x, unknowns scaled to O(1)
+    e_max = np.maximum(np.max(np.where(m, e, 0.0), axis=2, keepdims=True), 1e-300)
+    F = np.stack([np.ones_like(x), -e / e_max, -x / voc[:, None, None]], axis=-1) * m[..., None]
+    A = np.einsum("bgmi,bgmj->bgij", F, F) + 1e-12 * np.eye(3)
+    y = np.einsum("bgmi,bm->bgi", F, np.where(mask, I, 0.0))
+    c = np.linalg.solve(A, y[..., None])[..., 0]
+    IL = c[..., 0]
+    I0 = np.clip(c[..., 1] / e_max[..., 0], 1e-30, None)
+    Rsh = voc[:, None] / np.clip(c[..., 2], 1e-7, None)
+
+    with np.errstate(all="ignore"):
+        r = diode_current(V[:, None, :], IL, I0, Rs, Rsh, a) - I[:, None, :]
+    cost = np.where(m & np.isfinite(r), r * r, 0.0).sum(axis=2)
+    cost = np.where(np.isfinite(r).all(axis=2) | ~m.any(axis=2), cost, np.inf)
+    best = np.argmin(cost, axis=1)
+    rows = np.arange(len(V))
+    return {"IL": IL[rows, best], "I0": I0[rows, best], "Rs": Rs[rows, best],
+            "Rsh": Rsh[rows, best], "a": a[rows, best]}
+
+
+def _open_circuit_voltage(IL, I0, Rsh, a):
+    """Voc of the model: Newton on IL - I0 * (exp(V/a) - 1) - V/Rsh = 0."""
+    v = a * np.log1p(IL / I0)
+    for _ in range(8):
+        e = np.exp(np.minimum(v / a, 700.0))
+        f = IL - I0 * (e - 1.0) - v / Rsh
+        v = np.maximum(v + f / (I0 * e / a + 1.0 / Rsh), 1e-6)
+    return v
+
+
+def _pack(p: Dict[str, np.ndarray]) -> np.ndarray:
+    # I0 is replaced by Voc, which the data pins down; I0 and a alone are strongly correlated.
+    # Rs and a are fitted in log space, Rsh as a conductance so that it may reach infinity.
+    voc = _open_circuit_voltage(p["IL"], p["I0"], p["Rsh"], p["a"])
+    x = np.stack([p["IL"], voc, np.log(p["Rs"]), 1.0 / p["Rsh"], np.log(p["a"])], axis=-1)
+    return np.clip(x, _LOWER, _UPPER)
+
+
+def _unpack(x: np.ndarray):
+    IL, voc, Rs, Gsh, a = x[..., 0], x[..., 1], np.exp(x[..., 2]), x[..., 3], np.exp(x[..., 4])
+    y = voc / a
+    # I0 = (IL - Voc/Rsh) / (exp(Voc/a) - 1), in log space
+    log_i0 = np.log(np.maximum(IL - voc * Gsh, 1e-300)) - y - np.log(-np.expm1(-y))
+    with np.errstate(divide="ignore"):
+        return IL, np.exp(np.maximum(log_i0, -700.0)), Rs, 1.0 / Gsh, a
+
+
+def _residuals(x, V, I, mask):
+    with np.errstate(all="ignore"):
+        r = diode_current(V, *_unpack(x)) - I
+    return np.where(mask & np.isfinite(r), r, 0.0)
+
+
+def fit_diode(V, I, mask=None, guess: Optional[Dict[str, np.ndarray]] = None,
+              max_iter: int = FIT_MAX_ITER) -> Dict[str, np.ndarray]:
+    """Least-squares single-diode fit of every curve in the batch.
+
+    ``V``/``I`` are ``(B, M)`` (padding excluded by ``mask``). ``guess``
+    defaults to ``initial_guess`` of the points themselves; pass the
+    previous sweep's result to warm-start. Returns the parameters, the RMS
+    current residual ``rmse`` (A), the iterations used and ``converged``.
+    """
+    V = np.atleast_2d(np.asarray(V, dtype=np.float64))
+    I = np.atleast_2d(np.asarray(I, dtype=np.float64))
+    mask = np.ones(V.shape, dtype=bool) if mask is None else np.broadcast_to(mask, V.shape)
+    n_pts = mask.sum(axis=1)
+    tiny = (FIT_ATOL * np.maximum(np.abs(np.where(mask, I, 0.0)).max(axis=1), 1.0)) ** 2 * n_pts
+    if guess is None:
+        guess = initial_guess(V, I, mask)
+
+    x = _pack(guess)
+    r = _residuals(x, V, I, mask)
+    cost = (r * r).sum(axis=1)
+    lam = np.full(len(x), _LAMBDA0)
+    done = n_pts < len(PARAMS)
+    iters = np.zeros(len(x), dtype=np.int64)
+    eye = np.eye(len(PARAMS))
+
+    for _ in range(max_iter):
+        active = np.flatnonzero(~done)
+        if not len(active):
+            break
+        xa, ra = x[active], r[active]
+        Va, Ia, ma = V[active], I[active], mask[active]
+        # Forward-difference Jacobian, one batched model evaluation per parameter
+        J = np.empty(ra.shape + (len(PARAMS),))
+        for j in range(len(PARAMS)):
+            h = _STEP * np.maximum(1.0, np.abs(xa[:, j]))
+            h = np.where(xa[:, j] + h > _UPPER[j], -h, h)
+            xj = xa.copy()
+            xj[:, j] += h
+            J[..., j] = (_residuals(xj, Va, Ia, ma) - ra) / h[:, None]
+        A = np.einsum("bmi,bmj->bij", J, J)
+        g = np.einsum("bmi,bm->bi", J, ra)
+        damp = lam[active, None, None] * (A * eye + 1e-12 * eye)
+        try:
+            step = np.linalg.solve(A + damp, -g[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(A[k] + damp[k], -g[k], rcond=None)[0] for k in range(len(active))])
+        x_new = np.clip(xa + step, _LOWER, _UPPER)
+        r_new = _residuals(x_new, Va, Ia, ma)
+        cost_new = (r_new * r_new).sum(axis=1)
+
+        better = np.isfinite(cost_new) & (cost_new < cost[active])
+        b = active[better]
+        rel = (cost[b] - cost_new[better]) / np.maximum(cost[b], 1e-300)
+        x[b], r[b], cost[b] = x_new[better], r_new[better], cost_new[better]
+        lam[b] = np.maximum(lam[b] * 0.3, 1e-12)
+        lam[active[~better]] *= 10.0
+        iters[active] += 1
+        done[b[(rel < FIT_TOL) | (cost[b] <= tiny[b])]] = True
+        done[active[~better][lam[active[~better]] > 1e10]] = True
+
+    IL, I0, Rs, Rsh, a = _unpack(x)
+    return {
+        "IL": IL, "I0": I0, "Rs": Rs, "Rsh": Rsh, "a": a,
+        "rmse": np.sqrt(cost / np.maximum(n_pts, 1)),
+        "iterations": iters,
+        "converged": done & (n_pts >= len(PARAMS)),
+    }
+
+
+def diode_mpp(params: Dict[str, np.ndarray], v_max, grid: int = 400) -> Dict[str, np.ndarray]:
+    """Maximum power point of fitted curves on ``[0, v_max]``.
+
+    Dense grid search, refined by the vertex of a parabola through the best
+    grid point and its neighbours.
+    """
+    v_max = np.asarray(v_max, dtype=np.float64)
+    V = v_max[:, None] * np.linspace(0.0, 1.0, grid)[None, :]
+    args = tuple(params[k] for k in PARAMS)
+    with np.errstate(all="ignore"):
+        P = V * diode_current(V, *args)
+    k = np.clip(np.nanargmax(np.where(np.isfinite(P), P, -np.inf), axis=1), 1, grid - 2)
+    rows = np.arange(len(V))
+    p0, p1, p2 = P[rows, k - 1], P[rows, k], P[rows, k + 1]
+    h = V[:, 1] - V[:, 0]
+    denom = p0 - 2.0 * p1 + p2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(denom < 0, 0.5 * (p0 - p2) / denom, 0.0)
+    vmp = V[rows, k] + np.clip(shift, -1.0, 1.0) * h
+    imp = diode_current(vmp[:, None], *args)[:, 0]
+    return {"vmp": vmp, "imp": imp, "pmp": vmp * imp}
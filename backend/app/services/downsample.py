@@ -0,0 +1,81 @@
+"""Vectorized downsampling of sample series for plotting.
+
+Both methods work on a series in time order, with buckets of equal sample
+counts, and return the indices of the samples to keep. The global power
+maximum (the MPP) is always kept.
+"""
+from typing import Optional
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(y: np.ndarray, n_out: int, x: Optional[np.ndarray] = None) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of ``n_out`` points preserving the shape of y(x).
+
+    Bucket means are computed in one pass; only the choice of the point in
+    each bucket (which depends on the previous pick) loops, over buckets.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # n_out - 2 buckets over the points between the fixed first and last ones
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # The "next" point for the last bucket is the last sample
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[b]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[b] - ay))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the min and max of ``n_out // 2`` equal-count buckets, in order."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    k = n_out // 2
+    size = -(-n // k)
+    padded = np.full(k * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(k, size)
+    valid = ~np.isnan(padded).all(axis=1)
+    base = np.arange(k)[valid] * size
+    lows = base + np.nanargmin(padded[valid], axis=1)
+    highs = base + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def downsample_indices(power: np.ndarray, max_points: int, method: str = "lttb",
+                       t: Optional[np.ndarray] = None) -> np.ndarray:
+    """Sorted indices of at most ``max_points`` (+1 for the MPP) samples of a P(t) series.
+
+    ``t`` (e.g. epoch seconds) is the chart's x axis; without it LTTB measures
+    triangles on the sample index, which misjudges shapes across time gaps.
+    """
+    power = np.asarray(power, dtype=np.float64)
+    if len(power) <= max_points:
+        return np.arange(len(power))
+    if method == "minmax":
+        idx = minmax_indices(power, max_points)
+    elif method == "lttb":
+        idx = lttb_indices(power, max_points, t)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    # Keep the MPP even if its bucket picked another point
+    return np.union1d(idx, [int(np.nanargmax(power))])
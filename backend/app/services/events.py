@@ -0,0 +1,150 @@
+"""In-process event bus for sample events.
+
+Write endpoints publish a ``SamplesCommitted`` event once their transaction
+is committed (``SAMPLES_DELETED`` after a reset) and return; consumers (WebSocket fan-out, MPP cache, later
+aggregators or alerting) subscribe independently. Each background
+subscriber has its own queue and worker task, so a slow one neither delays
+the request nor the other subscribers. ``inline`` subscribers run inside
+``publish`` and are meant for cheap state that the next request must see.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from ..utils.columnar import SampleColumns
+from .ingest import row_to_dict
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per background subscriber before new ones are dropped
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "1000"))
+
+SAMPLES_COMMITTED = "samples.committed"
+# Event: the number of rows removed by a reset
+SAMPLES_DELETED = "samples.deleted"
+# Event: a new running MPP, the ``services.mpp`` MPP dict plus ``key`` (device, None for all)
+MPP_UPDATED = "mpp.updated"
+
+
+class SamplesCommitted:
+    """A committed batch, as ingested row dicts or as a ``SampleColumns`` batch."""
+
+    __slots__ = ("rows", "columns", "source")
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None,
+                 columns: Optional[SampleColumns] = None, source: Optional[str] = None):
+        self.rows = rows
+        self.columns = columns
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.columns) if self.columns is not None else len(self.rows or ())
+
+    def iter_dicts(self) -> Iterator[Dict[str, Any]]:
+        """Samples in the ``Sample.to_dict()`` shape."""
+        if self.columns is not None:
+            return self.columns.iter_dicts(self.source)
+        return (row_to_dict(r) for r in self.rows or ())
+
+
+Handler = Callable[[Any], Any]
+
+
+class _Subscriber:
+    __slots__ = ("handler", "queue", "task")
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class EventBus:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._inline: Dict[str, List[Handler]] = {}
+        self._background: Dict[str, List[_Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Events not delivered because a subscriber's queue was full
+        self.dropped = 0
+
+    def subscribe(self, topic: str, handler: Handler, inline: bool = False):
+        """Call ``handler(event)`` for every event on ``topic``.
+
+        Background handlers may be coroutine functions; they are awaited one
+        event at a time, in publish order.
+        """
+        if inline:
+            self._inline.setdefault(topic, []).append(handler)
+        else:
+            sub = _Subscriber(handler)
+            self._background.setdefault(topic, []).append(sub)
+            if self._loop is not None:
+                self._spawn(sub)
+
+    def publish(self, topic: str, event: Any):
+        """Deliver ``event`` without waiting for background subscribers."""
+        for handler in self._inline.get(topic, ()):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Inline subscriber %r failed on %s", handler, topic)
+        subs = self._background.get(topic)
+        if not subs:
+            return
+        self._start(asyncio.get_running_loop())
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logger.warning("Subscriber %r is %d events behind; dropping", sub.handler, sub.queue.qsize())
+
+    def _start(self, loop: asyncio.AbstractEventLoop):
+        # Workers are created on first use, on the loop that publishes
+        if self._loop is loop:
+            return
+        self._loop = loop
+        for subs in self._background.values():
+            for sub in subs:
+                self._spawn(sub)
+
+    def _spawn(self, sub: _Subscriber):
+        sub.queue = asyncio.Queue(maxsize=self.queue_size)
+        sub.task = self._loop.create_task(self._worker(sub))
+
+    async def _worker(self, sub: _Subscriber):
+        while True:
+            event = await sub.queue.get()
+            try:
+                result = sub.handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logger.exception("Subscriber %r failed", sub.handler)
+            finally:
+                sub.queue.task_done()
+
+    async def join(self, timeout: Optional[float] = None):
+        """Wait until background subscribers have handled every published event."""
+        if self._loop is None:
+            return
+        waits = [sub.queue.join() for subs in self._background.values() for sub in subs]
+        await asyncio.wait_for(asyncio.gather(*waits), timeout)
+
+    async def stop(self, timeout: Optional[float] = 5.0):
+        """Let subscribers finish (up to ``timeout``), then stop their workers."""
+        try:
+            await self.join(timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping event bus with undelivered events")
+        for subs in self._background.values():
+            for sub in subs:
+                if sub.task is not None:
+                    sub.task.cancel()
+                sub.queue = sub.task = None
+        self._loop = None
+
+
+bus = EventBus()
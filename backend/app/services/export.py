@@ -0,0 +1,47 @@
+"""Streaming export of samples as NDJSON or CSV."""
+import json
+from enum import Enum
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import Select
+
+# Rows fetched per round trip (server-side cursor on PostgreSQL) and per yielded chunk
+EXPORT_BATCH_ROWS = 5000
+
+CSV_HEADER = "id,t,V,I,P,T,source,device_id\n"
+
+
+def _fmt(x) -> str:
+    return "" if x is None else repr(x)
+
+
+def _lines(rows, fmt: str) -> str:
+    out = []
+    for id_, t, V, I, P, T, source, device in rows:
+        if P is None:
+            P = V * I
+        src = source.value if isinstance(source, Enum) else source
+        ts = t.isoformat() if t else None
+        if fmt == "csv":
+            out.append(f"{id_},{ts or ''},{_fmt(V)},{_fmt(I)},{_fmt(P)},{_fmt(T)},{src},{device}\n")
+        else:
+            out.append(json.dumps({"id": id_, "t": ts, "V": V, "I": I, "P": P, "T": T, "source": src,
+                                   "device_id": device}) + "\n")
+    return "".join(out)
+
+
+async def iter_export_lines(bind: AsyncEngine, stmt: Select, fmt: str = "ndjson") -> AsyncIterator[str]:
+    """Run ``stmt`` (id, timestamp, voltage, current, power, temperature, source, device_id)
+    on its own connection and yield the rows as text, EXPORT_BATCH_ROWS at a time.
+
+    ``stream`` with ``yield_per`` reads through a server-side cursor instead
+    of buffering the result, so memory stays constant for a full-database
+    export and the event loop is free between batches.
+    """
+    if fmt == "csv":
+        yield CSV_HEADER
+    async with bind.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        async for rows in result.partitions():
+            yield _lines(rows, fmt)
@@ -0,0 +1,232 @@
+"""Batch single-diode parameter extraction over the stored sweeps.
+
+Closed sweeps without a ``diode_fits`` row are read a page at a time, in
+device then time order, with the samples of each device in the page fetched
+by one range query. A page is split into
+contiguous blocks that a process pool fits in parallel. Inside a block the
+sweeps are laid out in lanes of consecutive sweeps: each batched
+``fit_diode`` call fits the next sweep of every lane, warm-started from
+the previous sweep of the same lane (each device's first sweep in a page
+from its last stored fit). Warm starts that fail to converge are
+refitted from a cold guess.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import delete, or_, select
+from sqlalchemy.orm import Session
+
+from ..models.diode_fit import DiodeFit
+from ..models.sample import Sample
+from ..models.sweep import Sweep
+from .diode import PARAMS, fit_diode, initial_guess
+
+# Boltzmann constant over the elementary charge, V/K
+K_OVER_Q = 8.617333262e-5
+PV_CELLS_IN_SERIES = int(os.getenv("PV_CELLS_IN_SERIES", "36"))
+# Longer sweeps are resampled evenly to this many points before fitting
+DIODE_FIT_MAX_POINTS = int(os.getenv("DIODE_FIT_MAX_POINTS", "200"))
+# Sweeps fitted per batched call inside a block
+DIODE_FIT_LANES = int(os.getenv("DIODE_FIT_LANES", "256"))
+DIODE_FIT_WORKERS = int(os.getenv("DIODE_FIT_WORKERS", str(os.cpu_count() or 1)))
+# Sweeps per pool task
+DIODE_FIT_BLOCK = 2048
+
+
+def fit_block(V, I, mask, prev: Optional[Dict[str, float]] = None,
+              lanes: int = DIODE_FIT_LANES) -> Dict[str, np.ndarray]:
+    """Fit consecutive sweeps (rows of ``V``/``I``/``mask``) with lane warm starts.
+
+    ``prev`` holds the parameters of the sweep just before the block, if any.
+    Runs in pool workers, so it only takes and returns arrays.
+    """
+    n = len(V)
+    lanes = max(1, min(lanes, n))
+    steps = -(-n // lanes)
+    i_max = np.where(mask, I, -np.inf).max(axis=1)
+    out = {k: np.full(n, np.nan) for k in PARAMS + ("rmse",)}
+    out["iterations"] = np.zeros(n, dtype=np.int64)
+    out["converged"] = np.zeros(n, dtype=bool)
+
+    for s in range(steps):
+        rows = np.arange(lanes) * steps + s
+        rows = rows[rows < n]
+        Vs, Is, ms = V[rows], I[rows], mask[rows]
+        if s > 0:
+            # Previous sweep of each lane
+            warm = out["converged"][rows - 1]
+            src = {k: out[k][rows - 1] for k in PARAMS}
+            src_i_max = i_max[rows - 1]
+        else:
+            warm = np.zeros(len(rows), dtype=bool)
+            warm[0] = prev is not None
+            src = {k: np.full(len(rows), prev[k] if prev else np.nan) for k in PARAMS}
+            src_i_max = np.full(len(rows), prev["i_max"] if prev else np.nan)
+        guess = src
+        # Photocurrent follows irradiance, which changes from sweep to sweep
+        with np.errstate(divide="ignore", invalid="ignore"):
+            guess["IL"] = src["IL"] * i_max[rows] / src_i_max
+        fresh = np.flatnonzero(~warm)
+        if len(fresh):
+            for k, v in initial_guess(Vs[fresh], Is[fresh], ms[fresh]).items():
+                guess[k][fresh] = v
+        fit = fit_diode(Vs, Is, ms, guess)
+
+        retry = np.flatnonzero(warm & ~fit["converged"])
+        if len(retry):
+            cold = fit_diode(Vs[retry], Is[retry], ms[retry])
+            better = cold["converged"] | (cold["rmse"] < fit["rmse"][retry])
+            spent = fit["iterations"][retry] + cold["iterations"]
+            for k, v in cold.items():
+                fit[k][retry[better]] = v[better]
+            fit["iterations"][retry] = spent
+        for k in out:
+            out[k][rows] = fit[k]
+    return out
+
+
+def _pending_sweeps(db: Session, limit: int):
+    return db.execute(
+        select(Sweep.id, Sweep.device_id, Sweep.start_time, Sweep.start_id, Sweep.end_time, Sweep.end_id)
+        .outerjoin(DiodeFit, DiodeFit.sweep_id == Sweep.id)
+        .where(Sweep.closed.is_(True), DiodeFit.sweep_id.is_(None))
+        .order_by(Sweep.device_id, Sweep.start_time, Sweep.start_id)
+        .limit(limit)
+    ).all()
+
+
+def _device_starts(sweeps) -> List[int]:
+    """Positions in ``sweeps`` (device-ordered) where a new device begins."""
+    return [k for k in range(len(sweeps)) if k == 0 or sweeps[k].device_id != sweeps[k - 1].device_id]
+
+
+def _load_curves(db: Session, sweeps, max_points: int = DIODE_FIT_MAX_POINTS):
+    """Padded ``(N, M)`` V/I/mask arrays and mean temperatures of ``sweeps``."""
+    bounds = _device_starts(sweeps) + [len(sweeps)]
+    parts = [_load_device_curves(db, sweeps[a:b], max_points) for a, b in zip(bounds[:-1], bounds[1:])]
+    if len(parts) == 1:
+        return parts[0]
+    width = max(p[0].shape[1] for p in parts)
+
+    def pad(x):
+        return np.pad(x, ((0, 0), (0, width - x.shape[1])))
+
+    return (np.concatenate([pad(p[0]) for p in parts]), np.concatenate([pad(p[1]) for p in parts]),
+            np.concatenate([pad(p[2]) for p in parts]), np.concatenate([p[3] for p in parts]))
+
+
+def _load_device_curves(db: Session, sweeps, max_points: int):
+    first = sweeps[0]
+    last = max(sweeps, key=lambda s: (s.end_time, s.end_id))
+    rows = db.execute(
+        select(Sample.id, Sample.voltage, Sample.current, Sample.temperature)
+        .where(Sample.device_id == first.device_id,
+               Sample.timestamp >= first.start_time, Sample.timestamp <= last.end_time,
+               or_(Sample.timestamp > first.start_time, Sample.id >= first.start_id),
+               or_(Sample.timestamp < last.end_time, Sample.id <= last.end_id))
+        .order_by(Sample.timestamp, Sample.id)
+    ).all()
+    ids, V, I, T = zip(*rows)
+    ids = np.asarray(ids, dtype=np.int64)
+    V, I = np.asarray(V, dtype=np.float64), np.asarray(I, dtype=np.float64)
+    T = np.array([np.nan if x is None else x for x in T], dtype=np.float64)
+
+    sorter = np.argsort(ids)
+    s = sorter[np.searchsorted(ids, [w.start_id for w in sweeps], sorter=sorter)]
+    e = sorter[np.searchsorted(ids, [w.end_id for w in sweeps], sorter=sorter)]
+    length = e - s + 1
+    used = np.minimum(length, max_points)
+    col = np.arange(used.max())[None, :]
+    step = np.where(length > max_points, (length - 1) / max(max_points - 1, 1), 1.0)
+    mask = col < used[:, None]
+    pos = np.where(mask, s[:, None] + np.rint(col * step[:, None]).astype(np.int64), 0)
+
+    seg = np.repeat(np.arange(len(sweeps)), length)
+    at = np.arange(len(seg)) + np.repeat(s - np.r_[0, np.cumsum(length)[:-1]], length)
+    known = ~np.isnan(T[at])
+    t_count = np.bincount(seg, weights=known, minlength=len(sweeps))
+    t_sum = np.bincount(seg, weights=np.where(known, T[at], 0.0), minlength=len(sweeps))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        temp = np.where(t_count > 0, t_sum / t_count, np.nan)
+    return np.where(mask, V[pos], 0.0), np.where(mask, I[pos], 0.0), mask, temp
+
+
+def _previous_fit(db: Session, sweep) -> Optional[Dict[str, float]]:
+    """Stored fit of the device's sweep just before ``sweep``, as a warm start."""
+    row = db.execute(
+        select(DiodeFit).where(DiodeFit.device_id == sweep.device_id, DiodeFit.start_time < sweep.start_time,
+                               DiodeFit.converged.is_(True))
+        .order_by(DiodeFit.start_time.desc()).limit(1)
+    ).scalar_one_or_none()
+    if row is None:
+        return None
+    return {"IL": row.photo_current, "I0": row.saturation_current, "Rs": row.series_resistance,
+            "Rsh": row.shunt_resistance, "a": row.modified_ideality, "i_max": row.photo_current}
+
+
+def _fit_rows(sweeps, mask, temp, fit) -> List[Dict[str, Any]]:
+    t_k = np.where(np.isnan(temp), 25.0, temp) + 273.15
+    n = fit["a"] / (PV_CELLS_IN_SERIES * K_OVER_Q * t_k)
+
+    def num(x):
+        return float(x) if np.isfinite(x) else None
+
+    return [
+        {
+            "sweep_id": w.id, "device_id": w.device_id, "start_time": w.start_time, "n_points": int(mask[k].sum()),
+            "photo_current": float(fit["IL"][k]), "saturation_current": float(fit["I0"][k]),
+            "series_resistance": float(fit["Rs"][k]), "shunt_resistance": float(fit["Rsh"][k]),
+            "modified_ideality": float(fit["a"][k]), "ideality": num(n[k]), "temperature": num(temp[k]),
+            "rmse": num(fit["rmse"][k]), "iterations": int(fit["iterations"][k]),
+            "converged": bool(fit["converged"][k]),
+        }
+        for k, w in enumerate(sweeps)
+    ]
+
+
+def extract_diode_params(db: Session, workers: int = DIODE_FIT_WORKERS, limit: Optional[int] = None,
+                         block: int = DIODE_FIT_BLOCK, lanes: int = DIODE_FIT_LANES) -> Dict[str, Any]:
+    """Fit every closed sweep that has no ``diode_fits`` row yet; commits per page.
+
+    Returns the sweeps fitted, how many converged, the elapsed seconds and
+    the throughput in sweeps/s.
+    """
+    start = time.perf_counter()
+    done = converged = 0
+    pool = ProcessPoolExecutor(workers) if workers > 1 else nullcontext()
+    with pool:
+        while limit is None or done < limit:
+            page = block * max(workers, 1)
+            if limit is not None:
+                page = min(page, limit - done)
+            sweeps = _pending_sweeps(db, page)
+            if not sweeps:
+                break
+            V, I, mask, temp = _load_curves(db, sweeps)
+            # At least one block per worker
+            size = min(block, -(-len(sweeps) // max(workers, 1)))
+            firsts = set(_device_starts(sweeps))
+            args = [(V[c:c + size], I[c:c + size], mask[c:c + size],
+                     _previous_fit(db, sweeps[c]) if c in firsts else None, lanes)
+                    for c in range(0, len(sweeps), size)]
+            if workers > 1:
+                parts = list(pool.map(fit_block, *zip(*args)))
+            else:
+                parts = [fit_block(*a) for a in args]
+            fit = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+            db.execute(DiodeFit.__table__.insert(), _fit_rows(sweeps, mask, temp, fit))
+            db.commit()
+            done += len(sweeps)
+            converged += int(fit["converged"].sum())
+
+    elapsed = time.perf_counter() - start
+    return {"sweeps": done, "converged": converged, "seconds": elapsed,
+            "sweeps_per_s": done / elapsed if elapsed > 0 else 0.0}
+
+
+def clear_diode_fits(db: Session) -> None:
+    db.execute(delete(DiodeFit))
@@ -0,0 +1,111 @@
+"""Group commit for streamed ingestion (/ws/ingest).
+
+Connections submit column batches and get a future back. Submissions are
+accumulated for up to GROUP_COMMIT_DELAY seconds or GROUP_COMMIT_ROWS rows,
+then written in a single transaction: batches of the same device and source
+are concatenated into one ``ingest_columns`` call, so rollups and sweeps are
+updated once per group rather than once per frame. The futures resolve
+after the commit (with the rows stored) or fail with its error, and the
+committed batches are published on the event bus like the HTTP paths do.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from ..database import AsyncSessionLocal
+from ..utils.columnar import SampleColumns, concat
+from .events import SAMPLES_COMMITTED, SamplesCommitted, bus
+from .ingest import ingest_columns
+
+logger = logging.getLogger(__name__)
+
+# Rows that trigger a commit right away
+GROUP_COMMIT_ROWS = int(os.getenv("GROUP_COMMIT_ROWS", "5000"))
+# Longest a submitted batch waits for others before being committed
+GROUP_COMMIT_DELAY = float(os.getenv("GROUP_COMMIT_DELAY", "0.05"))
+
+
+class _Pending:
+    __slots__ = ("cols", "source", "future")
+
+    def __init__(self, cols: SampleColumns, source: str, future: asyncio.Future):
+        self.cols = cols
+        self.source = source
+        self.future = future
+
+
+def _ingest_group(db, groups: List[Tuple[SampleColumns, str]]):
+    for cols, source in groups:
+        ingest_columns(db, cols, source)
+
+
+class GroupCommitter:
+    def __init__(self, session_factory=AsyncSessionLocal, max_rows: int = GROUP_COMMIT_ROWS,
+                 max_delay: float = GROUP_COMMIT_DELAY):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._pending: List[_Pending] = []
+        self._rows = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock: Optional[asyncio.Lock] = None
+        # Transactions committed, for tests and metrics
+        self.commits = 0
+
+    def submit(self, cols: SampleColumns, source: str) -> asyncio.Future:
+        """Queue a batch (with ``t`` and ``device_id`` set) for the next group commit."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Pending(cols, source, future))
+        self._rows += len(cols)
+        if self._rows >= self.max_rows:
+            self._schedule(loop, 0.0)
+        elif self._timer is None:
+            self._schedule(loop, self.max_delay)
+        return future
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Commit everything submitted so far (one transaction at a time)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending, self._rows = self._pending, [], 0
+            if not pending:
+                return
+            # One batch per (device, source), in order of first appearance
+            by_key: Dict[Tuple[Optional[str], str], List[SampleColumns]] = {}
+            for p in pending:
+                by_key.setdefault((p.cols.device_id, p.source), []).append(p.cols)
+            groups = []
+            for (device, source), parts in by_key.items():
+                cols = concat(parts)
+                cols.device_id = device
+                groups.append((cols, source))
+            try:
+                async with self.session_factory() as db:
+                    await db.run_sync(_ingest_group, groups)
+                    await db.commit()
+            except Exception as e:
+                logger.exception("Group commit of %d batches failed", len(pending))
+                for p in pending:
+                    if not p.future.done():
+                        p.future.set_exception(e)
+                return
+            self.commits += 1
+            for cols, source in groups:
+                bus.publish(SAMPLES_COMMITTED, SamplesCommitted(columns=cols, source=source))
+            for p in pending:
+                if not p.future.done():
+                    p.future.set_result(len(p.cols))
+
+
+committer = GroupCommitter()
@@ -0,0 +1,321 @@
+"""Batched sample ingestion.
+
+Duplicates on (device_id, timestamp, voltage, current) are resolved with a
+few set-based lookups per device served by ``idx_sample_device_time`` and new
+rows are written with one multi-row INSERT, instead of a SELECT + flush per
+sample. New rows are folded into each device's time-bucket rollups and sweep
+segmentation in the same transaction. On a partitioned PostgreSQL table the
+month partitions of the batch are created first.
+"""
+from datetime import datetime
+from itertools import islice, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models.sample import DEFAULT_DEVICE_ID, Sample, SampleSource
+from ..utils.columnar import SampleColumns
+from .partitions import ensure_partitions
+from .rollup import update_rollups
+from .sweeps import SWEEPS_ENABLED, update_sweeps
+
+# Max timestamps per IN (...) lookup, well below SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+# Use a single range scan while the batch's time span holds at most this many rows per key
+RANGE_SCAN_FACTOR = 4
+
+_samples = Sample.__table__
+
+Key = Tuple[str, datetime, float, float]
+
+_SQLITE_INSERT = (
+    f"INSERT INTO {_samples.name} (device_id, timestamp, voltage, current, power, temperature, source) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_UPDATE = (
+    update(_samples)
+    .where(_samples.c.id == bindparam("_id"))
+    .values(power=bindparam("_power"), temperature=bindparam("_temperature"))
+)
+
+
+def _naive(t: datetime) -> datetime:
+    # The column is timezone-naive; compare keys the way the database stores them
+    return t.replace(tzinfo=None) if t.tzinfo is not None else t
+
+
+def _source(source: Any) -> SampleSource:
+    return SampleSource(getattr(source, "value", source)) if source else SampleSource.MANUAL
+
+
+def make_row(
+    V: float,
+    I: float,
+    P: Optional[float] = None,
+    T: Optional[float] = None,
+    t: Optional[datetime] = None,
+    source: Any = None,
+    device_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build an insertable ``samples`` row from API-style fields (P defaults to V*I)."""
+    return {
+        "device_id": device_id or DEFAULT_DEVICE_ID,
+        "timestamp": t,
+        "voltage": V,
+        "current": I,
+        "power": P if P is not None else V * I,
+        "temperature": T,
+        "source": _source(source),
+    }
+
+
+def iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split ``items`` into lists of at most ``size`` elements, lazily."""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def row_to_dict(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Same shape as ``Sample.to_dict()`` for an ingested row."""
+    t = row["t"]
+    return {**row, "t": t.isoformat() if t else None}
+
+
+def _find_existing(db: Session, keys: Sequence[Key]) -> Dict[Key, Dict[str, Any]]:
+    """Fetch the stored rows matching any of ``keys``.
+
+    A sweep usually covers a short time span holding few other rows of its
+    device, so one indexed range scan per device is tried first; when the
+    span is crowded the lookup falls back to one IN (...) query per
+    LOOKUP_CHUNK timestamps.
+    """
+    wanted = set(keys)
+    cols = (_samples.c.id, _samples.c.device_id, _samples.c.timestamp, _samples.c.voltage,
+            _samples.c.current, _samples.c.power, _samples.c.temperature, _samples.c.source)
+    queries = []
+    for device in sorted({k[0] for k in wanted}):
+        stamps = sorted({k[1] for k in wanted if k[0] == device})
+        own = _samples.c.device_id == device
+        in_span = _samples.c.timestamp.between(stamps[0], stamps[-1])
+        crowded = db.execute(select(func.count()).where(own, in_span)).scalar_one() > RANGE_SCAN_FACTOR * len(stamps)
+        if crowded:
+            queries += [
+                select(*cols).where(own, _samples.c.timestamp.in_(stamps[i:i + LOOKUP_CHUNK]))
+                for i in range(0, len(stamps), LOOKUP_CHUNK)
+            ]
+        else:
+            queries.append(select(*cols).where(own, in_span))
+
+    found: Dict[Key, Dict[str, Any]] = {}
+    for q in queries:
+        for r in db.execute(q).mappings():
+            key = (r["device_id"], r["timestamp"], r["voltage"], r["current"])
+            if key in wanted and key not in found:
+                found[key] = dict(r)
+    return found
+
+
+def _out(r: Dict[str, Any], id_: int) -> Dict[str, Any]:
+    src = r["source"]
+    return {
+        "id": id_,
+        "device_id": r["device_id"],
+        "t": r["timestamp"],
+        "V": r["voltage"],
+        "I": r["current"],
+        "P": r["power"] if r["power"] is not None else r["voltage"] * r["current"],
+        "T": r["temperature"],
+        "source": src.value if isinstance(src, SampleSource) else src,
+    }
+
+
+def _insert_sqlite(conn: Connection, tuples: Iterable[tuple], n: int) -> Sequence[int]:
+    # Plain executemany without per-value bind processing. Values are rendered
+    # the way SQLAlchemy stores them (DateTime as "YYYY-MM-DD HH:MM:SS.ffffff",
+    # Enum by name). Within our write transaction rowids are allocated as
+    # max(rowid)+1, so the batch owns a contiguous range.
+    conn.exec_driver_sql(_SQLITE_INSERT, list(tuples))
+    last = conn.exec_driver_sql("SELECT last_insert_rowid()").scalar_one()
+    return range(last - n + 1, last + 1)
+
+
+def _nan_free(x: Any) -> Any:
+    return None if x != x else x
+
+
+def _insert_returning(conn: Connection, params: List[Dict[str, Any]]) -> List[int]:
+    """Multi-row INSERT ... RETURNING; the new ids in parameter order.
+
+    The database may return the rows of a multi-row INSERT in any order
+    (``sort_by_parameter_order`` needs SQLAlchemy 2.0.10), so ids are matched
+    back on the inserted key values. Identical rows get their ids in
+    ascending order.
+    """
+    returned = conn.execute(
+        insert(_samples).returning(_samples.c.id, _samples.c.device_id, _samples.c.timestamp,
+                                   _samples.c.voltage, _samples.c.current),
+        params,
+    ).all()
+    ids: Dict[Tuple, List[int]] = {}
+    for id_, device, t, V, I in returned:
+        ids.setdefault((device, t, _nan_free(V), _nan_free(I)), []).append(id_)
+    for same in ids.values():
+        same.sort(reverse=True)
+    return [ids[(p["device_id"], p["timestamp"], _nan_free(p["voltage"]), _nan_free(p["current"]))].pop()
+            for p in params]
+
+
+def _insert(db: Session, params: List[Dict[str, Any]]) -> Sequence[int]:
+    """Multi-row INSERT of ``params``; returns the new ids in parameter order."""
+    conn = db.connection()
+    if conn.dialect.name != "sqlite":
+        stamps = [p["timestamp"] for p in params]
+        ensure_partitions(conn, min(stamps), max(stamps))
+        # insertmanyvalues: a handful of multi-row INSERT ... RETURNING statements
+        return _insert_returning(conn, params)
+    return _insert_sqlite(
+        conn,
+        (
+            (p["device_id"], p["timestamp"].isoformat(" ", "microseconds"), p["voltage"], p["current"],
+             p["power"], p["temperature"], p["source"].name)
+            for p in params
+        ),
+        len(params),
+    )
+
+
+def ingest_columns(db: Session, cols: SampleColumns, source: Any = None) -> SampleColumns:
+    """Insert a column batch in bulk, without per-row dicts or deduplication.
+
+    Rows without timestamps are stamped with the batch time. Fills in
+    ``cols.t``, ``cols.id`` and ``cols.device_id``. Does not commit.
+    """
+    n = len(cols)
+    device = cols.device_id = cols.device_id or DEFAULT_DEVICE_ID
+    if cols.t is None:
+        cols.t = np.full(n, np.datetime64(datetime.utcnow(), "us"))
+    if not n:
+        cols.id = np.empty(0, dtype=np.int64)
+        return cols
+
+    src = _source(source)
+    T = [None if x != x else x for x in cols.T.tolist()]
+    conn = db.connection()
+    if conn.dialect.name == "sqlite":
+        stamps = [s.replace("T", " ", 1) for s in np.datetime_as_string(cols.t, unit="us").tolist()]
+        ids = _insert_sqlite(
+            conn,
+            zip(repeat(device), stamps, cols.V.tolist(), cols.I.tolist(), cols.P.tolist(), T, repeat(src.name)),
+            n,
+        )
+    else:
+        ensure_partitions(conn, cols.t.min().astype(datetime), cols.t.max().astype(datetime))
+        params = [
+            {"device_id": device, "timestamp": t, "voltage": V, "current": I, "power": P,
+             "temperature": temp, "source": src}
+            for t, V, I, P, temp in zip(cols.t.tolist(), cols.V.tolist(), cols.I.tolist(), cols.P.tolist(), T)
+        ]
+        ids = _insert_returning(conn, params)
+    cols.id = np.asarray(ids, dtype=np.int64)
+    update_rollups(conn, cols.id, cols.t, cols.V, cols.I, cols.P, cols.T, device)
+    if SWEEPS_ENABLED:
+        update_sweeps(db, device, since=cols.t.min().astype(datetime))
+    return cols
+
+
+def ingest_rows(db: Session, rows: Sequence[Dict[str, Any]], dedupe: bool = True) -> List[Dict[str, Any]]:
+    """Insert ``rows`` (see ``make_row``) in bulk and return them in input order.
+
+    With ``dedupe``, rows carrying a timestamp that matches an existing
+    (device_id, timestamp, voltage, current) are not inserted again: the stored row gets
+    its missing power filled in and its temperature replaced when provided,
+    exactly like the former per-item path. Rows without a timestamp are stamped
+    with the batch time. Does not commit.
+    Returned dicts use the API field names (id, device_id, t, V, I, P, T, source).
+    """
+    if not rows:
+        return []
+
+    now = datetime.utcnow()
+    params = [
+        {**r, "timestamp": now if r["timestamp"] is None else _naive(r["timestamp"])}
+        for r in rows
+    ]
+    # Position in ``params`` of the row each input resolves to, or the stored row it updates
+    target: List[Any] = list(range(len(params)))
+    pending = params
+    updated: Dict[int, Dict[str, Any]] = {}
+
+    if dedupe:
+        keyed = {
+            i: (p["device_id"], p["timestamp"], p["voltage"], p["current"])
+            for i, (p, r) in enumerate(zip(params, rows))
+            if r["timestamp"] is not None
+        }
+        existing = _find_existing(db, list(keyed.values())) if keyed else {}
+        # Rows inserted earlier in this batch are duplicate targets too
+        batch_first: Dict[Key, int] = {}
+        pending = []
+        for i, p in enumerate(params):
+            key = keyed.get(i)
+            hit = existing.get(key) if key is not None else None
+            if hit is not None:
+                if hit["power"] is None:
+                    hit["power"] = p["power"]
+                if p["temperature"] is not None:
+                    hit["temperature"] = p["temperature"]
+                updated[hit["id"]] = hit
+                target[i] = hit
+            elif key is not None and key in batch_first:
+                first = params[batch_first[key]]
+                if p["temperature"] is not None:
+                    first["temperature"] = p["temperature"]
+                target[i] = batch_first[key]
+            else:
+                if key is not None:
+                    batch_first[key] = i
+                pending.append(p)
+
+        if updated:
+            db.execute(
+                _UPDATE,
+                [{"_id": h["id"], "_power": h["power"], "_temperature": h["temperature"]} for h in updated.values()],
+            )
+
+    ids: Dict[int, int] = {}
+    if pending:
+        new_ids = _insert(db, pending)
+        ids = {id(p): new_id for p, new_id in zip(pending, new_ids)}
+        by_device: Dict[str, List[Dict[str, Any]]] = {}
+        for p in pending:
+            by_device.setdefault(p["device_id"], []).append(p)
+        for device, group in by_device.items():
+            # Only new rows count towards the rollups; updated duplicates are left as they were
+            update_rollups(
+                db.connection(), [ids[id(p)] for p in group],
+                np.array([p["timestamp"] for p in group], dtype="datetime64[us]"),
+                [p["voltage"] for p in group], [p["current"] for p in group],
+                [p["voltage"] * p["current"] if p["power"] is None else p["power"] for p in group],
+                [np.nan if p["temperature"] is None else p["temperature"] for p in group],
+                device,
+            )
+            if SWEEPS_ENABLED:
+                # Updated duplicates may sit inside the open sweep: read it again then
+                since = None if updated else min(p["timestamp"] for p in group)
+                update_sweeps(db, device, since=since)
+
+    out: List[Dict[str, Any]] = []
+    for tgt in target:
+        if isinstance(tgt, int):
+            p = params[tgt]
+            out.append(_out(p, ids[id(p)]))
+        else:
+            out.append(_out(tgt, tgt["id"]))
+    return out
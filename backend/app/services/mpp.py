@@ -1,5 +1,21 @@
+import os
+from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 
+import numpy as np
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from ..models.sample import Sample
+from ..models.sweep import Sweep
+from .events import MPP_UPDATED, bus
+from .mppfit import diode_fit_mpp, quadratic_mpp
+
+# Samples taken on each side of the MPP for a fit when no stored sweep holds it
+MPP_FIT_NEIGHBOURS = int(os.getenv("MPP_FIT_NEIGHBOURS", "50"))
+# A fit whose RMS power residual exceeds this fraction of the measured Pmp is not trusted
+MPP_FIT_MAX_RESIDUAL = float(os.getenv("MPP_FIT_MAX_RESIDUAL", "0.05"))
+
 
 def compute_mpp(samples: List[Dict[str, Any]]) -> Optional[Tuple[int, Dict[str, Any]]]:
     """Compute the Maximum Power Point from a list of samples.
@@ -31,3 +47,236 @@ def compute_mpp(samples: List[Dict[str, Any]]) -> Optional[Tuple[int, Dict[str,
     if max_sample is None:
         return None
     return max_index, max_sample
+
+
+def _window(dt_from: Optional[datetime] = None, dt_to: Optional[datetime] = None,
+            device_id: Optional[str] = None) -> List[Any]:
+    conds = []
+    if device_id is not None:
+        conds.append(Sample.device_id == device_id)
+    if dt_from is not None:
+        conds.append(Sample.timestamp >= dt_from)
+    if dt_to is not None:
+        conds.append(Sample.timestamp <= dt_to)
+    return conds
+
+
+def _position(db: Session, sample_id: int, t: datetime, window: List[Any]) -> int:
+    """Index of a sample in the time-ordered window (what compute_mpp reports)."""
+    before = select(func.count()).where(*window, Sample.timestamp < t).scalar_subquery()
+    ties = select(func.count()).where(*window, Sample.timestamp == t, Sample.id < sample_id).scalar_subquery()
+    return db.execute(select(before + ties)).scalar_one()
+
+
+def query_mpp(db: Session, dt_from: Optional[datetime] = None, dt_to: Optional[datetime] = None,
+              device_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Maximum Power Point of a time window, of one device or of all, computed by the database.
+
+    ``ORDER BY power DESC LIMIT 1`` is served by ``idx_sample_device_power`` (or
+    ``idx_sample_power`` across devices); ties go to the earliest sample, like
+    compute_mpp. Rows without a stored power are ignored (ingestion always
+    stores one). Returns {id, device_id, V, I, P, t, index} or None; ``index``
+    counts within the same selection.
+    """
+    window = _window(dt_from, dt_to, device_id)
+    row = db.execute(
+        select(Sample.id, Sample.device_id, Sample.timestamp, Sample.voltage, Sample.current, Sample.power)
+        .where(*window, Sample.power.isnot(None))
+        .order_by(Sample.power.desc(), Sample.timestamp.asc(), Sample.id.asc())
+        .limit(1)
+    ).first()
+    if row is None:
+        return None
+    return {
+        "id": row.id,
+        "device_id": row.device_id,
+        "V": row.voltage,
+        "I": row.current,
+        "P": row.power,
+        "t": row.timestamp,
+        "index": _position(db, row.id, row.timestamp, window),
+    }
+
+
+def _fit_points(db: Session, best: Dict[str, Any], window: List[Any]):
+    """(V, I, P) of the sweep holding ``best``, or of its time neighbours, within the window."""
+    t, sid = best["t"], best["id"]
+    window = window + [Sample.device_id == best["device_id"]]
+    cols = (Sample.voltage, Sample.current, func.coalesce(Sample.power, Sample.voltage * Sample.current))
+    sweep = db.execute(
+        select(Sweep.start_time, Sweep.start_id, Sweep.end_time, Sweep.end_id)
+        .where(Sweep.device_id == best["device_id"], Sweep.start_time <= t, Sweep.end_time >= t,
+               or_(Sweep.start_time < t, Sweep.start_id <= sid), or_(Sweep.end_time > t, Sweep.end_id >= sid))
+        .order_by(Sweep.start_time.desc())
+        .limit(1)
+    ).first()
+    if sweep is not None:
+        rows = db.execute(
+            select(*cols).where(
+                *window,
+                Sample.timestamp >= sweep.start_time, Sample.timestamp <= sweep.end_time,
+                or_(Sample.timestamp > sweep.start_time, Sample.id >= sweep.start_id),
+                or_(Sample.timestamp < sweep.end_time, Sample.id <= sweep.end_id),
+            )
+        ).all()
+    else:
+        at_or_before = or_(Sample.timestamp < t, and_(Sample.timestamp == t, Sample.id <= sid))
+        rows = db.execute(
+            select(*cols).where(*window, at_or_before)
+            .order_by(Sample.timestamp.desc(), Sample.id.desc()).limit(MPP_FIT_NEIGHBOURS + 1)
+        ).all()
+        rows += db.execute(
+            select(*cols).where(*window, ~at_or_before)
+            .order_by(Sample.timestamp, Sample.id).limit(MPP_FIT_NEIGHBOURS)
+        ).all()
+    return (np.asarray(c, dtype=np.float64) for c in zip(*rows))
+
+
+def fit_mpp(db: Session, best: Dict[str, Any], method: str, dt_from: Optional[datetime] = None,
+            dt_to: Optional[datetime] = None) -> Dict[str, Any]:
+    """Refine a measured MPP (from ``query_mpp``) with a curve fit (see ``services.mppfit``).
+
+    The fit uses the samples of the sweep (of the MPP's device) the MPP belongs to. ``index`` and
+    ``t`` still refer to the measured sample. The measured point is returned,
+    with ``method`` "measured" and no residual, when the fit did not apply,
+    peaks below the measured Pmp or leaves a residual above
+    MPP_FIT_MAX_RESIDUAL of it.
+    """
+    V, I, P = _fit_points(db, best, _window(dt_from, dt_to))
+    one, n = np.array([0]), np.array([len(V)])
+    if method == "quadratic":
+        fit = quadratic_mpp(one, n, V, I, P)
+        applied = bool(fit["fitted"][0])
+    else:
+        fit = diode_fit_mpp(one, n, V, I)
+        applied = len(V) >= 5 and bool(np.isfinite(fit["pmp"][0]))
+    pmp, residual = float(fit["pmp"][0]), float(fit["residual"][0])
+    if (not applied or pmp < best["P"]
+            or (residual == residual and residual > MPP_FIT_MAX_RESIDUAL * abs(best["P"]))):
+        return {**best, "method": "measured", "residual": None}
+    return {**best, "V": float(fit["vmp"][0]), "I": float(fit["imp"][0]), "P": pmp, "method": method,
+            "residual": None if residual != residual else residual}
+
+
+# Marks a reset among the batches observed during a load
+_RESET = object()
+
+
+class MPPCache:
+    """Running maxima of the whole table and of each device, so unbounded MPP queries are O(1).
+
+    Ingestion reports every committed batch through ``observe``; each maximum
+    (key None for all devices) is loaded from the database on first use and
+    after ``invalidate``. The index of an MPP only has to be recounted after a
+    batch lands before it in time. State is per process.
+
+    Every new maximum is published on MPP_UPDATED (the MPP dict plus ``key``),
+    which feeds the ``mpp`` WebSocket stream.
+
+    The first load of a key runs while batches keep being committed: they
+    are recorded meanwhile and folded into the loaded maximum.
+    """
+
+    def __init__(self):
+        self._best: Dict[Optional[str], Optional[Dict[str, Any]]] = {}
+        # Per key being loaded, one list per running load of the batches observed since it started
+        self._loading: Dict[Optional[str], List[List[Any]]] = {}
+
+    def invalidate(self):
+        self._best.clear()
+
+    def _load(self, db: Session, key: Optional[str]):
+        seen: List[Any] = []
+        loads = self._loading.setdefault(key, [])
+        loads.append(seen)
+        try:
+            best = query_mpp(db, device_id=key)
+        finally:
+            loads[:] = [other for other in loads if other is not seen]
+            if not loads:
+                del self._loading[key]
+        if key in self._best:
+            # A concurrent load finished first and has been kept up to date since
+            return
+        if _RESET in seen:
+            # The query may predate a reset: only the batches after it count
+            best = None
+            seen = seen[len(seen) - seen[::-1].index(_RESET):]
+        self._best[key] = best
+        for batch in seen:
+            self._fold([key], *batch)
+
+    def get(self, db: Session, device_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if device_id not in self._best:
+            self._load(db, device_id)
+        best = self._best[device_id]
+        if best is not None and best["index"] is None:
+            best["index"] = _position(db, best["id"], best["t"], _window(device_id=device_id))
+        return dict(best) if best is not None else None
+
+    def observe(self, ids, t, V, I, P, device_id: str) -> List[Optional[str]]:
+        """Fold a committed batch of one device (parallel sequences; t as datetime64 or datetime)
+        into its maximum and the overall one. Returns the keys whose maximum changed."""
+        if len(P) == 0:
+            return []
+        for key in (None, device_id):
+            for seen in self._loading.get(key, ()):
+                seen.append((ids, t, V, I, P, device_id))
+        return self._fold([k for k in (None, device_id) if k in self._best], ids, t, V, I, P, device_id)
+
+    def _fold(self, keys: List[Optional[str]], ids, t, V, I, P, device_id: str) -> List[Optional[str]]:
+        if not keys:
+            return []
+        P = np.asarray(P, dtype=np.float64)
+        t = np.asarray(t, dtype="datetime64[us]")
+        top = np.flatnonzero(P == np.nanmax(P))
+        # Earliest sample among equal powers wins, like compute_mpp
+        i = int(top[np.lexsort((np.asarray(ids)[top], t[top]))[0]])
+        changed = []
+        for key in keys:
+            best = self._best[key]
+            cand = {"id": int(ids[i]), "device_id": device_id, "V": float(V[i]), "I": float(I[i]),
+                    "P": float(P[i]), "t": t[i].astype(datetime), "index": None}
+            if best is None or cand["P"] > best["P"] or (
+                cand["P"] == best["P"] and (cand["t"], cand["id"]) < (best["t"], best["id"])
+            ):
+                self._best[key] = cand
+                changed.append(key)
+            elif best["index"] is not None and t.min() < np.datetime64(best["t"], "us"):
+                best["index"] = None
+        for key in changed:
+            bus.publish(MPP_UPDATED, dict(self._best[key], key=key))
+        return changed
+
+    def observe_rows(self, rows: List[Dict[str, Any]]):
+        """``observe`` for ingested row dicts (id, device_id, t, V, I, P), per device."""
+        by_device: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            by_device.setdefault(r["device_id"], []).append(r)
+        for device, group in by_device.items():
+            self.observe([r["id"] for r in group], [r["t"] for r in group], [r["V"] for r in group],
+                         [r["I"] for r in group], [r["P"] for r in group], device)
+
+    def observe_columns(self, cols):
+        """``observe`` for an ingested ``SampleColumns`` batch."""
+        if len(cols):
+            self.observe(cols.id, cols.t, cols.V, cols.I, cols.P, cols.device_id)
+
+    def on_deleted(self, deleted: int):
+        """Event bus subscriber for resets: every sample is gone, so nothing has a maximum."""
+        # Keys stay loaded, so maxima keep being tracked (and published) from the next batch
+        for key in self._best:
+            self._best[key] = None
+        for loads in self._loading.values():
+            for seen in loads:
+                seen.append(_RESET)
+
+    def on_committed(self, batch):
+        """Event bus subscriber for ``SamplesCommitted`` batches."""
+        if batch.columns is not None:
+            self.observe_columns(batch.columns)
+        else:
+            self.observe_rows(batch.rows)
+
+
+mpp_cache = MPPCache()
@@ -0,0 +1,100 @@
+"""MPP estimates between samples, by fitting the curve around the peak.
+
+``quadratic`` fits a parabola to P(V) over the few samples around the
+measured peak of each sweep; ``diode`` fits the single-diode model to the
+whole I-V curve (see ``services.diode``). Both take many segments of flat
+arrays at once, like ``services.sweeps``. Residuals are RMS power errors
+(W) over the fitted samples; a quadratic fit through exactly three samples
+is exact and has none (NaN).
+"""
+import os
+from typing import Dict
+
+import numpy as np
+
+from .diode import PARAMS, diode_current, diode_mpp, fit_diode
+
+METHODS = ("measured", "quadratic", "diode")
+# Samples on each side of the measured peak used by the quadratic fit. P(V) is
+# skewed past the knee, so on sparse sweeps wider windows overshoot; 1 is
+# plain three-point interpolation (no residual)
+MPP_FIT_HALF_WIDTH = int(os.getenv("MPP_FIT_HALF_WIDTH", "1"))
+
+
+def _segments(starts, ends):
+    lengths = ends - starts
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    first = np.r_[0, np.cumsum(lengths)[:-1]]
+    idx = np.arange(len(seg)) + np.repeat(starts - first, lengths)
+    return seg, idx, first, lengths
+
+
+def quadratic_mpp(starts, ends, V, I, P, half_width: int = MPP_FIT_HALF_WIDTH) -> Dict[str, np.ndarray]:
+    """Vertex of the least-squares parabola through the peak's neighbours in V.
+
+    Per segment ``[start, end)``; falls back to the measured peak when the
+    parabola does not open downwards or its vertex leaves the fitted range.
+    """
+    V, I, P = (np.asarray(a, dtype=np.float64) for a in (V, I, P))
+    seg, idx, first, lengths = _segments(np.asarray(starts), np.asarray(ends))
+    # Samples of every segment in voltage order, then the peak's rank in that order
+    order = idx[np.lexsort((V[idx], seg))]
+    peak = np.lexsort((-P[order], seg))[first]
+    Vp, Ip, Pp = V[order[peak]], I[order[peak]], P[order[peak]]
+
+    win = peak[:, None] + np.arange(-half_width, half_width + 1)[None, :]
+    mask = (win >= first[:, None]) & (win < (first + lengths)[:, None])
+    pick = order[np.clip(win, 0, len(order) - 1)]
+    u = np.where(mask, V[pick] - Vp[:, None], 0.0)
+    p = np.where(mask, P[pick], 0.0)
+
+    # P = c0 + c1 w + c2 w^2 with w = u / scale in [-1, 1], u centred on the measured peak
+    scale = np.maximum(np.abs(u).max(axis=1), 1e-12)
+    w = u / scale[:, None]
+    F = np.stack([np.ones_like(w), w, w * w], axis=-1) * mask[..., None]
+    A = np.einsum("bmi,bmj->bij", F, F)
+    y = np.einsum("bmi,bm->bi", F, p)
+    # Fewer than three distinct voltages leave A singular
+    ok = np.abs(np.linalg.det(A)) > 1e-9
+    c = np.zeros((len(A), 3))
+    if ok.any():
+        c[ok] = np.linalg.solve(A[ok], y[ok][..., None])[..., 0]
+    fitted = np.einsum("bmi,bi->bm", F, c)
+    # Three samples leave no degree of freedom: the residual would always be 0
+    resid = np.sqrt(np.where(mask, (p - fitted) ** 2, 0.0).sum(axis=1) / mask.sum(axis=1))
+    resid[mask.sum(axis=1) <= 3] = np.nan
+    c[:, 1] /= scale
+    c[:, 2] /= scale * scale
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        us = -c[:, 1] / (2.0 * c[:, 2])
+    lo = np.where(mask, u, np.inf).min(axis=1)
+    hi = np.where(mask, u, -np.inf).max(axis=1)
+    ok &= (c[:, 2] < 0) & (us >= lo) & (us <= hi)
+    us = np.where(ok, us, 0.0)
+    vmp = Vp + us
+    pmp = np.where(ok, c[:, 0] + c[:, 1] * us + c[:, 2] * us * us, Pp)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        imp = np.where(ok & (vmp != 0), pmp / vmp, Ip)
+    return {"vmp": vmp, "imp": imp, "pmp": pmp, "residual": np.where(ok, resid, np.nan), "fitted": ok}
+
+
+def diode_fit_mpp(starts, ends, V, I) -> Dict[str, np.ndarray]:
+    """Peak of the single-diode model fitted to each segment's I-V samples."""
+    V, I = np.asarray(V, dtype=np.float64), np.asarray(I, dtype=np.float64)
+    seg, idx, first, lengths = _segments(np.asarray(starts), np.asarray(ends))
+    width = int(lengths.max())
+    col = np.arange(len(seg)) - np.repeat(first, lengths)
+    Vb = np.zeros((len(lengths), width))
+    Ib = np.zeros((len(lengths), width))
+    mask = np.zeros((len(lengths), width), dtype=bool)
+    Vb[seg, col], Ib[seg, col], mask[seg, col] = V[idx], I[idx], True
+
+    params = fit_diode(Vb, Ib, mask)
+    out = diode_mpp(params, np.where(mask, Vb, 0.0).max(axis=1) * 1.05)
+    with np.errstate(all="ignore"):
+        dP = Vb * (diode_current(Vb, *(params[k] for k in PARAMS)) - Ib)
+    out["residual"] = np.sqrt(np.where(mask, dP * dP, 0.0).sum(axis=1) / lengths)
+    out["fitted"] = params["converged"] & np.isfinite(out["pmp"])
+    out["params"] = params
+    return out
@@ -0,0 +1,131 @@
+"""PostgreSQL partitioning of ``samples`` by time range (and optionally device).
+
+A new database gets ``samples`` as a table ``PARTITION BY RANGE (timestamp)``
+with one partition per month, each optionally split into
+SAMPLES_DEVICE_PARTITIONS hash partitions on ``device_id``. Queries bounded
+in time and/or scoped to a device are pruned to the partitions they need.
+Monthly partitions are created on demand by ingestion (``ensure_partitions``);
+the ones already seen are cached per process, those created by a
+transaction once it commits. SQLite tables and existing
+PostgreSQL tables are left as they are.
+"""
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from ..models.sample import Sample
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PARTITIONING = os.getenv("SAMPLES_PARTITIONING", "true").lower() == "true"
+# Hash sub-partitions on device_id per month; 0 partitions by time only
+SAMPLES_DEVICE_PARTITIONS = int(os.getenv("SAMPLES_DEVICE_PARTITIONS", "0"))
+
+_samples = Sample.__table__
+
+# Whether this database's samples table is partitioned, once checked
+_partitioned: Optional[bool] = None
+# Month partitions known to exist
+_known: Set[str] = set()
+# Connection.info key of the partitions created by the connection's open transaction
+_CREATED = "created_partitions"
+
+
+@event.listens_for(Engine, "commit")
+def _remember_on_commit(conn):
+    _known.update(conn.info.pop(_CREATED, ()))
+
+
+@event.listens_for(Engine, "rollback")
+def _forget_on_rollback(conn):
+    # Partitions created by a rolled-back transaction are gone again; other transactions' stay known
+    conn.info.pop(_CREATED, None)
+
+
+def partitioned_table_ddl(dialect) -> str:
+    """``CREATE TABLE samples`` as compiled from the model, range-partitioned on timestamp.
+
+    PostgreSQL requires the partition key in the primary key, so it becomes
+    ``(id, timestamp)``; ``id`` stays a serial shared by every partition.
+    """
+    ddl = str(CreateTable(_samples).compile(dialect=dialect)).strip()
+    ddl, n = re.subn(r"PRIMARY KEY \(id\)", "PRIMARY KEY (id, timestamp)", ddl)
+    if n != 1:
+        raise RuntimeError("Unexpected CREATE TABLE samples statement; cannot partition it")
+    return f"{ddl} PARTITION BY RANGE (timestamp)"
+
+
+def create_partitioned_samples(conn: Connection) -> bool:
+    """Create ``samples`` as a partitioned table if it does not exist yet (PostgreSQL only).
+
+    Returns whether it was created; indexes are added by ``create_all`` and
+    propagate to every partition.
+    """
+    global _partitioned
+    if conn.dialect.name != "postgresql" or not SAMPLES_PARTITIONING:
+        return False
+    if inspect(conn).has_table(_samples.name):
+        return False
+    _samples.c.source.type.create(conn, checkfirst=True)
+    conn.execute(text(partitioned_table_ddl(conn.dialect)))
+    _partitioned = True
+    logger.info("Created %s partitioned by month%s", _samples.name,
+                f" and {SAMPLES_DEVICE_PARTITIONS} device hashes" if SAMPLES_DEVICE_PARTITIONS else "")
+    return True
+
+
+def is_partitioned(conn: Connection) -> bool:
+    global _partitioned
+    if conn.dialect.name != "postgresql":
+        return False
+    if _partitioned is None:
+        _partitioned = conn.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+            {"t": _samples.name},
+        ).scalar_one()
+    return _partitioned
+
+
+def month_ranges(t_min: datetime, t_max: datetime) -> List[Tuple[datetime, datetime]]:
+    """``[start, end)`` bounds of every calendar month from ``t_min`` to ``t_max``."""
+    start = datetime(t_min.year, t_min.month, 1)
+    out = []
+    while start <= t_max:
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        out.append((start, end))
+        start = end
+    return out
+
+
+def _partition_ddl(start: datetime, end: datetime) -> Iterable[str]:
+    name = f"{_samples.name}_y{start:%Y}m{start:%m}"
+    sub = " PARTITION BY HASH (device_id)" if SAMPLES_DEVICE_PARTITIONS > 0 else ""
+    yield (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {_samples.name} "
+           f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}'){sub}")
+    for r in range(max(SAMPLES_DEVICE_PARTITIONS, 0)):
+        yield (f"CREATE TABLE IF NOT EXISTS {name}_d{r} PARTITION OF {name} "
+               f"FOR VALUES WITH (MODULUS {SAMPLES_DEVICE_PARTITIONS}, REMAINDER {r})")
+
+
+def ensure_partitions(conn: Connection, t_min: datetime, t_max: datetime) -> None:
+    """Create the month partitions covering ``[t_min, t_max]`` that are missing.
+
+    A no-op unless ``samples`` is partitioned; runs in the caller's
+    transaction, before the rows are inserted.
+    """
+    if not is_partitioned(conn):
+        return
+    created = conn.info.setdefault(_CREATED, set())
+    for start, end in month_ranges(t_min, t_max):
+        key = f"{start:%Y%m}"
+        if key in _known or key in created:
+            continue
+        for ddl in _partition_ddl(start, end):
+            conn.execute(text(ddl))
+        created.add(key)
@@ -0,0 +1,206 @@
+"""Cache of rendered read responses, invalidated by the time window writes touch.
+
+``GET /api/samples`` and ``GET /api/mpp`` store their encoded body under
+their normalized query (see ``ResponseCache.get``/``store``) together with
+the window it depends on: a device (None for all) and a time range (None
+for unbounded). A committed batch only evicts the entries whose window
+overlaps its devices and time span, so a closed historical window stays
+cached while live data keeps arriving; a reset empties the cache.
+
+Every write bumps ``version``. A response computed while a write was
+committed is only stored if none of the writes since its query overlaps its
+window. Entries are kept in LRU order within RESPONSE_CACHE_BYTES and carry
+a content ETag; a matching ``If-None-Match`` is answered with 304. State is
+per process, like ``services.mpp.mpp_cache``: writes made by another worker
+or process are not seen.
+"""
+import hashlib
+import os
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Tuple
+
+import numpy as np
+from starlette.requests import Request
+from starlette.responses import Response
+
+from ..utils import metrics
+
+# Bytes of response bodies kept; 0 disables the cache
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(32 << 20)))
+# Bookkeeping per entry, counted towards the bound
+ENTRY_OVERHEAD = 512
+# Committed batches remembered to validate responses computed concurrently
+WRITE_LOG = 256
+
+REQUESTS = metrics.Counter("pv_response_cache_requests_total",
+                           "Cached read endpoint requests by outcome (hit, miss, not_modified).",
+                           ("endpoint", "result"))
+
+# A device (None: all) and a closed time range of naive datetime64[us] (None: unbounded)
+Window = Tuple[Optional[str], Optional[np.datetime64], Optional[np.datetime64]]
+
+
+def _bounds(dt: Optional[datetime]) -> Tuple[Optional[np.datetime64], Optional[np.datetime64]]:
+    """Naive bounds of a query datetime.
+
+    Timestamps are stored naive. An aware query bound may be compared by its
+    wall clock (SQLite) or converted to UTC (PostgreSQL), so both are covered.
+    """
+    if dt is None:
+        return None, None
+    wall = np.datetime64(dt.replace(tzinfo=None), "us")
+    if dt.tzinfo is None:
+        return wall, wall
+    utc = np.datetime64(dt.astimezone(timezone.utc).replace(tzinfo=None), "us")
+    return min(wall, utc), max(wall, utc)
+
+
+def window(device_id: Optional[str] = None, dt_from: Optional[datetime] = None,
+           dt_to: Optional[datetime] = None) -> Window:
+    """The window of a query on ``[dt_from, dt_to]`` (inclusive), widest reading of aware bounds."""
+    return device_id, _bounds(dt_from)[0], _bounds(dt_to)[1]
+
+
+def narrow(win: Window, lo: Optional[datetime] = None, hi: Optional[datetime] = None) -> Window:
+    """``win`` cut to ``[lo, hi]`` (stored, naive timestamps: a cursor or the last row of a full page)."""
+    device, wlo, whi = win
+    if lo is not None:
+        lo = np.datetime64(lo.replace(tzinfo=None), "us")
+        wlo = lo if wlo is None else max(wlo, lo)
+    if hi is not None:
+        hi = np.datetime64(hi.replace(tzinfo=None), "us")
+        whi = hi if whi is None else min(whi, hi)
+    return device, wlo, whi
+
+
+def _overlaps(w: Window, device: Optional[str], lo: np.datetime64, hi: np.datetime64) -> bool:
+    wdevice, wlo, whi = w
+    if device is not None and wdevice is not None and device != wdevice:
+        return False
+    return (wlo is None or hi >= wlo) and (whi is None or lo <= whi)
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
+
+
+class CachedResponse:
+    """An encoded response body, its ETag and the window it was computed from."""
+
+    __slots__ = ("body", "media_type", "headers", "etag", "window")
+
+    def __init__(self, body: bytes, media_type: str, headers: Mapping[str, str], window: Window):
+        self.body = body
+        self.media_type = media_type
+        self.headers = dict(headers or {})
+        self.etag = _etag(body)
+        self.window = window
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + ENTRY_OVERHEAD
+
+    def respond(self, request: Request) -> Response:
+        """The response, or 304 when the request already holds this body."""
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": "no-cache"}
+        if _matches(request, self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Bumped by every committed batch and reset
+        self.version = 0
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        # (version, [(device, lo, hi)]) of the latest writes; device and range None for a reset
+        self._writes: deque = deque(maxlen=WRITE_LOG)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key: Hashable, since: int, win: Window, body: bytes, media_type: str = "application/json",
+              headers: Optional[Mapping[str, str]] = None) -> CachedResponse:
+        """Wrap a fresh body; keep it if no write after ``since`` (the ``version`` read
+        before querying) touched its window and it fits the budget."""
+        entry = CachedResponse(body, media_type, headers, win)
+        if self.max_bytes <= 0 or entry.size > self.max_bytes // 4 or not self._unchanged_since(since, win):
+            return entry
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+        return entry
+
+    def _unchanged_since(self, since: int, win: Window) -> bool:
+        if since == self.version:
+            return True
+        if not self._writes or self._writes[0][0] > since + 1:
+            # Some of the writes since then are no longer logged
+            return False
+        for version, spans in self._writes:
+            if version > since and any(lo is None or _overlaps(win, device, lo, hi) for device, lo, hi in spans):
+                return False
+        return True
+
+    def invalidate(self, spans: List[Tuple[Optional[str], np.datetime64, np.datetime64]]):
+        """Record a committed write and drop the entries whose window it overlaps."""
+        self.version += 1
+        self._writes.append((self.version, spans))
+        stale = [key for key, e in self._entries.items()
+                 if any(_overlaps(e.window, device, lo, hi) for device, lo, hi in spans)]
+        for key in stale:
+            self.size -= self._entries.pop(key).size
+
+    def clear(self):
+        self.version += 1
+        self._writes.append((self.version, [(None, None, None)]))
+        self._entries.clear()
+        self.size = 0
+
+    def on_committed(self, batch):
+        """Event bus subscriber for ``SamplesCommitted`` batches (timestamps are set by ingestion)."""
+        if not len(batch):
+            return
+        if batch.columns is not None:
+            t = np.asarray(batch.columns.t, dtype="datetime64[us]")
+            spans = [(batch.columns.device_id, t.min(), t.max())]
+        else:
+            by_device: Dict[str, List[Any]] = {}
+            for r in batch.rows:
+                by_device.setdefault(r["device_id"], []).append(r["t"])
+            spans = []
+            for device, stamps in by_device.items():
+                t = np.array(stamps, dtype="datetime64[us]")
+                spans.append((device, t.min(), t.max()))
+        self.invalidate(spans)
+
+    def on_deleted(self, deleted: int):
+        """Event bus subscriber for resets."""
+        self.clear()
+
+
+response_cache = ResponseCache()
+metrics.Gauge("pv_response_cache_bytes", "Bytes held by the read response cache.", lambda: response_cache.size)
+metrics.Gauge("pv_response_cache_entries", "Responses held by the read response cache.", lambda: len(response_cache))
@@ -0,0 +1,213 @@
+"""Time-bucketed rollups of the samples table.
+
+Every ingested batch is folded into ``sample_rollups`` in the same
+transaction: NumPy groups the batch per bucket (one sort, then ``reduceat``)
+and one upsert per bucket width merges the partial aggregates into the
+stored rows. Buckets are kept per device; ``query_rollups`` without a device
+merges them in SQL. ``rebuild`` recomputes everything from ``samples``.
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, case, delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from ..models.rollup import SampleRollup
+from ..models.sample import DEFAULT_DEVICE_ID, Sample
+
+# Bucket widths in seconds, by API name
+BUCKETS = {"1m": 60, "15m": 900, "1h": 3600, "1d": 86400}
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+# Samples read per chunk by ``rebuild``
+REBUILD_CHUNK_ROWS = 200_000
+
+_rollups = SampleRollup.__table__
+
+
+def bucket_aggregates(ids, t, V, I, P, T, seconds: int,
+                      device_id: str = DEFAULT_DEVICE_ID) -> List[Dict[str, Any]]:
+    """Partial aggregates of one device's batch for buckets of ``seconds``, as upsert rows.
+
+    ``t`` is ``datetime64[us]``; ``T`` is NaN where unknown. Among equal
+    powers the earliest sample is the bucket's peak.
+    """
+    t_us = np.asarray(t, dtype="datetime64[us]").astype(np.int64)
+    V, I, P, T = (np.asarray(a, dtype=np.float64) for a in (V, I, P, T))
+    ids = np.asarray(ids, dtype=np.int64)
+    width = seconds * 1_000_000
+    key = t_us // width
+
+    # Bucket first, then peak power first, then earliest
+    order = np.lexsort((t_us, -P, key))
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    counts = np.diff(np.r_[starts, len(key)])
+
+    def agg(x):
+        x = x[order]
+        return (np.minimum.reduceat(x, starts).tolist(), np.maximum.reduceat(x, starts).tolist(),
+                np.add.reduceat(x, starts).tolist())
+
+    v_min, v_max, v_sum = agg(V)
+    i_min, i_max, i_sum = agg(I)
+    p_min, p_max, p_sum = agg(P)
+    T = T[order]
+    known = ~np.isnan(T)
+    temp_count = np.add.reduceat(known.astype(np.int64), starts)
+    temp_sum = np.add.reduceat(np.where(known, T, 0.0), starts).tolist()
+    temp_min = np.where(temp_count > 0, np.fmin.reduceat(T, starts), np.nan).tolist()
+    temp_max = np.where(temp_count > 0, np.fmax.reduceat(T, starts), np.nan).tolist()
+    peak = order[starts]
+    bucket_start = (key[starts] * width).astype("datetime64[us]").astype(datetime).tolist()
+    peak_time = t_us[peak].astype("datetime64[us]").astype(datetime).tolist()
+
+    name = next(k for k, v in BUCKETS.items() if v == seconds)
+    return [
+        {
+            "device_id": device_id, "bucket": name, "bucket_start": bucket_start[g], "count": int(counts[g]),
+            "v_min": v_min[g], "v_max": v_max[g], "v_sum": v_sum[g],
+            "i_min": i_min[g], "i_max": i_max[g], "i_sum": i_sum[g],
+            "p_min": p_min[g], "p_max": p_max[g], "p_sum": p_sum[g],
+            "temp_min": None if temp_min[g] != temp_min[g] else temp_min[g],
+            "temp_max": None if temp_max[g] != temp_max[g] else temp_max[g],
+            "temp_sum": temp_sum[g], "temp_count": int(temp_count[g]),
+            "peak_id": int(ids[peak[g]]), "peak_time": peak_time[g],
+            "peak_v": float(V[peak[g]]), "peak_i": float(I[peak[g]]), "peak_p": float(P[peak[g]]),
+        }
+        for g in range(len(starts))
+    ]
+
+
+def _upsert(dialect: str):
+    """INSERT ... ON CONFLICT (device_id, bucket, bucket_start) DO UPDATE merging partial aggregates."""
+    if dialect == "postgresql":
+        stmt = pg_insert(_rollups)
+        least, greatest = func.least, func.greatest
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(_rollups)
+
+        # Two-argument min()/max() are scalar in SQLite but return NULL on a NULL argument
+        def least(a, b):
+            return func.min(func.coalesce(a, b), func.coalesce(b, a))
+
+        def greatest(a, b):
+            return func.max(func.coalesce(a, b), func.coalesce(b, a))
+    else:
+        raise RuntimeError(f"Rollups are not supported on '{dialect}' databases")
+
+    old, new = _rollups.c, stmt.excluded
+    better = new.peak_p > old.peak_p
+    values = {
+        "count": old["count"] + new["count"],
+        "temp_sum": old.temp_sum + new.temp_sum,
+        "temp_count": old.temp_count + new.temp_count,
+    }
+    for x in ("v", "i", "p", "temp"):
+        values[f"{x}_min"] = least(old[f"{x}_min"], new[f"{x}_min"])
+        values[f"{x}_max"] = greatest(old[f"{x}_max"], new[f"{x}_max"])
+        if x != "temp":
+            values[f"{x}_sum"] = old[f"{x}_sum"] + new[f"{x}_sum"]
+    for col in ("peak_id", "peak_time", "peak_v", "peak_i", "peak_p"):
+        values[col] = case((better, new[col]), else_=old[col])
+    return stmt.on_conflict_do_update(index_elements=["device_id", "bucket", "bucket_start"], set_=values)
+
+
+def update_rollups(conn: Connection, ids, t, V, I, P, T, device_id: str = DEFAULT_DEVICE_ID) -> None:
+    """Fold newly inserted samples of one device (parallel arrays) into every rollup width."""
+    if not ROLLUPS_ENABLED or len(ids) == 0:
+        return
+    stmt = _upsert(conn.dialect.name)
+    for seconds in BUCKETS.values():
+        conn.execute(stmt, bucket_aggregates(ids, t, V, I, P, T, seconds, device_id))
+
+
+def rebuild(bind: Engine, chunk_rows: int = REBUILD_CHUNK_ROWS) -> int:
+    """Recompute all rollups from ``samples`` in one transaction; returns the samples read.
+
+    Samples are read in (device_id, timestamp, id) keyset pages so the
+    reads and the upserts share one connection.
+    """
+    cols = (Sample.id, Sample.timestamp, Sample.voltage, Sample.current,
+            func.coalesce(Sample.power, Sample.voltage * Sample.current), Sample.temperature, Sample.device_id)
+    seen = 0
+    last = None
+    with bind.begin() as conn:
+        conn.execute(delete(_rollups))
+        stmt = _upsert(conn.dialect.name)
+        while True:
+            q = select(*cols).order_by(Sample.device_id, Sample.timestamp, Sample.id).limit(chunk_rows)
+            if last is not None:
+                q = q.where(Sample.device_id >= last.device_id, or_(
+                    Sample.device_id > last.device_id,
+                    and_(Sample.timestamp >= last.timestamp,
+                         or_(Sample.timestamp > last.timestamp, Sample.id > last.id)),
+                ))
+            rows = conn.execute(q).all()
+            if not rows:
+                return seen
+            ids, t, V, I, P, T, dev = zip(*rows)
+            T = np.array([np.nan if x is None else x for x in T])
+            t = np.array(t, dtype="datetime64[us]")
+            ids, V, I, P, dev = (np.asarray(a) for a in (ids, V, I, P, dev))
+            # Rows are in device order: one contiguous slice per device
+            cuts = np.flatnonzero(dev[1:] != dev[:-1]) + 1
+            for s, e in zip(np.r_[0, cuts], np.r_[cuts, len(dev)]):
+                for seconds in BUCKETS.values():
+                    conn.execute(stmt, bucket_aggregates(ids[s:e], t[s:e], V[s:e], I[s:e], P[s:e], T[s:e],
+                                                         seconds, str(dev[s])))
+            seen += len(rows)
+            last = rows[-1]
+
+
+def clear_rollups(db: Session) -> None:
+    db.execute(delete(_rollups))
+
+
+def _all_devices(bucket: str, window: List[Any]):
+    """Rollup rows of every device merged per bucket, with window functions.
+
+    The statistics are aggregated over each ``bucket_start`` and the row with
+    the highest peak (earliest on ties) supplies the peak columns.
+    """
+    r = SampleRollup
+    over = {"partition_by": r.bucket_start}
+    stats = [func.sum(r.count).over(**over).label("count")]
+    for x in ("v", "i", "p", "temp"):
+        stats.append(func.min(r.__table__.c[f"{x}_min"]).over(**over).label(f"{x}_min"))
+        stats.append(func.max(r.__table__.c[f"{x}_max"]).over(**over).label(f"{x}_max"))
+        stats.append(func.sum(r.__table__.c[f"{x}_sum"]).over(**over).label(f"{x}_sum"))
+    stats.append(func.sum(r.temp_count).over(**over).label("temp_count"))
+    rank = func.row_number().over(partition_by=r.bucket_start, order_by=(r.peak_p.desc(), r.peak_time, r.peak_id))
+    merged = select(
+        r.bucket, r.bucket_start, *stats, r.peak_id, r.peak_time, r.peak_v, r.peak_i, r.peak_p, rank.label("rank"),
+    ).where(r.bucket == bucket, *window).subquery()
+    return select(*(c for c in merged.c if c.name != "rank")).where(merged.c.rank == 1), merged
+
+
+def query_rollups(db: Session, bucket: str, dt_from: Optional[datetime] = None,
+                  dt_to: Optional[datetime] = None, limit: Optional[int] = None,
+                  device_id: Optional[str] = None) -> List[SampleRollup]:
+    """Buckets of one device, or of all devices merged (``device_id`` None, not persisted)."""
+    window = []
+    if dt_from is not None:
+        window.append(SampleRollup.bucket_start >= dt_from)
+    if dt_to is not None:
+        window.append(SampleRollup.bucket_start <= dt_to)
+    if device_id is not None:
+        q = select(SampleRollup).where(SampleRollup.device_id == device_id, SampleRollup.bucket == bucket, *window)
+        q = q.order_by(SampleRollup.bucket_start)
+        if limit:
+            q = q.limit(limit)
+        return list(db.scalars(q))
+
+    q, merged = _all_devices(bucket, window)
+    q = q.order_by(merged.c.bucket_start)
+    if limit:
+        q = q.limit(limit)
+    return [SampleRollup(device_id=None, **row._mapping) for row in db.execute(q)]
@@ -0,0 +1,56 @@
+"""Create the tables at startup and bring older databases up to date.
+
+``create_all`` only adds missing tables, so columns and indexes added to
+existing tables since are applied here. Databases from before ``device_id``
+get the column with every existing row in DEFAULT_DEVICE_ID; rollups are
+keyed by device, so that table is recreated and rebuilt from ``samples``.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from ..database import Base
+from ..models.diode_fit import DiodeFit
+from ..models.rollup import SampleRollup
+from ..models.sample import DEFAULT_DEVICE_ID, Sample
+from ..models.sweep import Sweep
+from .partitions import create_partitioned_samples
+from .rollup import rebuild
+
+logger = logging.getLogger(__name__)
+
+# Indexes replaced by device-led ones
+_DROPPED_INDEXES = ("idx_sample_composite",)
+
+
+def _add_device_column(conn, table) -> None:
+    conn.execute(text(
+        f"ALTER TABLE {table.name} ADD COLUMN device_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_DEVICE_ID}'"
+    ))
+
+
+def create_schema(bind: Engine) -> None:
+    rebuild_rollups = False
+    with bind.begin() as conn:
+        create_partitioned_samples(conn)
+        insp = inspect(conn)
+        for table in (Sample.__table__, Sweep.__table__, DiodeFit.__table__):
+            if insp.has_table(table.name) and "device_id" not in {c["name"] for c in insp.get_columns(table.name)}:
+                logger.warning("Adding %s.device_id; existing rows belong to '%s'", table.name, DEFAULT_DEVICE_ID)
+                _add_device_column(conn, table)
+        rollups = SampleRollup.__table__
+        if insp.has_table(rollups.name) and "device_id" not in {c["name"] for c in insp.get_columns(rollups.name)}:
+            logger.warning("Recreating %s per device; rebuilding it from samples", rollups.name)
+            rollups.drop(conn)
+            rebuild_rollups = True
+        for name in _DROPPED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    Base.metadata.create_all(bind=bind)
+    # create_all skips indexes of tables that already exist; add the ones added since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    if rebuild_rollups:
+        rebuild(bind)
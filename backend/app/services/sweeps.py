@@ -0,0 +1,260 @@
+"""I-V sweep segmentation and per-sweep characteristic points.
+
+The time-ordered sample stream of each device is cut into sweeps at voltage
+direction reversals and at time gaps. For every sweep Pmp/Vmp/Imp, Voc, Isc and the
+fill factor are computed for all sweeps at once with NumPy (group-wise
+sorts instead of a Python loop per sweep). Ingestion calls
+``update_sweeps`` in its transaction. The samples of the still-open last
+sweep are kept per process, so a batch written after it only reads its own
+samples; otherwise (another process, a rollback, a backfill) the stream is
+read again from the start of the open sweep.
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from ..models.diode_fit import DiodeFit
+from ..models.sample import DEFAULT_DEVICE_ID, Sample
+from ..models.sweep import Sweep
+from .mppfit import quadratic_mpp
+
+SWEEPS_ENABLED = os.getenv("SWEEPS_ENABLED", "true").lower() == "true"
+# A time gap longer than this (seconds) ends a sweep
+SWEEP_MAX_GAP = float(os.getenv("SWEEP_MAX_GAP", "60"))
+# Voltage steps smaller than this (V) do not count as a direction change
+SWEEP_V_TOLERANCE = float(os.getenv("SWEEP_V_TOLERANCE", "0.01"))
+# Shorter runs are retraces or noise, not sweeps
+SWEEP_MIN_POINTS = int(os.getenv("SWEEP_MIN_POINTS", "5"))
+# A run this long is closed even without a reversal, which bounds the re-read tail
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "100000"))
+
+# Per device: the stored open sweep (see ``_open_key``) and its samples (ids, t, V, I, P)
+_open_runs: Dict[str, Tuple[tuple, tuple]] = {}
+
+
+def segment_sweeps(t, V, max_gap: float = SWEEP_MAX_GAP,
+                   v_tol: float = SWEEP_V_TOLERANCE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Split a time-ordered series into monotonic voltage runs.
+
+    Returns ``(starts, ends, direction)``: sample ranges ``[start, end)`` and
+    +1/-1. Consecutive runs share their turning-point sample; a step across
+    a time gap belongs to no run. Flat steps keep the current direction.
+    """
+    V = np.asarray(V, dtype=np.float64)
+    n = len(V)
+    empty = np.empty(0, dtype=np.int64)
+    if n < 2:
+        return (np.zeros(n, dtype=np.int64), np.full(n, n, dtype=np.int64), np.ones(n, dtype=np.int64))
+
+    d = np.diff(V)
+    sign = np.where(np.abs(d) > v_tol, np.sign(d), 0).astype(np.int64)
+    # Flat steps take the direction of the last real step (the first one for leading flats)
+    nz = sign != 0
+    if not nz.any():
+        sign[:] = 1
+    else:
+        last = np.maximum.accumulate(np.where(nz, np.arange(n - 1), -1))
+        sign = np.where(last >= 0, sign[np.maximum(last, 0)], sign[np.argmax(nz)])
+
+    t_us = np.asarray(t, dtype="datetime64[us]").astype(np.int64)
+    valid = np.diff(t_us) <= max_gap * 1_000_000
+    prev_valid = np.r_[False, valid[:-1]]
+    new_run = valid & (~prev_valid | np.r_[True, sign[1:] != sign[:-1]])
+    next_new = np.r_[new_run[1:], True]
+    next_valid = np.r_[valid[1:], False]
+    run_end = valid & (next_new | ~next_valid)
+
+    starts = np.flatnonzero(new_run)
+    ends = np.flatnonzero(run_end) + 2
+    if not len(starts):
+        return empty, empty, empty
+    return starts, ends, sign[starts]
+
+
+def _axis_crossing(seg, x, y):
+    """Per segment, y where x = 0, from the two samples closest to x = 0.
+
+    Interpolates when they straddle the axis and extrapolates otherwise;
+    falls back to the closest sample when both have the same x.
+    """
+    order = np.lexsort((np.abs(x), seg))
+    first = np.r_[0, np.flatnonzero(np.diff(seg[order])) + 1]
+    counts = np.diff(np.r_[first, len(order)])
+    a = order[first]
+    b = order[np.minimum(first + 1, first + counts - 1)]
+    x1, y1, x2, y2 = x[a], y[a], x[b], y[b]
+    dx = x2 - x1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(dx != 0, y1 - x1 * (y2 - y1) / dx, y1)
+    return out
+
+
+def sweep_metrics(starts, ends, ids, V, I, P) -> Dict[str, np.ndarray]:
+    """Pmp/Vmp/Imp (best measured point and quadratic fit), Voc, Isc and fill factor of every run."""
+    lengths = ends - starts
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    idx = np.arange(len(seg)) + offsets
+    v, i, p = V[idx], I[idx], P[idx]
+
+    # Highest power first, earliest on ties
+    order = np.lexsort((idx, -p, seg))
+    first = np.r_[0, np.flatnonzero(np.diff(seg[order])) + 1]
+    mpp = idx[order[first]]
+
+    isc = _axis_crossing(seg, v, i)
+    voc = _axis_crossing(seg, i, v)
+    pmp = P[mpp]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ff = np.where((voc > 0) & (isc > 0), pmp / (voc * isc), np.nan)
+    fit = quadratic_mpp(starts, ends, V, I, P)
+    nan = np.where(fit["fitted"], 0.0, np.nan)
+    return {"mpp": mpp, "vmp": V[mpp], "imp": I[mpp], "pmp": pmp, "mpp_id": ids[mpp],
+            "voc": voc, "isc": isc, "fill_factor": ff,
+            "vmp_fit": fit["vmp"] + nan, "imp_fit": fit["imp"] + nan, "pmp_fit": fit["pmp"] + nan,
+            "fit_residual": fit["residual"]}
+
+
+def _none_nan(x: float) -> Optional[float]:
+    return None if x != x else x
+
+
+def _rows(starts, ends, direction, ids, t, V, I, P, closed, device_id: str) -> List[Dict[str, Any]]:
+    if not len(starts):
+        return []
+    mt = sweep_metrics(starts, ends, ids, V, I, P)
+    return [
+        {
+            "device_id": device_id, "closed": bool(closed[k]), "start_time": t[s], "end_time": t[e - 1],
+            "start_id": int(ids[s]), "end_id": int(ids[e - 1]), "n_points": int(e - s),
+            "direction": int(direction[k]),
+            "vmp": float(mt["vmp"][k]), "imp": float(mt["imp"][k]), "pmp": float(mt["pmp"][k]),
+            "mpp_id": int(mt["mpp_id"][k]), "voc": _none_nan(float(mt["voc"][k])),
+            "isc": _none_nan(float(mt["isc"][k])), "fill_factor": _none_nan(float(mt["fill_factor"][k])),
+            **{c: _none_nan(float(mt[c][k])) for c in ("vmp_fit", "imp_fit", "pmp_fit", "fit_residual")},
+        }
+        for k, (s, e) in enumerate(zip(starts.tolist(), ends.tolist()))
+    ]
+
+
+def _open_key(row) -> tuple:
+    return (row["start_id"], row["end_id"], row["n_points"], row["start_time"], row["end_time"], row["pmp"])
+
+
+def update_sweeps(db: Session, device_id: str = DEFAULT_DEVICE_ID, limit: Optional[int] = None,
+                  since: Optional[datetime] = None) -> int:
+    """Re-segment a device's stream from the start of its open sweep; returns the samples read.
+
+    Finished sweeps of at least SWEEP_MIN_POINTS samples are stored as closed;
+    the last run is stored as the open sweep. ``since`` is the earliest
+    timestamp the caller just wrote: when it is not before the end of the open
+    sweep and this process holds that sweep's samples, only the samples after
+    it are read. Samples timestamped before the open sweep (backfills) are
+    only picked up by ``rebuild_sweeps``.
+    """
+    own = Sweep.device_id == device_id
+    open_ = db.execute(
+        select(Sweep.id, Sweep.start_id, Sweep.end_id, Sweep.n_points, Sweep.start_time, Sweep.end_time, Sweep.pmp)
+        .where(own, Sweep.closed.is_(False))
+    ).first()
+    cached = _open_runs.pop(device_id, None)
+    head = None
+    if open_ is not None:
+        if (cached is not None and cached[0] == _open_key(open_._mapping) and not limit
+                and since is not None and since >= open_.end_time):
+            head = cached[1]
+            cursor = (open_.end_time, open_.end_id)
+        else:
+            cursor = (open_.start_time, open_.start_id)
+    else:
+        last = db.execute(
+            select(Sweep.end_time, Sweep.end_id).where(own)
+            .order_by(Sweep.end_time.desc(), Sweep.end_id.desc()).limit(1)
+        ).first()
+        cursor = tuple(last) if last else None
+
+    q = select(Sample.id, Sample.timestamp, Sample.voltage, Sample.current,
+               func.coalesce(Sample.power, Sample.voltage * Sample.current)).where(Sample.device_id == device_id)
+    if head is not None:
+        q = q.where(Sample.timestamp >= cursor[0], or_(Sample.timestamp > cursor[0], Sample.id > cursor[1]))
+    elif cursor is not None:
+        q = q.where(Sample.timestamp >= cursor[0], or_(Sample.timestamp > cursor[0], Sample.id >= cursor[1]))
+    q = q.order_by(Sample.timestamp, Sample.id)
+    if limit:
+        q = q.limit(limit)
+    samples = db.execute(q).all()
+    if not samples:
+        if head is not None:
+            _open_runs[device_id] = cached
+        elif open_ is not None:
+            db.execute(delete(Sweep).where(Sweep.id == open_.id))
+        return 0
+    if open_ is not None:
+        db.execute(delete(Sweep).where(Sweep.id == open_.id))
+
+    ids, t, V, I, P = zip(*samples)
+    ids = np.asarray(ids, dtype=np.int64)
+    t = list(t)
+    V, I, P = (np.asarray(a, dtype=np.float64) for a in (V, I, P))
+    if head is not None:
+        ids, V, I, P = (np.r_[a, b] for a, b in zip((head[0], head[2], head[3], head[4]), (ids, V, I, P)))
+        t = head[1] + t
+    starts, ends, direction = segment_sweeps(np.array(t, dtype="datetime64[us]"), V)
+    if not len(starts):
+        # Only isolated samples: the last one opens the next sweep
+        starts, ends, direction = (np.array([len(ids) - 1]), np.array([len(ids)]), np.array([1]))
+
+    closed = np.ones(len(starts), dtype=bool)
+    if ends[-1] < len(ids):
+        # The stream ends with a sample after a gap: it opens the next sweep
+        starts, ends, direction = np.r_[starts, len(ids) - 1], np.r_[ends, len(ids)], np.r_[direction, 1]
+        closed = np.r_[closed, False]
+    else:
+        closed[-1] = ends[-1] - starts[-1] >= SWEEP_MAX_POINTS
+    keep = ~closed | (ends - starts >= SWEEP_MIN_POINTS)
+    rows = _rows(starts[keep], ends[keep], direction[keep], ids, t, V, I, P, closed[keep], device_id)
+    if rows:
+        db.execute(Sweep.__table__.insert(), rows)
+    if not closed[-1]:
+        s = starts[-1]
+        _open_runs[device_id] = (_open_key(rows[-1]), (ids[s:], t[s:], V[s:], I[s:], P[s:]))
+    return len(samples)
+
+
+def rebuild_sweeps(db: Session, page_rows: int = 2 * SWEEP_MAX_POINTS) -> int:
+    """Recompute every sweep from ``samples``; returns the number of sweeps."""
+    clear_sweeps(db)
+    # Each page ends in the open run, at most SWEEP_MAX_POINTS long, so pages advance
+    page_rows = max(page_rows, 2 * SWEEP_MAX_POINTS)
+    for device in db.scalars(select(Sample.device_id).distinct()).all():
+        while update_sweeps(db, device, page_rows) == page_rows:
+            pass
+    return db.scalar(select(func.count()).select_from(Sweep).where(Sweep.closed.is_(True)))
+
+
+def clear_sweeps(db: Session) -> None:
+    """Delete every sweep and the diode fits made on them."""
+    _open_runs.clear()
+    db.execute(delete(DiodeFit))
+    db.execute(delete(Sweep))
+
+
+def query_sweeps(db: Session, dt_from=None, dt_to=None, limit: Optional[int] = None,
+                 include_open: bool = False, device_id: Optional[str] = None) -> List[Sweep]:
+    q = select(Sweep)
+    if device_id is not None:
+        q = q.where(Sweep.device_id == device_id)
+    if not include_open:
+        q = q.where(Sweep.closed.is_(True))
+    if dt_from is not None:
+        q = q.where(Sweep.end_time >= dt_from)
+    if dt_to is not None:
+        q = q.where(Sweep.start_time <= dt_to)
+    q = q.order_by(Sweep.start_time, Sweep.start_id)
+    if limit:
+        q = q.limit(limit)
+    return list(db.scalars(q))
@@ -1,31 +1,449 @@
-from typing import List, Dict, Any
-from fastapi import WebSocket
+"""Live sample broadcast to dashboard WebSockets.
+
+Every client has a subscription (see ``Subscription``): the devices and
+sources it follows, an optional rate limit and the streams it wants
+(``samples``, ``mpp``). A topic index keyed by device finds the interested
+clients of each published sample without scanning every connection.
+
+Samples published by the routers are coalesced into ``samples`` frames (at
+most BATCH_MAX_SAMPLES rows, or whatever arrived within BATCH_MAX_DELAY).
+Each run of one device's samples in a flush is encoded once per source
+filter in use, and frames are assembled once per distinct selection, so the
+cost follows what the dashboards display rather than the ingest rate.
+Clients that negotiate the ``utils.wire`` subprotocol get samples as binary
+column frames instead of JSON.
+Rate-limited clients get the latest sample of each device at most
+``max_rate`` times per second. Every client has a bounded queue drained by
+its own writer task, so a stalled browser only fills its own queue; when it
+overflows the client is disconnected and can reconnect and refetch.
+"""
+import asyncio
 import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+from fastapi import WebSocket
+
+from ..models.sample import SampleSource
+from ..schemas.sample import DEVICE_ID_REGEX
+from ..utils import metrics, wire
+
+logger = logging.getLogger(__name__)
+
+# Samples per frame
+BATCH_MAX_SAMPLES = int(os.getenv("WS_BATCH_MAX_SAMPLES", "500"))
+# Seconds a partial frame waits for more samples
+BATCH_MAX_DELAY = float(os.getenv("WS_BATCH_MAX_DELAY", "0.05"))
+# Frames buffered per client before it is considered too slow
+CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "64"))
+# Longest a bulk producer waits in ``drain`` for clients to catch up
+DRAIN_TIMEOUT = float(os.getenv("WS_DRAIN_TIMEOUT", "0.5"))
+# Highest max_rate a client may ask for (samples per second per device)
+MAX_RATE_LIMIT = 1000.0
+
+# Close code sent to clients that could not keep up ("try again later")
+CLOSE_TOO_SLOW = 1013
+
+STREAMS = ("samples", "mpp")
+
+# Queued message: JSON text, or a binary samples frame
+Frame = Union[str, bytes]
+
+
+class Subscription:
+    """What a client receives.
+
+    ``devices``/``sources`` are None for all of them. ``max_rate`` limits
+    samples to that many per second per device (the latest one wins).
+    ``mpp`` delivers the running MPP of each followed device, or the overall
+    one when ``devices`` is None.
+    """
+
+    __slots__ = ("devices", "sources", "max_rate", "streams")
+
+    def __init__(self, devices: Optional[Iterable[str]] = None, sources: Optional[Iterable[str]] = None,
+                 max_rate: Optional[float] = None, streams: Iterable[str] = ("samples",)):
+        self.devices: Optional[FrozenSet[str]] = None if devices is None else frozenset(devices)
+        self.sources: Optional[FrozenSet[str]] = None if sources is None else frozenset(sources)
+        self.max_rate = max_rate or None
+        self.streams: FrozenSet[str] = frozenset(streams)
+
+    @classmethod
+    def parse(cls, msg: Dict[str, Any]) -> "Subscription":
+        """Subscription from a client ``subscribe`` message; ValueError when invalid."""
+        def names(key, valid):
+            value = msg.get(key)
+            if value is None:
+                return None
+            if not isinstance(value, list) or not all(isinstance(v, str) and valid(v) for v in value):
+                raise ValueError(f"'{key}' must be a list of valid names")
+            return value
+
+        devices = names("devices", lambda v: re.match(DEVICE_ID_REGEX, v) is not None)
+        sources = names("sources", lambda v: v in SampleSource.__members__)
+        streams = names("streams", lambda v: v in STREAMS)
+        rate = msg.get("max_rate")
+        if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float))
+                                 or not 0 <= rate <= MAX_RATE_LIMIT):
+            raise ValueError(f"'max_rate' must be a number of samples per second up to {MAX_RATE_LIMIT:g}")
+        return cls(devices, sources, rate, ("samples",) if streams is None else streams)
+
+    def to_message(self) -> Dict[str, Any]:
+        return {
+            "type": "subscribed",
+            "devices": None if self.devices is None else sorted(self.devices),
+            "sources": None if self.sources is None else sorted(self.sources),
+            "max_rate": self.max_rate,
+            "streams": sorted(self.streams),
+        }
+
+    def wants_source(self, source: Optional[str]) -> bool:
+        return self.sources is None or source in self.sources
+
+
+class _Client:
+    __slots__ = ("websocket", "queue", "task", "sub", "binary", "due", "held")
+
+    def __init__(self, websocket: WebSocket, queue_size: int, sub: Subscription, binary: bool = False):
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[Frame]" = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.sub = sub
+        # Samples as binary frames (utils.wire); other messages stay JSON text
+        self.binary = binary
+        # Rate-limited clients: next send time and the sample waiting for it, per device
+        self.due: Dict[Optional[str], float] = {}
+        self.held: Dict[Optional[str], Dict[str, Any]] = {}
+
+
+def _topics(sub: Subscription, stream: str) -> Iterable[Optional[str]]:
+    """Index keys of a subscription: its devices, or None for all of them."""
+    if stream not in sub.streams:
+        return ()
+    return (None,) if sub.devices is None else sub.devices
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        max_batch: int = BATCH_MAX_SAMPLES,
+        max_delay: float = BATCH_MAX_DELAY,
+        queue_size: int = CLIENT_QUEUE_SIZE,
+    ):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.clients: Dict[WebSocket, _Client] = {}
+        # Topic index: device (None: every device) -> clients, per stream
+        self._index: Dict[str, Dict[Optional[str], Set[_Client]]] = {s: {} for s in STREAMS}
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Rate-limited clients holding a sample back, and the timer that releases them
+        self._holding: Set[_Client] = set()
+        self._held_handle: Optional[asyncio.TimerHandle] = None
+        # Frames dropped because a client was disconnected as too slow
+        self.dropped = 0
+        # JSON encodings of sample slices, for tests and benchmarks
+        self.encoded = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket, device_id: Optional[str] = None, binary: bool = False):
+        """Accept a client, subscribed to every sample (of ``device_id`` only, if given).
+
+        ``binary`` clients negotiated the WS_SUBPROTOCOL and get samples as
+        ``utils.wire`` frames.
+        """
+        await websocket.accept(subprotocol=wire.WS_SUBPROTOCOL if binary else None)
+        sub = Subscription(None if device_id is None else [device_id])
+        client = _Client(websocket, self.queue_size, sub, binary)
+        client.task = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
+        self._add(client)
+
+    def subscribe(self, websocket: WebSocket, sub: Subscription):
+        """Replace a client's subscription and acknowledge it."""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        self._remove(client)
+        client.sub = sub
+        client.due.clear()
+        client.held.clear()
+        self._add(client)
+        self.send(websocket, sub.to_message())
+
+    def _add(self, client: _Client):
+        for stream, index in self._index.items():
+            for key in _topics(client.sub, stream):
+                index.setdefault(key, set()).add(client)
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    def _remove(self, client: _Client):
+        self._holding.discard(client)
+        for stream, index in self._index.items():
+            for key in _topics(client.sub, stream):
+                subs = index.get(key)
+                if subs is not None:
+                    subs.discard(client)
+                    if not subs:
+                        del index[key]
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        self._remove(client)
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
 
-    async def broadcast(self, message: Dict[str, Any]):
-        data = json.dumps(message, default=str)
-        to_remove = []
-        for connection in self.active_connections:
+    async def _writer(self, client: _Client):
+        try:
+            while True:
+                frame = await client.queue.get()
+                start = time.perf_counter()
+                if isinstance(frame, bytes):
+                    await client.websocket.send_bytes(frame)
+                else:
+                    await client.websocket.send_text(frame)
+                SEND_SECONDS.observe(time.perf_counter() - start)
+                client.queue.task_done()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        finally:
+            if self.clients.get(client.websocket) is client:
+                self.disconnect(client.websocket)
+
+    def _interested(self, stream: str, device: Optional[str]) -> Set[_Client]:
+        index = self._index[stream]
+        return index.get(device, set()) | index.get(None, set())
+
+    def wants(self, device: Optional[str], source: Optional[str] = None) -> bool:
+        """Whether any client follows the samples of ``device`` from ``source``."""
+        return any(c.sub.wants_source(source) for c in self._interested("samples", device))
+
+    def _enqueue(self, frame: Frame, clients: Optional[Iterable[_Client]] = None):
+        for client in list(self.clients.values()) if clients is None else list(clients):
             try:
-                await connection.send_text(data)
-            except Exception:
-                to_remove.append(connection)
-        for conn in to_remove:
-            self.disconnect(conn)
+                client.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Too slow: drop its backlog, stop its writer even mid-send, and close it
+                self.dropped += client.queue.qsize()
+                logger.warning("Disconnecting slow WebSocket client (%d frames behind)", client.queue.qsize())
+                self.disconnect(client.websocket)
+                asyncio.ensure_future(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=CLOSE_TOO_SLOW)
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, message: Dict[str, Any]):
+        """Queue a message for one client, behind the frames it already has."""
+        client = self.clients.get(websocket)
+        if client is not None:
+            self._enqueue(json.dumps(message, default=str), [client])
+
+    def flush(self):
+        """Send the pending samples now."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        # Runs of consecutive samples from one device, in publish order
+        runs: List[Tuple[Optional[str], List[Dict[str, Any]]]] = []
+        for s in pending:
+            device = s.get("device_id")
+            if runs and runs[-1][0] == device:
+                runs[-1][1].append(s)
+            else:
+                runs.append((device, [s]))
+
+        full: Set[_Client] = set()
+        limited: Set[_Client] = set(self._holding)
+        for device in {d for d, _ in runs}:
+            for client in self._interested("samples", device):
+                (limited if client.sub.max_rate else full).add(client)
+
+        # Encoded runs per source filter and format, frames per distinct selection and format
+        slices: Dict[Tuple[int, Optional[FrozenSet[str]], bool], List[Tuple[int, Frame]]] = {}
+        frames: Dict[Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]], bool], List[Frame]] = {}
+        for client in full:
+            key = (client.sub.devices, client.sub.sources, client.binary)
+            if key not in frames:
+                frames[key] = self._frames(runs, client.sub, client.binary, slices)
+            for frame in frames[key]:
+                self._enqueue(frame, [client])
+        if limited:
+            self._send_limited(limited, runs)
+
+    def _frames(self, runs, sub: Subscription, binary: bool, slices) -> List[Frame]:
+        parts: List[Tuple[int, Frame]] = []
+        for r, (device, rows) in enumerate(runs):
+            if sub.devices is not None and device not in sub.devices:
+                continue
+            key = (r, sub.sources, binary)
+            if key not in slices:
+                mine = rows if sub.sources is None else [s for s in rows if s.get("source") in sub.sources]
+                slices[key] = []
+                for i in range(0, len(mine), self.max_batch):
+                    chunk = mine[i:i + self.max_batch]
+                    # Binary blocks concatenate as they are; JSON drops "[...]" to join into one data array
+                    encoded = wire.encode_rows(chunk) if binary else json.dumps(chunk, default=str)[1:-1]
+                    slices[key].append((len(chunk), encoded))
+                    self.encoded += 1
+            parts += slices[key]
+
+        out, frame, size = [], [], 0
+        for n, text in parts:
+            if frame and size + n > self.max_batch:
+                out.append(frame)
+                frame, size = [], 0
+            frame.append(text)
+            size += n
+        if frame:
+            out.append(frame)
+        if binary:
+            return [b"".join(f) for f in out]
+        return ['{"type": "samples", "data": [' + ", ".join(f) + "]}" for f in out]
+
+    def _send_limited(self, clients: Set[_Client], runs):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        wake = None
+        for client in clients:
+            sub = client.sub
+            for device, rows in runs:
+                if sub.devices is not None and device not in sub.devices:
+                    continue
+                latest = next((s for s in reversed(rows) if sub.wants_source(s.get("source"))), None)
+                if latest is not None:
+                    client.held[device] = latest
+            out = []
+            for device in list(client.held):
+                if now >= client.due.get(device, 0.0):
+                    out.append(client.held.pop(device))
+                    client.due[device] = now + 1.0 / sub.max_rate
+            if out:
+                frame = wire.encode_rows(out) if client.binary else json.dumps(samples_to_message(out), default=str)
+                self._enqueue(frame, [client])
+            if client.held and client.websocket in self.clients:
+                self._holding.add(client)
+                first = min(client.due[d] for d in client.held)
+                wake = first if wake is None else min(wake, first)
+            else:
+                self._holding.discard(client)
+        if wake is not None and (self._held_handle is None or wake < self._held_handle.when()):
+            if self._held_handle is not None:
+                self._held_handle.cancel()
+            self._held_handle = loop.call_at(wake, self._release_held)
+
+    def _release_held(self):
+        self._held_handle = None
+        self.flush()
+
+    def publish(self, samples: Iterable[Dict[str, Any]]):
+        """Queue samples (``Sample.to_dict()`` shape) for the next frame.
+
+        Does not block: full frames are encoded and queued right away, the
+        rest within ``max_delay``. A no-op while no client is connected.
+        """
+        if not self.clients:
+            return
+        self._pending.extend(samples)
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._pending and self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Flush and give clients up to ``timeout`` seconds to send their queues.
+
+        Bulk producers call this between slices; clients still behind
+        afterwards are left to their queue bound.
+        """
+        self.flush()
+        waits = [asyncio.ensure_future(c.queue.join()) for c in self.clients.values() if not c.queue.empty()]
+        if not waits:
+            return
+        _, pending = await asyncio.wait(waits, timeout=timeout)
+        for w in pending:
+            w.cancel()
+
+    async def on_committed(self, batch):
+        """Event bus subscriber: stream a committed batch to the clients.
+
+        Batches nobody follows are skipped before any row is built. Large
+        batches go out in slices of half a client queue, with a ``drain``
+        after each, so healthy clients are not overrun.
+        """
+        if not self.clients:
+            return
+        if batch.columns is not None and not self.wants(batch.columns.device_id, batch.source):
+            return
+        step = max(1, self.max_batch * self.queue_size // 2)
+        samples = list(batch.iter_dicts())
+        for i in range(0, len(samples), step):
+            self.publish(samples[i:i + step])
+            await self.drain()
+
+    def on_mpp(self, update: Dict[str, Any]):
+        """Event bus subscriber: send a new running MPP to the clients following it.
+
+        ``update`` is a ``services.mpp`` MPP dict plus ``key``: the device, or
+        None for the overall maximum.
+        """
+        clients = self._index["mpp"].get(update["key"])
+        if clients:
+            self._enqueue(json.dumps(mpp_to_message(update), default=str), clients)
+
+    async def on_deleted(self, deleted: int):
+        """Event bus subscriber: tell dashboards to drop the samples they hold."""
+        self._pending.clear()
+        for client in self.clients.values():
+            client.held.clear()
+        self._holding.clear()
+        await self.broadcast({"type": "reset", "deleted": deleted})
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """Send one message to every client (encoded once, same queues as samples)."""
+        if self.clients:
+            self._enqueue(json.dumps(message, default=str))
+
 
 manager = ConnectionManager()
 
+SEND_SECONDS = metrics.Histogram("pv_ws_send_duration_seconds", "Time to hand one frame to a /ws/live client.")
+metrics.Gauge("pv_ws_live_clients", "Connected /ws/live clients.", lambda: len(manager.clients))
+metrics.Gauge("pv_ws_queued_frames", "Frames waiting in /ws/live client queues.",
+              lambda: sum(c.queue.qsize() for c in manager.clients.values()))
+metrics.Gauge("pv_ws_queued_frames_max", "Longest /ws/live client queue.",
+              lambda: max((c.queue.qsize() for c in manager.clients.values()), default=0))
+metrics.Gauge("pv_ws_dropped_frames_total", "Frames dropped with clients disconnected as too slow.",
+              lambda: manager.dropped, kind="counter")
+
+
 def sample_to_message(sample_dict: Dict[str, Any]) -> Dict[str, Any]:
     return {"type": "sample", "data": sample_dict}
+
+
+def samples_to_message(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"type": "samples", "data": samples}
+
+
+def mpp_to_message(mpp: Dict[str, Any]) -> Dict[str, Any]:
+    """``mpp`` frame: the device (None for all devices) and the MPP sample."""
+    return {
+        "type": "mpp",
+        "device_id": mpp["key"],
+        "data": {"id": mpp["id"], "device_id": mpp["device_id"], "t": mpp["t"],
+                 "Vmp": mpp["V"], "Imp": mpp["I"], "Pmp": mpp["P"]},
+    }
@@ -0,0 +1,602 @@
+"""Columnar, single-pass parsing of V/I/P/T text.
+
+The format is sniffed once from the start of the input (``sniff``) and each
+block of lines is then decoded straight into NumPy arrays by the fast path of
+that format, instead of a dict and four ``float()`` calls per row:
+
+- delimited (CSV with a V/I header, ';' exports, headerless ``V,I[,P][,T]``):
+  one ``np.loadtxt`` call per block;
+- key-value (``V:20.2V I:0.10A P:2.1W``): one multiline regex ``findall`` per
+  block, timestamped once;
+- JSON lines (``{"V": 20.2, "I": 0.1}``): one ``json.loads`` per block.
+
+Blocks the fast path rejects go line by line with the same rules as the row
+parser in ``parser.py``, and lines that fit no format are reported.
+"""
+import io
+import json
+import math
+import re
+import warnings
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dateutil import parser as dtparser
+
+from . import metrics
+from .parser import CSV_LINE_REGEX, LINE_REGEX, _has_vi_header, _plain_csv_row, iter_line_blocks
+
+# Header aliases, same as the row parser
+COLUMN_ALIASES = {
+    "v": "V", "voltage": "V",
+    "i": "I", "current": "I",
+    "p": "P", "power": "P",
+    "t_c": "T", "temp": "T", "temperature": "T",
+    "t": "t", "time": "t", "timestamp": "t",
+}
+
+# Lines per batch when streaming
+COLUMN_BLOCK_ROWS = 100_000
+# Lines per fast-path call: a chunk with an unreadable line is re-read line by line
+FAST_PATH_LINES = 256
+# Lines looked at to pick the format of headerless input
+SNIFF_LINES = 16
+# Rejected lines reported per batch (``skipped`` counts them all)
+MAX_LINE_ERRORS = 100
+
+
+class SampleColumns:
+    """A batch of samples as parallel arrays.
+
+    V, I, P, T are float64 arrays (T is NaN where unknown); t is a
+    ``datetime64[us]`` array or None when the input carries no timestamps.
+    ``skipped`` counts input lines dropped (unreadable, or with an invalid
+    timestamp) and ``errors`` lists the first of them as (line, reason);
+    ``id`` is filled in by ingestion. A batch belongs to one ``device_id``
+    (set by ingestion when None).
+    """
+
+    __slots__ = ("V", "I", "P", "T", "t", "skipped", "errors", "id", "device_id")
+
+    def __init__(self, V, I, P=None, T=None, t=None, skipped: int = 0, device_id: Optional[str] = None,
+                 errors: Optional[List[Tuple[int, str]]] = None):
+        self.V = np.asarray(V, dtype=np.float64)
+        self.I = np.asarray(I, dtype=np.float64)
+        P = np.full(len(self.V), np.nan) if P is None else np.asarray(P, dtype=np.float64)
+        # Power defaults to V*I, per row
+        self.P = np.where(np.isnan(P), self.V * self.I, P)
+        self.T = np.full(len(self.V), np.nan) if T is None else np.asarray(T, dtype=np.float64)
+        self.t = t
+        self.skipped = skipped
+        self.errors = errors or []
+        self.id: Optional[np.ndarray] = None
+        self.device_id = device_id
+
+    def __len__(self) -> int:
+        return len(self.V)
+
+    @classmethod
+    def empty(cls) -> "SampleColumns":
+        return cls(np.empty(0), np.empty(0))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], lines=None) -> "SampleColumns":
+        """Columns from row-parser dicts ({V, I, P?, T?, t?}); ``lines`` numbers them for errors."""
+        rows = list(rows)
+        nan = float("nan")
+        V = [r["V"] for r in rows]
+        I = [r["I"] for r in rows]
+        P = [nan if r.get("P") is None else r["P"] for r in rows]
+        T = [nan if r.get("T") is None else r["T"] for r in rows]
+        cols = cls(V, I, P, T)
+        if any(r.get("t") is not None for r in rows):
+            cols = _set_times(cols, [r.get("t") for r in rows], lines)
+        return cols
+
+    def take(self, index) -> "SampleColumns":
+        out = SampleColumns(self.V[index], self.I[index], self.P[index], self.T[index],
+                            None if self.t is None else self.t[index], self.skipped, self.device_id,
+                            self.errors)
+        if self.id is not None:
+            out.id = self.id[index]
+        return out
+
+    def iter_dicts(self, source: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Rows in the ``Sample.to_dict()`` shape (needs ``id``/``t`` from ingestion)."""
+        stamps = np.datetime_as_string(self.t, unit="us").tolist() if self.t is not None else [None] * len(self)
+        T = [None if x != x else x for x in self.T.tolist()]
+        ids = self.id.tolist() if self.id is not None else [None] * len(self)
+        for i, t, V, I, P, temp in zip(ids, stamps, self.V.tolist(), self.I.tolist(), self.P.tolist(), T):
+            yield {"id": i, "device_id": self.device_id, "t": t, "V": V, "I": I, "P": P, "T": temp, "source": source}
+
+
+def _naive_parse(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        t = value
+    else:
+        try:
+            t = dtparser.isoparse(str(value).strip())
+        except (ValueError, OverflowError):
+            return None
+    return t.replace(tzinfo=None) if t.tzinfo is not None else t
+
+
+def parse_times(values) -> Tuple[np.ndarray, np.ndarray]:
+    """Timestamps as ``datetime64[us]`` plus a validity mask.
+
+    Plain ISO strings are converted by NumPy in one call; anything else
+    (offsets, 'Z', odd formats) is parsed per value like the row path, keeping
+    the wall-clock time the way the timezone-naive column stores it.
+    """
+    arr = np.asarray(values, dtype=object)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            t = np.array([str(v).strip() for v in arr.tolist()], dtype="datetime64[us]")
+    except Exception:
+        parsed = [_naive_parse(v) for v in arr.tolist()]
+        t = np.array([p if p is not None else "NaT" for p in parsed], dtype="datetime64[us]")
+    return t, ~np.isnat(t)
+
+
+def _set_times(cols: SampleColumns, values, numbers=None) -> SampleColumns:
+    """Attach parsed timestamps, dropping (and reporting) rows whose time is invalid."""
+    t, valid = parse_times(values)
+    if not valid.all():
+        bad = np.flatnonzero(~valid)
+        cols = cols.take(valid)
+        cols.skipped += len(bad)
+        if numbers is not None:
+            cols.errors = sorted(cols.errors + [(int(numbers[k]), "invalid timestamp")
+                                                for k in bad[:MAX_LINE_ERRORS]])[:MAX_LINE_ERRORS]
+        t = t[valid]
+    cols.t = t
+    return cols
+
+
+def _float(cell: str) -> float:
+    try:
+        return float(cell)
+    except ValueError:
+        raise ValueError(f"invalid number {cell!r}") from None
+
+
+def _plain_row(line: str, now: Optional[str] = None) -> Dict[str, Any]:
+    if not CSV_LINE_REGEX.match(line):
+        raise ValueError("expected V,I[,P][,T] numbers")
+    return _plain_csv_row(line)
+
+
+def _key_value_row(line: str, now: Optional[str] = None) -> Dict[str, Any]:
+    m = LINE_REGEX.search(line)
+    if not m:
+        raise ValueError("no V:..V I:..A values")
+    V, I, P, T = (None if g is None else float(g) for g in m.groups())
+    return {"V": V, "I": I, "P": P, "T": T, "t": now}
+
+
+def json_sample(obj: Any, now: Optional[str] = None) -> Dict[str, Any]:
+    """Row ({V, I, P, T, t}) of a decoded JSON sample; ValueError unless V and I are finite numbers."""
+    if not isinstance(obj, dict):
+        raise ValueError("expected a JSON object")
+    try:
+        row = {k: None if obj.get(k) is None else float(obj[k]) for k in ("V", "I", "P", "T")}
+    except (TypeError, ValueError):
+        raise ValueError("non-numeric V, I, P or T") from None
+    if row["V"] is None or row["I"] is None:
+        raise ValueError("missing V or I")
+    if not (math.isfinite(row["V"]) and math.isfinite(row["I"])):
+        raise ValueError("non-finite V or I")
+    row["t"] = obj.get("t", now)
+    return row
+
+
+def _json_row(line: str, now: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        raise ValueError("invalid JSON") from None
+    return json_sample(obj, now)
+
+
+def _line_kind(line: str) -> Optional[str]:
+    if line.startswith("{"):
+        return "json"
+    if CSV_LINE_REGEX.match(line):
+        return "delimited"
+    if LINE_REGEX.search(line):
+        return "key_value"
+    return None
+
+
+def _other_format_row(line: str, kind: str, now: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The line as a sample of a format other than ``kind``, or None."""
+    other = _line_kind(line)
+    if other is None or other == kind:
+        return None
+    try:
+        return _ROW_PARSERS[other](line, now)
+    except ValueError:
+        return None
+
+
+_ROW_PARSERS = {"json": _json_row, "delimited": _plain_row, "key_value": _key_value_row}
+
+# Key-value lines of a whole block in one findall: exactly one match per line,
+# with empty groups for the lines that are not key-value
+_KEY_VALUE_BLOCK_REGEX = re.compile(
+    r"^(?:.*?" + LINE_REGEX.pattern.replace(r"\s", r"[^\S\n]") + r")?.*$", re.IGNORECASE | re.MULTILINE
+)
+# The exact 'V:20.2V I:0.10A P:2.1W T:25C' form devices print, matched without
+# backtracking; picked when the sniffed lines all use it
+_NUM = r"([+-]?[0-9]*\.?[0-9]+)"
+_CANONICAL_KEY_VALUE = rf"V:{_NUM}V I:{_NUM}A(?: P:{_NUM}W)?(?: T:{_NUM}°?C)?"
+_CANONICAL_LINE_REGEX = re.compile(_CANONICAL_KEY_VALUE + r"\Z")
+_CANONICAL_BLOCK_REGEX = re.compile(rf"^(?:{_CANONICAL_KEY_VALUE}$)?.*$", re.MULTILINE)
+
+
+class _Layout:
+    """Format sniffed from the start of the input: delimited, key_value or json."""
+
+    def __init__(self, kind: str, delim: str = ",", header: Optional[List[str]] = None,
+                 fields: Optional[Dict[str, int]] = None, export: bool = False,
+                 block_regex: "re.Pattern" = _KEY_VALUE_BLOCK_REGEX):
+        self.kind = kind
+        self.delim = delim
+        self.header = header
+        self.fields = fields or {}
+        # The ';' export rule: lenient cells, no time column
+        self.export = export
+        # Key-value lines: the pattern of the fast path
+        self.block_regex = block_regex
+
+    def fits(self, line: str) -> bool:
+        """Whether a text starting with ``line`` can reuse this layout."""
+        if self.header is not None:
+            parts = [p.strip().lower() for p in line.split(self.delim)]
+            return len(parts) == len(self.header) and not _has_vi_header(parts)
+        return _line_kind(line) == self.kind
+
+    def parse_row(self, line: str, now: Optional[str] = None) -> Dict[str, Any]:
+        """One data line as {V, I, P?, T?, t?}; ValueError with the reason if rejected."""
+        if self.header is None:
+            return _ROW_PARSERS[self.kind](line, now)
+        if not self.fields:
+            raise ValueError("header names no V and I columns")
+        parts = line.split(self.delim)
+        if self.export:
+            row = {}
+            for key, idx in self.fields.items():
+                cell = parts[idx].strip() if idx < len(parts) else ""
+                try:
+                    row[key] = float(cell)
+                except ValueError:
+                    continue  # logger exports often leave cells empty
+            if "V" not in row or "I" not in row:
+                raise ValueError("missing V or I value")
+            return row
+        if len(parts) != len(self.header):
+            raise ValueError(f"expected {len(self.header)} fields, got {len(parts)}")
+        return {key: parts[idx].strip() if key == "t" else _float(parts[idx].strip())
+                for key, idx in self.fields.items()}
+
+    def parse_block(self, lines: List[str], numbers) -> SampleColumns:
+        """Decode data lines FAST_PATH_LINES at a time; chunks the fast path rejects go line by line."""
+        if self.kind == "key_value":
+            return _key_value_block(lines, numbers, self)
+        fast = _delimited_block if self.kind == "delimited" else _json_block
+        parts = []
+        for i in range(0, len(lines), FAST_PATH_LINES):
+            chunk, nums = lines[i:i + FAST_PATH_LINES], numbers[i:i + FAST_PATH_LINES]
+            cols = fast(chunk, nums, self)
+            parts.append(cols if cols is not None else _parse_lines(chunk, nums, self))
+        return concat(parts)
+
+
+def sniff(lines: List[str], semicolon_export: bool = False) -> _Layout:
+    """Pick the layout of the input from its first non-empty lines.
+
+    A first line naming V and I is a header (``semicolon_export`` applies the
+    ``parse_csv_bytes`` rule that a ';' first line always is). Otherwise the
+    format most of the first SNIFF_LINES lines match wins, so a banner line
+    does not decide for the whole input.
+    """
+    first = lines[0]
+    delim = ";" if ";" in first else ","
+    parts = [p.strip().lower() for p in first.split(delim)]
+    export = semicolon_export and delim == ";"
+    if export or _has_vi_header(parts):
+        fields: Dict[str, int] = {}
+        for idx, name in enumerate(parts):
+            key = COLUMN_ALIASES.get(name)
+            if key and key not in fields and not (export and key == "t"):
+                fields[key] = idx
+        if "V" not in fields or "I" not in fields:
+            fields = {}
+        return _Layout("delimited", delim, parts, fields, export)
+
+    kinds = [_line_kind(ln) for ln in lines[:SNIFF_LINES]]
+    kind = max(("delimited", "json", "key_value"), key=kinds.count)
+    if not kinds.count(kind):
+        kind = "key_value"
+    if kind == "key_value":
+        sample = [ln for ln, k in zip(lines, kinds) if k == kind]
+        if sample and all(_CANONICAL_LINE_REGEX.match(ln) for ln in sample):
+            return _Layout(kind, block_regex=_CANONICAL_BLOCK_REGEX)
+    if kind != "delimited":
+        return _Layout(kind)
+    line = lines[kinds.index("delimited")]
+    delim = ";" if ";" in line else ","
+    n = len(line.split(delim))
+    return _Layout("delimited", delim, None, {k: i for i, k in enumerate(("V", "I", "P", "T")[:n])})
+
+
+def _lenient_float(cell: str) -> float:
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
+
+
+def _delimited_block(lines: List[str], numbers, layout: _Layout) -> Optional[SampleColumns]:
+    """Decode the block with one ``np.loadtxt`` call."""
+    if not layout.fields:
+        return None
+    names = [k for k in ("V", "I", "P", "T", "t") if k in layout.fields]
+    usecols = [layout.fields[k] for k in names]
+    dtype = np.dtype([(k, "U64" if k == "t" else "f8") for k in names])
+    text = "\n".join(lines)
+    skipped, errors = 0, []
+    # usecols would silently accept rows wider than the first one, which the
+    # row parser rejects (the ';' export rule alone ignores extra cells)
+    width = len(layout.header) if layout.header is not None else len(layout.fields)
+    try:
+        if not layout.export and text.count(layout.delim) != (width - 1) * len(lines):
+            return None
+        data = np.loadtxt(io.StringIO(text), delimiter=layout.delim, usecols=usecols,
+                          dtype=dtype, comments=None, ndmin=1)
+    except ValueError:
+        if not layout.export:
+            return None
+        # Empty cells are skipped by the ';' rule: rows without V or I are dropped
+        try:
+            lenient = {layout.fields[k]: _lenient_float for k in names}
+            data = np.loadtxt(io.StringIO(text), delimiter=layout.delim, usecols=usecols,
+                              dtype=dtype, comments=None, ndmin=1, converters=lenient)
+        except ValueError:
+            return None
+        missing = np.isnan(data["V"]) | np.isnan(data["I"])
+        if missing.any():
+            data = data[~missing]
+            bad = np.flatnonzero(missing)
+            skipped, errors = len(bad), [(int(numbers[k]), "missing V or I value") for k in bad[:MAX_LINE_ERRORS]]
+
+    cols = SampleColumns(
+        data["V"], data["I"],
+        data["P"] if "P" in names else None,
+        data["T"] if "T" in names else None,
+        skipped=skipped, errors=errors,
+    )
+    if "t" in names:
+        cols = _set_times(cols, data["t"], numbers)
+    return cols
+
+
+def _floats(cells: Tuple[str, ...]) -> np.ndarray:
+    if "" in cells:
+        return np.array([float(c) if c else np.nan for c in cells])
+    return np.fromiter(map(float, cells), np.float64, len(cells))
+
+
+def _key_value_block(lines: List[str], numbers, layout: _Layout) -> SampleColumns:
+    """Match the whole block with one multiline ``findall``, stamped once."""
+    found = layout.block_regex.findall("\n".join(lines))
+    V, I, P, T = zip(*found)
+    bad = [k for k, v in enumerate(V) if not v]
+    if bad:
+        good = [g for g in found if g[0]]
+        V, I, P, T = zip(*good) if good else ((),) * 4
+    cols = SampleColumns(_floats(V), _floats(I), _floats(P), _floats(T))
+    cols.t = np.full(len(cols), np.datetime64(datetime.utcnow(), "us"))
+    if not bad:
+        return cols
+    # The other lines go through the per-line path, in place
+    parts, start, prev = [], 0, 0
+    for k in bad:
+        parts.append(cols.take(slice(start, start + k - prev)))
+        start += k - prev
+        parts.append(_parse_lines(lines[k:k + 1], numbers[k:k + 1], layout))
+        prev = k + 1
+    parts.append(cols.take(slice(start, None)))
+    out = concat(parts)
+    out.errors = sorted(out.errors)
+    return out
+
+
+def _json_block(lines: List[str], numbers, layout: _Layout) -> Optional[SampleColumns]:
+    """Decode the block as one JSON array."""
+    try:
+        objs = json.loads("[" + ",".join(lines) + "]")
+        if len(objs) != len(lines):
+            return None
+        V, I, P, T = (np.array([o.get(k) for o in objs], dtype=np.float64) for k in ("V", "I", "P", "T"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if V.shape != (len(lines),) or not (np.isfinite(V).all() and np.isfinite(I).all()):
+        return None
+    cols = SampleColumns(V, I, P, T)
+    stamps = [o.get("t") for o in objs]
+    if any(s is not None for s in stamps):
+        now = datetime.utcnow().isoformat()
+        cols = _set_times(cols, [now if s is None else s for s in stamps], numbers)
+    return cols
+
+
+def _parse_lines(lines: List[str], numbers, layout: _Layout) -> SampleColumns:
+    """Per-line path: lines of another format are still read, the rest reported."""
+    now = datetime.utcnow().isoformat()
+    rows: List[Dict[str, Any]] = []
+    kept: List[int] = []
+    errors: List[Tuple[int, str]] = []
+    rejected = 0
+    for k, line in enumerate(lines):
+        try:
+            row = layout.parse_row(line, now)
+        except ValueError as e:
+            row = _other_format_row(line, layout.kind, now)
+            if row is None:
+                rejected += 1
+                if len(errors) < MAX_LINE_ERRORS:
+                    errors.append((int(numbers[k]), str(e)))
+                continue
+        rows.append(row)
+        kept.append(int(numbers[k]))
+    if any(r.get("t") is not None for r in rows):
+        # Untimed rows among timed ones are stamped like key-value lines
+        for r in rows:
+            if r.get("t") is None:
+                r["t"] = now
+    cols = SampleColumns.from_rows(rows, kept)
+    cols.skipped += rejected
+    cols.errors = sorted(errors + cols.errors)[:MAX_LINE_ERRORS]
+    return cols
+
+
+def _nonempty(lines: Iterable[str], offset: int = 0) -> Tuple[List[str], np.ndarray]:
+    """Stripped non-empty lines and their 1-based line numbers."""
+    stripped = [ln.strip() for ln in lines]
+    kept = [ln for ln in stripped if ln]
+    if len(kept) == len(stripped):
+        return kept, np.arange(offset + 1, offset + 1 + len(kept))
+    return kept, offset + 1 + np.flatnonzero(np.fromiter(map(bool, stripped), bool, len(stripped)))
+
+
+class TextParser:
+    """Single-pass text parser that sniffs the format once and reuses it.
+
+    ``parse_block`` sniffs the layout on the first lines it ever sees (a
+    header is consumed), then decodes each block with the fast path of that
+    format. A block with lines the fast path rejects goes line by line:
+    lines of another format are still read, the others are counted in
+    ``skipped`` and listed in ``errors`` as (line number, reason).
+
+    ``parse`` takes a whole text, such as one /ws/ingest frame, and keeps the
+    layout of the previous texts unless it starts with a header or a line of
+    another format. ``rows`` is the line-at-a-time form for serial readers.
+    """
+
+    def __init__(self, semicolon_export: bool = False):
+        self.semicolon_export = semicolon_export
+        self.layout: Optional[_Layout] = None
+
+    def parse_block(self, lines: List[str], numbers=None) -> SampleColumns:
+        """Columns of stripped non-empty lines, ``numbers`` being their line numbers."""
+        if numbers is None:
+            numbers = np.arange(1, len(lines) + 1)
+        if lines and self.layout is None:
+            self.layout = sniff(lines, self.semicolon_export)
+            if self.layout.header is not None:
+                lines, numbers = lines[1:], numbers[1:]
+        if not lines:
+            return SampleColumns.empty()
+        metrics.PARSED_LINES.inc(self.layout.kind, amount=len(lines))
+        with metrics.PARSE_SECONDS.time(self.layout.kind):
+            cols = self.layout.parse_block(lines, numbers)
+            return cols if cols is not None else _parse_lines(lines, numbers, self.layout)
+
+    def parse(self, text: str) -> SampleColumns:
+        lines, numbers = _nonempty(text.splitlines())
+        if lines and self.layout is not None and not self.layout.fits(lines[0]):
+            self.layout = None
+        return self.parse_block(lines, numbers)
+
+    def rows(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Row dicts ({V, I, P?, T?, t?}) of lines; key-value rows are left untimed."""
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if self.layout is None:
+                self.layout = sniff([line], self.semicolon_export)
+                if self.layout.header is not None:
+                    continue
+            try:
+                yield self.layout.parse_row(line)
+            except ValueError:
+                row = _other_format_row(line, self.layout.kind, None)
+                if row is not None:
+                    yield row
+
+
+def _rebatch(line_blocks: Iterable[List[str]], size: int) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """Regroup non-empty stripped lines into lists of exactly ``size`` (last one shorter), with line numbers."""
+    pending: List[str] = []
+    numbers: List[np.ndarray] = []
+    offset = 0
+    for lines in line_blocks:
+        kept, nums = _nonempty(lines, offset)
+        offset += len(lines)
+        pending.extend(kept)
+        numbers.append(nums)
+        if len(pending) >= size:
+            nums = np.concatenate(numbers)
+            while len(pending) >= size:
+                yield pending[:size], nums[:size]
+                del pending[:size]
+                nums = nums[size:]
+            numbers = [nums]
+    if pending:
+        yield pending, np.concatenate(numbers)
+
+
+def _iter_block_columns(blocks: Iterator[Tuple[List[str], np.ndarray]], semicolon_export: bool) -> Iterator[SampleColumns]:
+    parser = TextParser(semicolon_export)
+    for lines, numbers in blocks:
+        cols = parser.parse_block(lines, numbers)
+        if len(cols) or cols.skipped:
+            yield cols
+
+
+def iter_columns(lines: Iterable[str], block_rows: int = COLUMN_BLOCK_ROWS,
+                 semicolon_export: bool = False) -> Iterator[SampleColumns]:
+    """Stream text lines as column batches of at most ``block_rows`` rows."""
+    return _iter_block_columns(_rebatch([lines], block_rows), semicolon_export)
+
+
+def parse_text_columns(text: str, parser: Optional[TextParser] = None) -> SampleColumns:
+    """Columnar counterpart of ``parse_text_samples`` for a whole text.
+
+    Pass the same ``parser`` for successive texts of one source to reuse the
+    format sniffed from the first.
+    """
+    return (parser or TextParser()).parse(text)
+
+
+def iter_csv_columns(stream: BinaryIO, block_rows: int = COLUMN_BLOCK_ROWS) -> Iterator[SampleColumns]:
+    """Column batches of an uploaded CSV or text file (binary file object), read as a stream."""
+    return _iter_block_columns(_rebatch(iter_line_blocks(stream), block_rows), semicolon_export=True)
+
+
+def concat(parts: List[SampleColumns]) -> SampleColumns:
+    skipped = sum(p.skipped for p in parts)
+    errors = [e for p in parts for e in p.errors][:MAX_LINE_ERRORS]
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return SampleColumns(np.empty(0), np.empty(0), skipped=skipped, errors=errors)
+    if len(parts) == 1 and parts[0].skipped == skipped:
+        return parts[0]
+    t = None
+    if any(p.t is not None for p in parts):
+        # Parts without timestamps get the batch time, as ingestion would give them
+        now = np.datetime64(datetime.utcnow(), "us")
+        t = np.concatenate([p.t if p.t is not None else np.full(len(p), now) for p in parts])
+    return SampleColumns(
+        np.concatenate([p.V for p in parts]),
+        np.concatenate([p.I for p in parts]),
+        np.concatenate([p.P for p in parts]),
+        np.concatenate([p.T for p in parts]),
+        t,
+        skipped,
+        errors=errors,
+    )
@@ -0,0 +1,19 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_cursor(timestamp: datetime, sample_id: int) -> str:
+    """Opaque keyset cursor for the (timestamp, id) position of a sample."""
+    raw = f"{timestamp.isoformat()}|{sample_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, sample_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(sample_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
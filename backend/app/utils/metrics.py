@@ -0,0 +1,253 @@
+"""Process metrics in the Prometheus text format, without a client library.
+
+Counters, gauges and histograms register themselves on creation and are
+rendered by ``render`` for /api/metrics. Updates take a per-metric lock, so
+parsing threads and the event loop can record into the same metric.
+Metrics are per process: with several uvicorn workers, each has its own.
+
+``MetricsMiddleware`` times every HTTP request per route template and
+counts its database queries (``instrument_engine`` hooks them); with
+PROFILE_SLOW_SECONDS set it also hands slow requests to ``utils.profiler``.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from .profiler import profiler_from_env
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; requests, queries and parse blocks
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Queries per request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(x: float) -> str:
+    return repr(float(x)) if x != int(x) or abs(x) >= 1e15 else str(int(x))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "".join([f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"]
+                       + [line + "\n" for line in self.samples()])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A value set by the code, or read from ``fn`` at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None, kind: str = "gauge"):
+        super().__init__(name, help)
+        self.kind = kind
+        self.fn = fn
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def value(self) -> float:
+        return float(self.fn()) if self.fn is not None else self._value
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.value())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # Per label values: count per bucket (last: above every bucket), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or self._values.setdefault(
+                labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        out = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                out.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return out
+
+
+def render() -> str:
+    """Every registered metric, in registration order."""
+    return "".join(m.render() for m in _registry)
+
+
+HTTP_SECONDS = Histogram("pv_http_request_duration_seconds", "HTTP request latency, body sent included.",
+                         ("method", "route", "status"))
+HTTP_DB_QUERIES = Histogram("pv_http_request_db_queries", "Database queries per HTTP request.",
+                            ("route",), COUNT_BUCKETS)
+HTTP_DB_SECONDS = Histogram("pv_http_request_db_seconds", "Time in database queries per HTTP request.", ("route",))
+DB_QUERY_SECONDS = Histogram("pv_db_query_duration_seconds", "Database query latency, background work included.")
+INGESTED_ROWS = Counter("pv_ingested_rows_total", "Samples committed by every ingest path.")
+INGESTED_BATCHES = Counter("pv_ingested_batches_total", "Committed ingest batches.")
+PARSE_SECONDS = Histogram("pv_parse_duration_seconds", "Parse time per block of input.", ("format",))
+PARSED_LINES = Counter("pv_parsed_lines_total", "Lines, rows or samples handed to the parsers.", ("format",))
+
+
+# Queries and query time of the HTTP request being served
+_request_db: ContextVar[Optional[List[float]]] = ContextVar("request_db", default=None)
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    DB_QUERY_SECONDS.observe(elapsed)
+    acc = _request_db.get()
+    if acc is not None:
+        acc[0] += 1
+        acc[1] += elapsed
+
+
+def instrument_engine(engine: Any):
+    """Time the queries of a sync ``Engine`` (an ``AsyncEngine``'s ``sync_engine`` for async ones)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor):
+        event.listen(engine, "before_cursor_execute", _before_cursor)
+        event.listen(engine, "after_cursor_execute", _after_cursor)
+
+
+def on_committed(batch):
+    """Event bus subscriber: count committed samples."""
+    INGESTED_ROWS.inc(amount=len(batch))
+    INGESTED_BATCHES.inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests per route template."""
+
+    def __init__(self, app):
+        self.app = app
+        self.profiler = profiler_from_env()
+        self._routes: Dict[Any, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            for route in getattr(scope.get("app"), "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    self._routes[endpoint] = route.path
+                    break
+            else:
+                self._routes[endpoint] = getattr(endpoint, "__name__", "unknown")
+        return self._routes[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        acc = [0, 0.0]
+        token = _request_db.set(acc)
+        capture = self.profiler.start() if self.profiler is not None else None
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+            route = self._route(scope)
+            HTTP_SECONDS.observe(elapsed, scope["method"], route, str(status))
+            HTTP_DB_QUERIES.observe(acc[0], route)
+            HTTP_DB_SECONDS.observe(acc[1], route)
+            if capture is not None:
+                self.profiler.stop(capture, elapsed, f"{scope['method']} {route}")
@@ -1,5 +1,6 @@
 import re
-from typing import List, Dict, Any
+import codecs
+from typing import List, Dict, Any, Iterable, Iterator, BinaryIO, Optional
 from datetime import datetime
 from io import BytesIO
 
@@ -8,29 +9,22 @@ LINE_REGEX = re.compile(
     re.IGNORECASE,
 )
 
+CSV_LINE_REGEX = re.compile(
+    r"^\s*[+-]?[0-9]*\.?[0-9]+\s*[,;]\s*[+-]?[0-9]*\.?[0-9]+(\s*[,;]\s*[+-]?[0-9]*\.?[0-9]+){0,2}\s*$"
+)
 
-def parse_text_samples(text: str) -> List[Dict[str, Any]]:
-    """Parse multiline text containing lines like 'V:20.2V I:0.10A P:2.1W' into sample dicts.
-
-    Returns list of dicts with keys: V, I, P (optional), T (optional), t (now).
-    Ignores lines that don't match.
-    """
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    if not lines:
-        return []
+# Size of the blocks read from uploaded files
+READ_BLOCK_SIZE = 1 << 16
 
-    samples: List[Dict[str, Any]] = []
 
-    # Try CSV with header first (',' or ';')
-    delim = ';' if ';' in lines[0] else ','
-    header_parts = [p.strip().lower() for p in lines[0].split(delim)]
-    if ('v' in header_parts and 'i' in header_parts) or ('voltage' in header_parts and 'current' in header_parts):
-        header = header_parts
-        for row in lines[1:]:
-            parts = [p.strip() for p in row.split(delim)]
-            if len(parts) != len(header):
-                continue
-            data: Dict[str, Any] = {}
+def _header_rows(header: List[str], rows: Iterable[str], delim: str) -> Iterator[Dict[str, Any]]:
+    """Rows of a delimited file whose header names V and I (',' or ';')."""
+    for row in rows:
+        parts = [p.strip() for p in row.split(delim)]
+        if len(parts) != len(header):
+            continue
+        data: Dict[str, Any] = {}
+        try:
             for key, val in zip(header, parts):
                 if key in ('t', 'time', 'timestamp'):
                     data['t'] = val
@@ -42,83 +36,185 @@ def parse_text_samples(text: str) -> List[Dict[str, Any]]:
                     data['P'] = float(val)
                 elif key in ('t_c', 'temp', 'temperature'):
                     data['T'] = float(val)
-            if 'V' in data and 'I' in data:
-                if 'P' not in data:
-                    data['P'] = data['V'] * data['I']
-                samples.append(data)
-        return samples
+        except ValueError:
+            continue
+        if 'V' in data and 'I' in data:
+            if 'P' not in data:
+                data['P'] = data['V'] * data['I']
+            yield data
 
 
-def parse_csv_bytes(data: bytes) -> List[Dict[str, Any]]:
-    """Decode bytes to text (try utf-8/utf-8-sig/latin-1) then reuse parse_text_samples."""
-    text = None
+def _semicolon_rows(header_parts: List[str], lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Rows of a ';' CSV export; cells that are empty or not numbers are skipped."""
+    for line in lines:
+        if not line.strip():
+            continue
+        parts = [p.strip() for p in line.split(';')]
+        if len(parts) < 2:
+            continue
+
+        data = {}
+        for i, part in enumerate(header_parts):
+            if i >= len(parts):
+                break
+            val = parts[i]
+            if not val:
+                continue
+
+            if part in ('v', 'voltage'):
+                try:
+                    data['V'] = float(val)
+                except ValueError:
+                    continue
+            elif part in ('i', 'current'):
+                try:
+                    data['I'] = float(val)
+                except ValueError:
+                    continue
+            elif part in ('p', 'power'):
+                try:
+                    data['P'] = float(val)
+                except ValueError:
+                    continue
+            elif part in ('t_c', 'temp', 'temperature'):
+                try:
+                    data['T'] = float(val)
+                except ValueError:
+                    continue
+
+        if 'V' in data and 'I' in data:
+            if 'P' not in data:
+                data['P'] = data['V'] * data['I']
+            yield data
+
+
+def _plain_csv_row(ln: str) -> Dict[str, Any]:
+    """A headerless 'V,I[,P][,T]' line (',' or ';')."""
+    d = ';' if ';' in ln else ','
+    parts = [p.strip() for p in ln.split(d)]
+    V = float(parts[0])
+    I = float(parts[1])
+    P = float(parts[2]) if len(parts) >= 3 and parts[2] != '' else V * I
+    T = float(parts[3]) if len(parts) >= 4 and parts[3] != '' else None
+    return {'V': V, 'I': I, 'P': P, 'T': T}
+
+
+def _key_value_row(line: str) -> Optional[Dict[str, Any]]:
+    """A 'V:20.2V I:0.10A P:2.1W' line, timestamped now; None if it doesn't match."""
+    m = LINE_REGEX.search(line)
+    if not m:
+        return None
+    V = float(m.group(1))
+    I = float(m.group(2))
+    P = float(m.group(3)) if m.group(3) is not None else None
+    T = float(m.group(4)) if m.group(4) is not None else None
+    return {
+        'V': V,
+        'I': I,
+        'P': P if P is not None else V * I,
+        'T': T,
+        't': datetime.utcnow().isoformat() + 'Z'
+    }
+
+
+def _chain_first(first: Any, rest: Iterable[Any]) -> Iterator[Any]:
+    yield first
+    yield from rest
+
+
+def _has_vi_header(header_parts: List[str]) -> bool:
+    return ('v' in header_parts and 'i' in header_parts) or ('voltage' in header_parts and 'current' in header_parts)
+
+
+def parse_text_samples(text: str) -> List[Dict[str, Any]]:
+    """Parse multiline text containing lines like 'V:20.2V I:0.10A P:2.1W' into sample dicts.
+
+    Returns list of dicts with keys: V, I, P (optional), T (optional), t (now).
+    Ignores lines that don't match.
+    """
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    if not lines:
+        return []
+
+    # Try CSV with header first (',' or ';')
+    delim = ';' if ';' in lines[0] else ','
+    header_parts = [p.strip().lower() for p in lines[0].split(delim)]
+    if _has_vi_header(header_parts):
+        return list(_header_rows(header_parts, lines[1:], delim))
+
+    # Try plain CSV without header (V,I[,P][,T]) with ',' or ';'
+    if all(CSV_LINE_REGEX.match(ln) for ln in lines):
+        return [_plain_csv_row(ln) for ln in lines]
+
+    # Fallback to key-value regex lines
+    samples: List[Dict[str, Any]] = []
+    for line in lines:
+        row = _key_value_row(line)
+        if row is not None:
+            samples.append(row)
+    return samples
+
+
+def _decode(data: bytes) -> str:
     for enc in ("utf-8", "utf-8-sig", "latin-1"):
         try:
-            text = data.decode(enc)
-            break
+            return data.decode(enc)
         except Exception:
             continue
-    if text is None:
-        text = data.decode("utf-8", errors="ignore")
-    
+    return data.decode("utf-8", errors="ignore")
+
+
+def parse_csv_bytes(data: bytes) -> List[Dict[str, Any]]:
+    """Decode bytes to text (try utf-8/utf-8-sig/latin-1) then reuse parse_text_samples."""
+    text = _decode(data)
+
     # Forcer le traitement comme CSV avec séparateur ; si détecté
     lines = [line.strip() for line in text.split('\n') if line.strip()]
     if not lines:
         return []
-    
+
     # Vérifier si c'est un format CSV avec en-tête et séparateur ;
     if ';' in lines[0]:
         header_parts = [p.strip().lower() for p in lines[0].split(';')]
-        samples = []
-        for line in lines[1:]:
-            if not line.strip():
-                continue
-            parts = [p.strip() for p in line.split(';')]
-            if len(parts) < 2:
-                continue
-            
-            data = {}
-            for i, part in enumerate(header_parts):
-                if i >= len(parts):
-                    break
-                val = parts[i]
-                if not val:
-                    continue
-                
-                if part in ('v', 'voltage'):
-                    try:
-                        data['V'] = float(val)
-                    except ValueError:
-                        continue
-                elif part in ('i', 'current'):
-                    try:
-                        data['I'] = float(val)
-                    except ValueError:
-                        continue
-                elif part in ('p', 'power'):
-                    try:
-                        data['P'] = float(val)
-                    except ValueError:
-                        continue
-                elif part in ('t_c', 'temp', 'temperature'):
-                    try:
-                        data['T'] = float(val)
-                    except ValueError:
-                        continue
-            
-            if 'V' in data and 'I' in data:
-                if 'P' not in data:
-                    data['P'] = data['V'] * data['I']
-                samples.append(data)
-        return samples
-    
+        return list(_semicolon_rows(header_parts, lines[1:]))
+
     # Sinon, utiliser le parser existant
     return parse_text_samples(text)
 
 
-def parse_xlsx_bytes(data: bytes) -> List[Dict[str, Any]]:
-    """Parse an Excel .xlsx file and extract rows as {V,I,P?,T?,t?}.
+def iter_line_blocks(stream: BinaryIO, block_size: int = READ_BLOCK_SIZE) -> Iterator[List[str]]:
+    """Decode a binary stream into lists of lines, one read block at a time.
 
+    The encoding is sniffed from the first block: a UTF-8 BOM is dropped,
+    invalid UTF-8 falls back to latin-1.
+    """
+    block = stream.read(block_size)
+    if block.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(block)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    tail = ""
+    while block:
+        lines = (tail + decoder.decode(block)).split('\n')
+        tail = lines.pop()
+        yield lines
+        block = stream.read(block_size)
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield [tail]
+
+
+def iter_xlsx_rows(source: Any, sheet: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream rows of a sheet (the active one by default) of an .xlsx file as {V,I,P?,T?,t?}.
+
+    ``source`` is a path or a binary file object. Rows are read lazily from the
+    sheet XML, so memory does not grow with the number of rows.
     Header detection by names: V/Voltage, I/Current, P/Power, T/Temp/Temperature, t/Time/Timestamp.
     If no header row is detected, assume columns A=V, B=I, C=P, D=T.
     """
@@ -127,95 +223,60 @@ def parse_xlsx_bytes(data: bytes) -> List[Dict[str, Any]]:
     except Exception as e:
         raise RuntimeError("openpyxl is required to parse .xlsx files") from e
 
-    wb = load_workbook(filename=BytesIO(data), read_only=True, data_only=True)
-    ws = wb.active
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
-        return []
+    wb = load_workbook(filename=source, read_only=True, data_only=True)
+    try:
+        rows = (wb[sheet] if sheet is not None else wb.active).iter_rows(values_only=True)
+        first = next(rows, None)
+        if first is None:
+            return
 
-    def norm(x):
-        return str(x).strip().lower() if x is not None else ""
+        def norm(x):
+            return str(x).strip().lower() if x is not None else ""
 
-    header_map = {"v": "V", "voltage": "V", "i": "I", "current": "I", "p": "P", "power": "P", "t": "t", "time": "t", "timestamp": "t", "temp": "T", "temperature": "T"}
+        header_map = {"v": "V", "voltage": "V", "i": "I", "current": "I", "p": "P", "power": "P", "t": "t", "time": "t", "timestamp": "t", "temp": "T", "temperature": "T"}
 
-    # Detect header in first row
-    first = rows[0]
-    keys = [header_map.get(norm(c), None) for c in first]
-    has_header = any(k in ("V", "I", "P", "T", "t") for k in keys)
+        # Detect header in first row
+        keys = [header_map.get(norm(c), None) for c in first]
+        has_header = any(k in ("V", "I", "P", "T", "t") for k in keys)
 
-    samples: List[Dict[str, Any]] = []
-    start_idx = 1 if has_header else 0
-
-    if has_header:
-        for row in rows[1:]:
-            data_row: Dict[str, Any] = {}
-            for idx, cell in enumerate(row):
-                mapped = keys[idx] if idx < len(keys) else None
-                if not mapped:
-                    continue
-                val = cell
-                if mapped in ("V", "I", "P", "T"):
-                    try:
-                        if val is None or val == "":
-                            continue
-                        data_row[mapped] = float(val)
-                    except Exception:
+        if has_header:
+            for row in rows:
+                data_row: Dict[str, Any] = {}
+                for idx, cell in enumerate(row):
+                    mapped = keys[idx] if idx < len(keys) else None
+                    if not mapped:
                         continue
-                elif mapped == "t":
-                    data_row["t"] = str(val) if val is not None else None
-            if "V" in data_row and "I" in data_row:
-                if "P" not in data_row:
-                    data_row["P"] = data_row["V"] * data_row["I"]
-                samples.append(data_row)
-    else:
-        # Assume A=V, B=I, C=P, D=T
-        for row in rows:
-            try:
-                V = float(row[0]) if len(row) >= 1 and row[0] is not None else None
-                I = float(row[1]) if len(row) >= 2 and row[1] is not None else None
-                P = float(row[2]) if len(row) >= 3 and row[2] not in (None, "") else None
-                T = float(row[3]) if len(row) >= 4 and row[3] not in (None, "") else None
-            except Exception:
-                continue
-            if V is None or I is None:
-                continue
-            samples.append({"V": V, "I": I, "P": P if P is not None else V * I, "T": T})
+                    val = cell
+                    if mapped in ("V", "I", "P", "T"):
+                        try:
+                            if val is None or val == "":
+                                continue
+                            data_row[mapped] = float(val)
+                        except Exception:
+                            continue
+                    elif mapped == "t":
+                        data_row["t"] = str(val) if val is not None else None
+                if "V" in data_row and "I" in data_row:
+                    if "P" not in data_row:
+                        data_row["P"] = data_row["V"] * data_row["I"]
+                    yield data_row
+        else:
+            # Assume A=V, B=I, C=P, D=T
+            for row in _chain_first(first, rows):
+                try:
+                    V = float(row[0]) if len(row) >= 1 and row[0] is not None else None
+                    I = float(row[1]) if len(row) >= 2 and row[1] is not None else None
+                    P = float(row[2]) if len(row) >= 3 and row[2] not in (None, "") else None
+                    T = float(row[3]) if len(row) >= 4 and row[3] not in (None, "") else None
+                except Exception:
+                    continue
+                if V is None or I is None:
+                    continue
+                yield {"V": V, "I": I, "P": P if P is not None else V * I, "T": T}
+    finally:
+        wb.close()
 
-    return samples
 
-    # Try plain CSV without header (V,I[,P][,T]) with ',' or ';'
-    csv_like = True
-    for ln in lines:
-        if not re.match(r"^\s*[+-]?[0-9]*\.?[0-9]+\s*[,;]\s*[+-]?[0-9]*\.?[0-9]+(\s*[,;]\s*[+-]?[0-9]*\.?[0-9]+){0,2}\s*$", ln):
-            csv_like = False
-            break
-    if csv_like:
-        for ln in lines:
-            d = ';' if ';' in ln else ','
-            parts = [p.strip() for p in ln.split(d)]
-            if len(parts) < 2:
-                continue
-            V = float(parts[0])
-            I = float(parts[1])
-            P = float(parts[2]) if len(parts) >= 3 and parts[2] != '' else V * I
-            T = float(parts[3]) if len(parts) >= 4 and parts[3] != '' else None
-            samples.append({'V': V, 'I': I, 'P': P, 'T': T})
-        return samples
-
-    # Fallback to key-value regex lines
-    for line in lines:
-        m = LINE_REGEX.search(line)
-        if not m:
-            continue
-        V = float(m.group(1))
-        I = float(m.group(2))
-        P = float(m.group(3)) if m.group(3) is not None else None
-        T = float(m.group(4)) if m.group(4) is not None else None
-        samples.append({
-            'V': V,
-            'I': I,
-            'P': P if P is not None else V * I,
-            'T': T,
-            't': datetime.utcnow().isoformat() + 'Z'
-        })
-    return samples
+def parse_xlsx_bytes(data: bytes) -> List[Dict[str, Any]]:
+    """Parse an Excel .xlsx file and extract rows as {V,I,P?,T?,t?} (see ``iter_xlsx_rows``)."""
+    return list(iter_xlsx_rows(BytesIO(data)))
@@ -0,0 +1,92 @@
+"""Opt-in sampling profiler for slow requests.
+
+With PROFILE_SLOW_SECONDS set, a background thread samples the stack of
+every thread each PROFILE_INTERVAL seconds (5 ms by default) while requests
+are in flight. A request slower than the threshold has its samples written
+to PROFILE_DIR as collapsed stacks (``thread;outer;...;inner count`` per
+line), the input of flamegraph.pl, speedscope or inferno. Sampling covers
+the whole process: other requests served by the event loop at the same
+time show up in the same file.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+# Frames kept per sampled stack, innermost first
+MAX_DEPTH = 128
+
+
+def _stack(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """Stack samples per request, kept only for requests slower than ``threshold`` seconds."""
+
+    def __init__(self, threshold: float, directory: str, interval: float = 0.005):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self._captures: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Counter:
+        """Begin sampling for a request; pass the result to ``stop``."""
+        capture: Counter = Counter()
+        with self._lock:
+            self._captures[id(capture)] = capture
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return capture
+
+    def stop(self, capture: Counter, elapsed: float, label: str) -> Optional[str]:
+        """End sampling; write the samples if the request was slow and return the file path."""
+        with self._lock:
+            self._captures.pop(id(capture), None)
+        if elapsed < self.threshold or not capture:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")
+        path = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}-{elapsed * 1e3:.0f}ms.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {n}\n" for stack, n in capture.most_common())
+        return path
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            if not self._captures:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = [f"{names.get(ident, ident)};{_stack(frame)}"
+                      for ident, frame in sys._current_frames().items() if ident != me]
+            # Under the lock: ``stop`` reads a capture once it is out of the dict
+            with self._lock:
+                for capture in self._captures.values():
+                    capture.update(stacks)
+            time.sleep(self.interval)
+
+
+def profiler_from_env() -> Optional[SlowRequestProfiler]:
+    """The profiler configured by PROFILE_SLOW_SECONDS / PROFILE_DIR / PROFILE_INTERVAL, if enabled."""
+    threshold = os.getenv("PROFILE_SLOW_SECONDS")
+    if not threshold:
+        return None
+    return SlowRequestProfiler(float(threshold), os.getenv("PROFILE_DIR", "profiles"),
+                               float(os.getenv("PROFILE_INTERVAL", "0.005")))
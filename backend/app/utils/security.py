@@ -1,4 +1,7 @@
+import hmac
 import os
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
@@ -8,19 +11,24 @@ load_dotenv()
 _security = HTTPBearer(auto_error=True)
 
 
+def token_is_valid(token: Optional[str]) -> bool:
+    """Whether ``token`` matches API_TOKEN (never true while API_TOKEN is unset)."""
+    expected = os.getenv("API_TOKEN")
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
 def verify_write_access(credentials: HTTPAuthorizationCredentials = Depends(_security)):
     """Bearer token check for write endpoints.
 
     Requires the Authorization: Bearer <token> header to match API_TOKEN in env.
     """
     token = credentials.credentials if credentials else None
-    expected = os.getenv("API_TOKEN")
-    if not expected:
+    if not os.getenv("API_TOKEN"):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Server misconfiguration: API_TOKEN is not set",
         )
-    if token != expected:
+    if not token_is_valid(token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or missing bearer token",
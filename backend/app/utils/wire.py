@@ -0,0 +1,165 @@
+"""Compact binary encoding of sample batches.
+
+A message is a sequence of blocks, each holding the samples of one device
+and source as little-endian columns::
+
+    header   "PVB1", flags u8, len(device) u8, len(source) u8, n u32
+    device   UTF-8, then source ASCII, zero-padded to a multiple of 8 bytes
+    id       int64[n]                          (FLAG_IDS)
+    t0       int64 epoch microseconds          (FLAG_TIME)
+    V, I     float64[n]
+    P        float64[n]                        (FLAG_POWER, else V*I)
+    T        float64[n], NaN where unknown     (FLAG_TEMPERATURE)
+    dt       int32[n-1] microsecond deltas     (FLAG_TIME; int64 with FLAG_WIDE_DELTAS)
+             zero-padded to a multiple of 8 bytes
+
+Columns decode with ``np.frombuffer`` straight into ``SampleColumns``; a
+sample costs 16 to 48 bytes instead of 150 to 190 in JSON. Negotiated with
+the MEDIA_TYPE content type on POST /api/samples and the WS_SUBPROTOCOL
+WebSocket subprotocol on /ws/live.
+"""
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .columnar import SampleColumns
+
+MEDIA_TYPE = "application/vnd.pv-samples"
+WS_SUBPROTOCOL = "pv-samples.v1"
+
+MAGIC = b"PVB1"
+FLAG_IDS = 1
+FLAG_TIME = 2
+FLAG_POWER = 4
+FLAG_TEMPERATURE = 8
+FLAG_WIDE_DELTAS = 16
+
+_HEADER = struct.Struct("<4sBBBI")
+_EPOCH = np.datetime64(0, "us")
+_I32 = np.iinfo(np.int32)
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def encode_columns(cols: SampleColumns, source: Optional[str] = None, power: bool = False) -> bytes:
+    """One block for ``cols`` (``source`` and ``cols.device_id`` may be None).
+
+    P is only sent with ``power`` or when it differs from V*I somewhere; T
+    only when some value is known.
+    """
+    n = len(cols)
+    device = (cols.device_id or "").encode()
+    src = (source or "").encode("ascii")
+    flags = 0
+    parts: List[bytes] = []
+    if cols.id is not None:
+        flags |= FLAG_IDS
+        parts.append(np.asarray(cols.id, dtype="<i8").tobytes())
+    deltas = b""
+    if cols.t is not None and n:
+        flags |= FLAG_TIME
+        us = (np.asarray(cols.t, dtype="datetime64[us]") - _EPOCH).astype(np.int64)
+        parts.append(struct.pack("<q", int(us[0])))
+        d = np.diff(us)
+        if len(d) and (d.min() < _I32.min or d.max() > _I32.max):
+            flags |= FLAG_WIDE_DELTAS
+            deltas = d.astype("<i8").tobytes()
+        else:
+            deltas = d.astype("<i4").tobytes()
+    parts += [cols.V.astype("<f8").tobytes(), cols.I.astype("<f8").tobytes()]
+    if power or not np.array_equal(cols.P, cols.V * cols.I):
+        flags |= FLAG_POWER
+        parts.append(cols.P.astype("<f8").tobytes())
+    if not np.isnan(cols.T).all():
+        flags |= FLAG_TEMPERATURE
+        parts.append(cols.T.astype("<f8").tobytes())
+    names = device + src
+    head = _HEADER.pack(MAGIC, flags, len(device), len(src), n) + names + b"\0" * _pad(_HEADER.size + len(names))
+    return b"".join([head, *parts, deltas, b"\0" * _pad(len(deltas))])
+
+
+def encode_rows(rows: List[Dict[str, Any]]) -> bytes:
+    """One block per run of rows (``Sample.to_dict()`` shape) sharing device and source."""
+    out = []
+    start = 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or (rows[i].get("device_id"), rows[i].get("source")) != (
+            rows[start].get("device_id"), rows[start].get("source")
+        ):
+            out.append(_encode_run(rows[start:i]))
+            start = i
+    return b"".join(out)
+
+
+def _encode_run(rows: List[Dict[str, Any]]) -> bytes:
+    n = len(rows)
+    nan = float("nan")
+    cols = SampleColumns(
+        np.fromiter((r["V"] for r in rows), dtype=np.float64, count=n),
+        np.fromiter((r["I"] for r in rows), dtype=np.float64, count=n),
+        np.fromiter((nan if r.get("P") is None else r["P"] for r in rows), dtype=np.float64, count=n),
+        np.fromiter((nan if r.get("T") is None else r["T"] for r in rows), dtype=np.float64, count=n),
+        device_id=rows[0].get("device_id"),
+    )
+    if all(r.get("t") is not None for r in rows):
+        cols.t = np.array([r["t"] for r in rows], dtype="datetime64[us]")
+    if all(r.get("id") is not None for r in rows):
+        cols.id = np.fromiter((r["id"] for r in rows), dtype=np.int64, count=n)
+    return encode_columns(cols, rows[0].get("source"))
+
+
+def decode(data: bytes) -> Iterator[Tuple[SampleColumns, Optional[str]]]:
+    """``(columns, source)`` for every block of ``data``; ValueError when malformed.
+
+    Device and source are None when the block left them empty.
+    """
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        if len(view) - pos < _HEADER.size:
+            raise ValueError("Truncated block header")
+        magic, flags, dev_len, src_len, n = _HEADER.unpack_from(view, pos)
+        if magic != MAGIC:
+            raise ValueError("Not a sample block")
+        pos += _HEADER.size
+        try:
+            device = bytes(view[pos:pos + dev_len]).decode()
+            source = bytes(view[pos + dev_len:pos + dev_len + src_len]).decode("ascii")
+        except UnicodeDecodeError as e:
+            raise ValueError("Invalid device or source name") from e
+        pos += dev_len + src_len
+        pos += _pad(pos)
+
+        has_time = bool(flags & FLAG_TIME) and n > 0
+        delta = np.dtype("<i8" if flags & FLAG_WIDE_DELTAS else "<i4")
+        columns = 2 + sum(bool(flags & f) for f in (FLAG_IDS, FLAG_POWER, FLAG_TEMPERATURE))
+        dt_size = delta.itemsize * (n - 1) if has_time else 0
+        size = 8 * n * columns + (8 if has_time else 0) + dt_size + _pad(dt_size)
+        if len(view) - pos < size:
+            raise ValueError("Truncated block")
+
+        def take(dtype, count):
+            nonlocal pos
+            arr = np.frombuffer(view, dtype=dtype, count=count, offset=pos)
+            pos += arr.nbytes
+            return arr
+
+        ids = take("<i8", n) if flags & FLAG_IDS else None
+        t0 = int(take("<i8", 1)[0]) if has_time else None
+        V, I = take("<f8", n), take("<f8", n)
+        P = take("<f8", n) if flags & FLAG_POWER else None
+        T = take("<f8", n) if flags & FLAG_TEMPERATURE else None
+        cols = SampleColumns(V, I, P, T, device_id=device or None)
+        if has_time:
+            us = np.empty(n, dtype=np.int64)
+            us[0] = t0
+            np.cumsum(take(delta, n - 1), dtype=np.int64, out=us[1:])
+            us[1:] += t0
+            cols.t = _EPOCH + us.astype("timedelta64[us]")
+            pos += _pad(dt_size)
+        if ids is not None:
+            cols.id = ids.astype(np.int64)
+        yield cols, source or None
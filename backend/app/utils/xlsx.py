@@ -0,0 +1,324 @@
+"""Streaming XLSX reader into column batches.
+
+openpyxl's read-only mode still builds a cell object per cell and a tuple per
+row, which is most of the time of a large lab export. This reader scans the
+worksheet XML straight out of the archive, a block at a time, with one
+regular expression per block, and turns each block into ``SampleColumns``:
+memory depends on the block size, not on the sheet.
+
+Header detection follows ``parser.iter_xlsx_rows`` (V/Voltage, I/Current,
+P/Power, T/Temp/Temperature, t/Time/Timestamp; without a header A=V, B=I,
+C=P, D=T). Numeric time cells are Excel serial dates. Sheets whose markup it
+does not recognise (namespace prefixes, cells without references) are read
+with openpyxl instead.
+"""
+import posixpath
+import re
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+from xml.sax.saxutils import unescape
+
+import numpy as np
+
+from . import metrics
+from .columnar import (
+    COLUMN_ALIASES,
+    COLUMN_BLOCK_ROWS,
+    MAX_LINE_ERRORS,
+    SampleColumns,
+    concat,
+    parse_times,
+)
+from .parser import iter_xlsx_rows
+
+# Decompressed worksheet XML read per step
+XML_BLOCK_BYTES = 1 << 18
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# One match per cell: column, row, type, value, inline string
+_CELL_REGEX = re.compile(
+    r'<c r="([A-Z]{1,3})([0-9]+)"(?:[^>]*? t="([a-zA-Z]+)")?[^>]*?'
+    r'(?:/>|>(?:<f\b[^>]*?/>|<f\b[^>]*>[^<]*</f>)?(?:<v>([^<]*)</v>)?(?:<is>(.*?)</is>)?</c>)',
+    re.DOTALL,
+)
+_CELL_TAG_REGEX = re.compile(r"<c[ />]")
+_TAG_REGEX = re.compile(r"<[^>]+>")
+
+# Excel day 0, and the 1904 date system of old Mac workbooks
+_EPOCH = np.datetime64("1899-12-30T00:00:00", "us")
+_EPOCH_1904 = np.datetime64("1904-01-01T00:00:00", "us")
+_US_PER_DAY = 86_400_000_000
+
+
+class _Unsupported(Exception):
+    """Worksheet markup the scanner does not handle."""
+
+
+def _column_letters(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class _Workbook:
+    """Sheet names, their parts and the shared strings of an .xlsx archive."""
+
+    def __init__(self, source: Any):
+        try:
+            self.zip = zipfile.ZipFile(source)
+            root = ElementTree.fromstring(self.zip.read("xl/workbook.xml"))
+            rels = ElementTree.fromstring(self.zip.read("xl/_rels/workbook.xml.rels"))
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+            raise ValueError(f"Not an .xlsx workbook: {e}") from e
+        targets = {r.get("Id"): r.get("Target") for r in rels.iter(f"{_PKG_REL_NS}Relationship")}
+        self.sheets: Dict[str, str] = {}
+        for sheet in root.iter(f"{_MAIN_NS}sheet"):
+            target = targets.get(sheet.get(f"{_REL_NS}id"), "")
+            path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            self.sheets[sheet.get("name")] = path
+        view = root.find(f"{_MAIN_NS}bookViews/{_MAIN_NS}workbookView")
+        active = int(view.get("activeTab", 0)) if view is not None else 0
+        names = list(self.sheets)
+        self.active = names[active] if 0 <= active < len(names) else (names[0] if names else None)
+        pr = root.find(f"{_MAIN_NS}workbookPr")
+        self.epoch = _EPOCH_1904 if pr is not None and pr.get("date1904") in ("1", "true") else _EPOCH
+        self._shared: Optional[List[str]] = None
+
+    def shared_strings(self) -> List[str]:
+        if self._shared is None:
+            self._shared = []
+            if "xl/sharedStrings.xml" in self.zip.namelist():
+                with self.zip.open("xl/sharedStrings.xml") as f:
+                    for _, el in ElementTree.iterparse(f):
+                        if el.tag == f"{_MAIN_NS}si":
+                            self._shared.append("".join(t.text or "" for t in el.iter(f"{_MAIN_NS}t")))
+                            el.clear()
+        return self._shared
+
+    def cell_text(self, kind: str, value: str, inline: str) -> str:
+        if kind == "s":
+            try:
+                return self.shared_strings()[int(value)]
+            except (ValueError, IndexError):
+                return ""
+        if kind == "inlineStr":
+            return unescape(_TAG_REGEX.sub("", inline))
+        return unescape(value)
+
+    def iter_cells(self, path: str) -> Iterator[List[Tuple[str, str, str, str, str]]]:
+        """Cells of a worksheet part, one list per block of whole rows."""
+        tail = b""
+        first = True
+        with self.zip.open(path) as f:
+            while True:
+                data = f.read(XML_BLOCK_BYTES)
+                buf = tail + data
+                cut = buf.rfind(b"</row>") + len(b"</row>") if data else len(buf)
+                if cut < len(b"</row>"):
+                    if not data:
+                        break
+                    tail = buf
+                    continue
+                text, tail = buf[:cut].decode("utf-8"), buf[cut:]
+                if first and "<sheetData" not in text and ":sheetData" in text:
+                    raise _Unsupported("namespace prefixes")
+                cells = _CELL_REGEX.findall(text)
+                if len(cells) != len(_CELL_TAG_REGEX.findall(text)):
+                    if first:
+                        raise _Unsupported("cell markup")
+                    raise ValueError("Unsupported cell markup in worksheet")
+                first = False
+                if cells:
+                    yield cells
+                if not data:
+                    break
+
+
+def _layout(wb: _Workbook, cells: List[Tuple[str, str, str, str, str]]) -> Tuple[Dict[str, str], bool]:
+    """Column letter of each field, and whether the first row is a header."""
+    first_row = cells[0][1]
+    fields: Dict[str, str] = {}
+    for letters, row, kind, value, inline in cells:
+        if row != first_row:
+            break
+        key = COLUMN_ALIASES.get(wb.cell_text(kind, value, inline).strip().lower())
+        if key and key not in fields.values():
+            fields[letters] = key
+    if any(k in fields.values() for k in ("V", "I", "P", "T", "t")):
+        return fields, True
+    return {_column_letters(i): k for i, k in enumerate(("V", "I", "P", "T"))}, False
+
+
+def _numbers(wb: _Workbook, kinds: Sequence[str], values: Sequence[str], inline: Sequence[str]) -> np.ndarray:
+    if all(k in ("", "n") for k in kinds):
+        return np.array([float(v) if v else np.nan for v in values])
+    out = np.full(len(values), np.nan)
+    for i, (k, v, s) in enumerate(zip(kinds, values, inline)):
+        if k == "e":
+            continue
+        try:
+            out[i] = float(v if k in ("", "n", "b") else wb.cell_text(k, v, s))
+        except ValueError:
+            pass
+    return out
+
+
+def _times(wb: _Workbook, kinds: Sequence[str], values: Sequence[str], inline: Sequence[str]) -> np.ndarray:
+    t = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[us]")
+    numeric = np.array([k in ("", "n") and v != "" for k, v in zip(kinds, values)], dtype=bool)
+    if numeric.any():
+        day, fraction = np.divmod(np.array([float(v) for v, n in zip(values, numeric) if n]), 1)
+        if wb.epoch == _EPOCH:
+            # Serials before 1900-03-01 count Excel's phantom 1900-02-29
+            day[(day > 0) & (day < 60)] += 1
+        # Millisecond precision, like openpyxl
+        us = day.astype(np.int64) * _US_PER_DAY + np.round(fraction * (_US_PER_DAY // 1000)).astype(np.int64) * 1000
+        t[numeric] = wb.epoch + us.astype("timedelta64[us]")
+    texts = [(i, wb.cell_text(k, v, s)) for i, (k, v, s, n) in enumerate(zip(kinds, values, inline, numeric))
+             if not n and (v or s)]
+    if texts:
+        parsed, _ = parse_times([s for _, s in texts])
+        t[[i for i, _ in texts]] = parsed
+    return t
+
+
+def _block_columns(wb: _Workbook, cells, fields: Dict[str, str], skip_row: Optional[str],
+                   label: str) -> SampleColumns:
+    """Columns of the rows of one block of cells."""
+    by_key: Dict[str, List[Tuple[str, str, str, str, str]]] = {k: [] for k in fields.values()}
+    for cell in cells:
+        key = fields.get(cell[0])
+        if key is not None and cell[1] != skip_row:
+            by_key[key].append(cell)
+    groups = {key: tuple(zip(*group)) for key, group in by_key.items() if group}
+    if not groups:
+        return SampleColumns.empty()
+    numbers = {key: np.fromiter(map(int, g[1]), np.int64, len(g[1])) for key, g in groups.items()}
+    row_ids = np.unique(np.concatenate(list(numbers.values())))
+    data: Dict[str, np.ndarray] = {}
+    present = np.zeros(len(row_ids), dtype=bool)
+    for key, (_, _, kinds, values, inline) in groups.items():
+        pos = np.searchsorted(row_ids, numbers[key])
+        if key == "t":
+            col = np.full(len(row_ids), np.datetime64("NaT"), dtype="datetime64[us]")
+            col[pos] = _times(wb, kinds, values, inline)
+            present[pos] |= np.array([bool(v or s) for v, s in zip(values, inline)])
+        else:
+            col = np.full(len(row_ids), np.nan)
+            col[pos] = _numbers(wb, kinds, values, inline)
+            present[pos] |= ~np.isnan(col[pos])
+        data[key] = col
+
+    nan = np.full(len(row_ids), np.nan)
+    V, I = data.get("V", nan), data.get("I", nan)
+    valid = ~(np.isnan(V) | np.isnan(I))
+    reasons = np.where(valid, "", "missing V or I value").astype(object)
+    if "t" in fields.values():
+        t = data.get("t", np.full(len(row_ids), np.datetime64("NaT"), dtype="datetime64[us]"))
+        reasons[valid & np.isnat(t)] = "invalid timestamp"
+        valid &= ~np.isnat(t)
+    # Rows with nothing in the mapped columns are blank, not errors
+    rejected = np.flatnonzero(~valid & present)
+    cols = SampleColumns(V[valid], I[valid], data.get("P", nan)[valid], data.get("T", nan)[valid],
+                         skipped=len(rejected),
+                         errors=[(int(row_ids[k]), f"{label}{reasons[k]}") for k in rejected[:MAX_LINE_ERRORS]])
+    if "t" in fields.values():
+        cols.t = t[valid]
+    return cols
+
+
+def _timed_block(wb: _Workbook, cells, fields: Dict[str, str], skip_row: Optional[str],
+                 label: str) -> SampleColumns:
+    with metrics.PARSE_SECONDS.time("xlsx"):
+        cols = _block_columns(wb, cells, fields, skip_row, label)
+    metrics.PARSED_LINES.inc("xlsx", amount=len(cols) + cols.skipped)
+    return cols
+
+
+def _openpyxl_columns(source: Any, sheet: str, block_rows: int) -> Iterator[SampleColumns]:
+    rows: List[Dict[str, Any]] = []
+    for row in iter_xlsx_rows(source, sheet):
+        rows.append(row)
+        if len(rows) >= block_rows:
+            yield SampleColumns.from_rows(rows)
+            rows = []
+    if rows:
+        yield SampleColumns.from_rows(rows)
+
+
+def _rebatch(parts: Iterator[SampleColumns], block_rows: int) -> Iterator[SampleColumns]:
+    """Regroup column batches into batches of exactly ``block_rows`` rows (last one shorter)."""
+    pending: List[SampleColumns] = []
+    size = 0
+    for cols in parts:
+        pending.append(cols)
+        size += len(cols)
+        while size >= block_rows:
+            merged = concat(pending)
+            head = merged.take(slice(0, block_rows))
+            rest = merged.take(slice(block_rows, None))
+            # Skips and errors go out with the batch they were found in
+            rest.skipped, rest.errors = 0, []
+            yield head
+            pending, size = [rest], len(rest)
+    merged = concat(pending)
+    if len(merged) or merged.skipped:
+        yield merged
+
+
+def sheet_names(source: Any) -> List[str]:
+    """Names of the sheets of a workbook, in order."""
+    return list(_Workbook(source).sheets)
+
+
+def iter_xlsx_columns(source: Any, sheets: Optional[Sequence[str]] = None,
+                      block_rows: int = COLUMN_BLOCK_ROWS) -> Iterator[SampleColumns]:
+    """Stream the rows of an .xlsx file as column batches of at most ``block_rows`` rows.
+
+    ``source`` is a path or a seekable binary file object. ``sheets`` names
+    the sheets to read, in order ('*' for all of them); by default the
+    active sheet. Each sheet has its own header. Rows without V or I, or with
+    an invalid time, are counted in ``skipped`` and listed in ``errors`` by
+    row number (prefixed with the sheet name when several are read).
+    """
+    wb = _Workbook(source)
+    if sheets is None:
+        names = [wb.active] if wb.active is not None else []
+    elif "*" in sheets:
+        names = list(wb.sheets)
+    else:
+        names = list(sheets)
+        missing = [n for n in names if n not in wb.sheets]
+        if missing:
+            raise ValueError(f"No sheet named {missing[0]!r} (sheets: {', '.join(wb.sheets)})")
+
+    def parts() -> Iterator[SampleColumns]:
+        for name in names:
+            label = f"{name}: " if len(names) > 1 else ""
+            blocks = wb.iter_cells(wb.sheets[name])
+            try:
+                head = next(blocks, None)
+            except _Unsupported:
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                yield from _openpyxl_columns(source, name, block_rows)
+                continue
+            if head is None:
+                continue
+            fields, header = _layout(wb, head)
+            skip_row = head[0][1] if header else None
+            yield _timed_block(wb, head, fields, skip_row, label)
+            for cells in blocks:
+                yield _timed_block(wb, cells, fields, None, label)
+
+    try:
+        yield from _rebatch(parts(), block_rows)
+    finally:
+        wb.zip.close()
@@ -0,0 +1,72 @@
+"""Batch single-diode extraction throughput on synthetic sweeps.
+
+Usage (from backend/):
+    python -m benchmarks.bench_extraction --sweeps 20000 --workers 1 4
+
+Sweeps alternate direction with drifting irradiance and series resistance,
+plus measurement noise. They are ingested into a scratch SQLite database,
+so sweep segmentation, sample reads and result writes are all included.
+``--lanes`` equal to ``--sweeps`` fits everything from cold guesses, for
+comparison with lane warm starts.
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import diode_fit as _diode_fit_model  # noqa: F401
+from app.models import sweep as _sweep_model  # noqa: F401
+from app.services.diode import diode_current
+from app.services.extraction import clear_diode_fits, extract_diode_params
+from app.services.ingest import ingest_columns
+from app.utils.columnar import SampleColumns
+
+
+def synthetic_samples(sweeps: int, points: int, seed: int = 0) -> SampleColumns:
+    rng = np.random.default_rng(seed)
+    up = np.linspace(0.0, 36.0, points)
+    V = np.concatenate([up] + [(up[::-1] if k % 2 else up)[1:] for k in range(1, sweeps)])
+    k = np.r_[0, np.repeat(np.arange(sweeps), points - 1)[:len(V) - 1]]
+    irradiance = 0.3 + 0.7 * np.abs(np.sin(k / 50.0))
+    Rs = 0.3 + 0.2 * k / sweeps
+    I = diode_current(V[:, None], 8.0 * irradiance, np.full(len(V), 1e-9), Rs,
+                      np.full(len(V), 300.0), np.full(len(V), 1.6))[:, 0]
+    I += rng.normal(0.0, 0.01, len(V))
+    t = np.datetime64(datetime(2024, 1, 1), "us") + np.arange(len(V)) * np.timedelta64(1, "s")
+    return SampleColumns(V, I, t=t)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sweeps", type=int, default=20_000)
+    p.add_argument("--points", type=int, default=40, help="samples per sweep")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    p.add_argument("--lanes", type=int, nargs="+", default=[256])
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            ingest_columns(db, synthetic_samples(args.sweeps, args.points))
+            db.commit()
+        print(f"{args.sweeps} sweeps of {args.points} points")
+        for lanes in args.lanes:
+            for workers in args.workers:
+                with Session() as db:
+                    clear_diode_fits(db)
+                    db.commit()
+                    r = extract_diode_params(db, workers=workers, lanes=lanes)
+                print(f"  lanes {lanes:>6}  workers {workers:>3}  {r['seconds']:8.2f} s  "
+                      f"{r['sweeps_per_s']:10,.0f} sweeps/s  converged {r['converged'] / max(r['sweeps'], 1):.1%}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
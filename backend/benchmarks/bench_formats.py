@@ -0,0 +1,146 @@
+"""Text parser throughput per format on synthetic inputs.
+
+Usage (from backend/):
+    python -m benchmarks.bench_formats --lines 1000000 5000000 [--formats kv json]
+
+Each format (header CSV, headerless CSV, key-value lines, JSON lines) is
+generated as I-V sweeps with a sprinkling of bad lines (``--bad-every``),
+then parsed by ``columnar.iter_columns`` (format sniffed once, one fast-path
+call per block) and, up to ``--row-mode-max`` lines, by the row parser
+``row_samples`` (the former per-line streaming parser; ``json.loads`` per line
+for JSON lines, which it does not read).
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from app.utils.columnar import COLUMN_BLOCK_ROWS, iter_columns
+from app.utils.parser import (CSV_LINE_REGEX, _chain_first, _has_vi_header, _header_rows, _key_value_row,
+                              _plain_csv_row)
+
+
+def row_samples(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Row-at-a-time baseline, one dict per line.
+
+    The format is picked from the first non-empty line (header CSV, headerless
+    CSV or key-value lines); lines that don't fit it are skipped.
+    """
+    lines = (ln.strip() for ln in lines)
+    lines = (ln for ln in lines if ln)
+    first = next(lines, None)
+    if first is None:
+        return
+
+    delim = ';' if ';' in first else ','
+    header_parts = [p.strip().lower() for p in first.split(delim)]
+    if _has_vi_header(header_parts):
+        yield from _header_rows(header_parts, lines, delim)
+        return
+
+    if CSV_LINE_REGEX.match(first):
+        for ln in _chain_first(first, lines):
+            if CSV_LINE_REGEX.match(ln):
+                yield _plain_csv_row(ln)
+        return
+
+    for line in _chain_first(first, lines):
+        row = _key_value_row(line)
+        if row is not None:
+            yield row
+
+
+def _sweep(n: int):
+    v = np.tile(np.linspace(0.0, 40.0, 100), -(-n // 100))[:n].round(3)
+    i = (8.0 * (1 - (v / 40.0) ** 12)).round(4)
+    return v.tolist(), i.tolist(), (v * i).round(3).tolist()
+
+
+def _header_csv(n: int) -> List[str]:
+    v, i, p = _sweep(n)
+    start = np.datetime64("2024-06-01T12:00:00", "ms")
+    stamps = np.datetime_as_string(start + np.arange(n) * np.timedelta64(1, "ms")).tolist()
+    return ["t,V,I,P"] + [f"{t},{a},{b},{c}" for t, a, b, c in zip(stamps, v, i, p)]
+
+
+def _plain_csv(n: int) -> List[str]:
+    v, i, p = _sweep(n)
+    return [f"{a},{b},{c},25.0" for a, b, c in zip(v, i, p)]
+
+
+def _key_value(n: int) -> List[str]:
+    v, i, p = _sweep(n)
+    return [f"V:{a}V I:{b}A P:{c}W T:25.0C" for a, b, c in zip(v, i, p)]
+
+
+def _json_lines(n: int) -> List[str]:
+    v, i, p = _sweep(n)
+    return [json.dumps({"V": a, "I": b, "P": c}) for a, b, c in zip(v, i, p)]
+
+
+FORMATS: Dict[str, Callable[[int], List[str]]] = {
+    "csv": _header_csv,
+    "plain": _plain_csv,
+    "kv": _key_value,
+    "json": _json_lines,
+}
+
+
+def _json_rows(lines: List[str]) -> int:
+    n = 0
+    for line in lines:
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(obj, dict) and "V" in obj and "I" in obj:
+            n += 1
+    return n
+
+
+def run(label: str, fn: Callable[[], int], repeat: int) -> float:
+    best, n = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<8} {n:>10} rows  {best:8.3f} s  {n / best / 1e6:7.2f} M lines/s")
+    return best
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--lines", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    p.add_argument("--formats", nargs="+", choices=sorted(FORMATS), default=list(FORMATS))
+    p.add_argument("--bad-every", type=int, default=10_000, help="one unreadable line every N lines (0: none)")
+    p.add_argument("--block-rows", type=int, default=COLUMN_BLOCK_ROWS)
+    p.add_argument("--row-mode-max", type=int, default=1_000_000)
+    p.add_argument("--repeat", type=int, default=1)
+    args = p.parse_args()
+
+    for n in args.lines:
+        for name in args.formats:
+            lines = FORMATS[name](n)
+            if args.bad_every:
+                lines[1::args.bad_every] = ["#garbage"] * len(lines[1::args.bad_every])
+            size = sum(map(len, lines)) + len(lines)
+            print(f"{name}: {n} lines ({size / 2**20:.1f} MiB)")
+
+            def columnar():
+                total = skipped = 0
+                for cols in iter_columns(lines, args.block_rows):
+                    total += len(cols)
+                    skipped += cols.skipped
+                return total
+
+            col = run("columnar", columnar, args.repeat)
+            if n <= args.row_mode_max:
+                row_fn = (lambda: _json_rows(lines)) if name == "json" else (lambda: sum(1 for _ in row_samples(lines)))
+                row = run("row", row_fn, args.repeat)
+                print(f"  speedup  {row / col:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
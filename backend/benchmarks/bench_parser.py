@@ -0,0 +1,70 @@
+"""Row vs columnar CSV parsing on iv_pv_dataset.csv scaled up.
+
+Usage (from backend/):
+    python -m benchmarks.bench_parser --rows 10000000
+
+The dataset's data lines are repeated until ``--rows`` lines are reached.
+The row parser keeps one dict per row, so it needs several GB at 10M rows;
+use ``--row-mode-max`` to skip it above a size.
+"""
+import argparse
+import io
+import time
+import tracemalloc
+from pathlib import Path
+
+from app.utils.columnar import iter_csv_columns
+from app.utils.parser import parse_csv_bytes
+
+DATASET = Path(__file__).resolve().parents[2] / "iv_pv_dataset.csv"
+
+
+def scaled_dataset(rows: int) -> bytes:
+    header, *lines = [ln for ln in DATASET.read_text().splitlines() if ln.strip()]
+    reps = -(-rows // len(lines))
+    body = "\n".join(lines) + "\n"
+    data = (header + "\n" + body * reps).encode()
+    # Trim to exactly ``rows`` data lines
+    cut = 0
+    for _ in range(rows + 1):
+        cut = data.index(b"\n", cut) + 1
+    return data[:cut]
+
+
+def run(label, fn, trace):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    n = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    mem = f"  peak {peak / 2**20:8.1f} MiB" if trace else ""
+    print(f"  {label:<10} {n:>10} rows  {elapsed:8.3f} s  {n / elapsed / 1e6:7.2f} M rows/s{mem}")
+    return elapsed
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    p.add_argument("--row-mode-max", type=int, default=10_000_000)
+    p.add_argument("--block-rows", type=int, default=100_000)
+    p.add_argument("--trace-memory", action="store_true", help="report peak Python allocations (slower)")
+    args = p.parse_args()
+
+    for rows in args.rows:
+        data = scaled_dataset(rows)
+        print(f"{rows} rows ({len(data) / 2**20:.1f} MiB)")
+        columnar = run(
+            "columnar",
+            lambda: sum(len(c) for c in iter_csv_columns(io.BytesIO(data), args.block_rows)),
+            args.trace_memory,
+        )
+        if rows <= args.row_mode_max:
+            row = run("row", lambda: len(parse_csv_bytes(data)), args.trace_memory)
+            print(f"  speedup    {row / columnar:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""GET /api/samples latency: ORM models versus the tuple + orjson read path.
+
+Usage (from backend/):
+    python -m benchmarks.bench_read --rows 100000 --limit 1000 10000 [--repeat 20]
+
+Loads ``--rows`` samples into a scratch SQLite database, then requests
+windows of ``--limit`` rows through the ASGI app (no network). ``orm`` is
+the former implementation, mounted on a side route: ``Sample`` objects
+converted to ``SampleOut`` and validated again through ``response_model``.
+``rows`` and ``columns`` are the two formats of /api/samples. Prints the
+p50 and p95 per request.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+import httpx
+import numpy as np
+from fastapi import Depends
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, get_async_db
+from app.main import app
+from app.models.sample import Sample
+from app.routers.samples import _to_out
+from app.schemas.sample import SampleOut
+from app.services.ingest import ingest_columns
+from app.utils.columnar import SampleColumns
+
+
+@app.get("/bench/orm", response_model=List[SampleOut], include_in_schema=False)
+async def _orm_samples(limit: int, db: AsyncSession = Depends(get_async_db)):
+    q = select(Sample).order_by(Sample.timestamp.asc(), Sample.id.asc()).limit(limit)
+    return [_to_out(r) for r in (await db.scalars(q)).all()]
+
+
+def _load(url: str, rows: int):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    V = np.tile(np.linspace(0.0, 40.0, 100), -(-rows // 100))[:rows]
+    I = 8.0 * (1 - (V / 40.0) ** 12)
+    t = np.datetime64(datetime(2024, 1, 1), "us") + np.arange(rows) * np.timedelta64(250, "ms")
+    with sessionmaker(bind=engine)() as db:
+        ingest_columns(db, SampleColumns(V, I, T=np.full(rows, 25.0), t=t))
+        db.commit()
+    engine.dispose()
+
+
+async def _measure(client: httpx.AsyncClient, path: str, params: dict, repeat: int) -> np.ndarray:
+    await client.get(path, params=params)  # warm up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        r = await client.get(path, params=params)
+        times.append(time.perf_counter() - start)
+        r.raise_for_status()
+    return np.array(times)
+
+
+async def _run(url: str, limits: List[int], repeat: int):
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def db():
+        async with Session() as session:
+            yield session
+
+    app.dependency_overrides[get_async_db] = db
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for limit in limits:
+                print(f"limit={limit}")
+                cases = [("orm", "/bench/orm", {"limit": limit}),
+                         ("rows", "/api/samples", {"limit": limit}),
+                         ("columns", "/api/samples", {"limit": limit, "format": "columns"})]
+                p50 = {}
+                for label, path, params in cases:
+                    times = await _measure(client, path, params, repeat)
+                    p50[label] = np.percentile(times, 50)
+                    print(f"  {label:<8} p50 {p50[label] * 1e3:8.1f} ms  p95 {np.percentile(times, 95) * 1e3:8.1f} ms")
+                print(f"  p50 speedup  rows {p50['orm'] / p50['rows']:.1f}x  columns {p50['orm'] / p50['columns']:.1f}x")
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+        await engine.dispose()
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--limit", type=int, nargs="+", default=[1000, 10000])
+    p.add_argument("--repeat", type=int, default=20)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/bench.db"
+        _load(url, args.rows)
+        asyncio.run(_run(url, args.limit, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""JSON vs binary (utils.wire) encoding of sample batches.
+
+Usage (from backend/):
+    python -m benchmarks.bench_wire --samples 1000 100000
+
+Live stream: a ``samples`` frame of ``Sample.to_dict()`` rows as sent to
+dashboards, JSON vs ``wire.encode_rows``. Ingest: a POST /api/samples body
+decoded into columns, JSON + pydantic ``SampleIn`` vs ``wire.decode``.
+Reports time per sample and bytes per sample.
+"""
+import argparse
+import json
+import time
+from typing import List
+
+import numpy as np
+from pydantic import parse_obj_as
+
+from app.schemas.sample import SampleIn
+from app.services.websocket import samples_to_message
+from app.utils import wire
+from app.utils.columnar import SampleColumns
+
+
+def sweep_columns(n: int) -> SampleColumns:
+    """Back-to-back 100-point sweeps at 1 kHz, with temperature."""
+    v = np.tile(np.linspace(0.0, 40.0, 100), -(-n // 100))[:n]
+    cols = SampleColumns(v, 8.0 * (1 - (v / 40.0) ** 12), T=25.0 + np.random.default_rng(0).random(n),
+                         device_id="roof-east")
+    cols.t = np.datetime64("2024-06-01T12:00:00", "us") + np.arange(n) * np.timedelta64(1000, "us")
+    cols.id = np.arange(1, n + 1)
+    return cols
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(label: str, n: int, seconds: float, size: int):
+    print(f"  {label:<22} {seconds / n * 1e6:8.3f} us/sample  {size / n:7.1f} B/sample")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--samples", type=int, nargs="+", default=[1_000, 100_000])
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    for n in args.samples:
+        cols = sweep_columns(n)
+        rows: List[dict] = list(cols.iter_dicts("SERIAL"))
+        print(f"{n} samples")
+
+        print(" live frame")
+        text = json.dumps(samples_to_message(rows), default=str)
+        report("json encode", n, timed(lambda: json.dumps(samples_to_message(rows), default=str), args.repeat),
+               len(text.encode()))
+        report("json decode", n, timed(lambda: json.loads(text), args.repeat), len(text.encode()))
+        blob = wire.encode_rows(rows)
+        report("binary encode (rows)", n, timed(lambda: wire.encode_rows(rows), args.repeat), len(blob))
+        report("binary encode (cols)", n, timed(lambda: wire.encode_columns(cols, "SERIAL"), args.repeat),
+               len(blob))
+        report("binary decode", n, timed(lambda: list(wire.decode(blob)), args.repeat), len(blob))
+
+        print(" ingest body -> columns")
+        body = json.dumps([{"t": r["t"], "V": r["V"], "I": r["I"], "T": r["T"], "source": "SERIAL",
+                            "device_id": r["device_id"]} for r in rows]).encode()
+
+        def json_ingest():
+            items = parse_obj_as(List[SampleIn], json.loads(body))
+            SampleColumns([s.V for s in items], [s.I for s in items], [s.P for s in items],
+                          [s.T for s in items], np.array([s.t for s in items], dtype="datetime64[us]"))
+
+        cols.id = None
+        upload = wire.encode_columns(cols, "SERIAL")
+        report("json + pydantic", n, timed(json_ingest, args.repeat), len(body))
+        report("binary", n, timed(lambda: list(wire.decode(upload)), args.repeat), len(upload))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""XLSX import: openpyxl rows versus the streaming column reader.
+
+Usage (from backend/):
+    python -m benchmarks.bench_xlsx --rows 200000 [--sheets 2] [--file big.xlsx]
+
+Writes a workbook of I-V sweeps (t, V, I, P, T; ``--sheets`` sheets of
+``--rows`` rows each) unless ``--file`` already exists, then reads every
+sheet in IMPORT_CHUNK_SIZE batches, as /api/import/file does, both with
+``parser.iter_xlsx_rows`` + ``SampleColumns.from_rows`` (the former path)
+and with ``xlsx.iter_xlsx_columns``. Time is measured without tracing; the
+peak Python memory comes from a second, traced run.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from app.routers.samples import IMPORT_CHUNK_SIZE
+from app.services.ingest import iter_chunks
+from app.utils.columnar import SampleColumns
+from app.utils.parser import iter_xlsx_rows
+from app.utils.xlsx import iter_xlsx_columns
+
+
+def write_workbook(path: str, rows: int, sheets: int):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    start = datetime(2024, 6, 1, 12)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"panel{s + 1}")
+        ws.append(["t", "V", "I", "P", "T"])
+        for k in range(rows):
+            v = round((k % 100) * 0.4, 3)
+            i = round(8.0 * (1 - (v / 40.0) ** 12), 4)
+            ws.append([start + timedelta(seconds=k), v, i, round(v * i, 3), 25.0])
+    wb.save(path)
+
+
+def _rows(path: str, sheets: List[str]) -> int:
+    n = 0
+    for sheet in sheets:
+        for chunk in iter_chunks(iter_xlsx_rows(path, sheet), IMPORT_CHUNK_SIZE):
+            n += len(SampleColumns.from_rows(chunk))
+    return n
+
+
+def _columns(path: str, sheets: List[str]) -> int:
+    return sum(len(cols) for cols in iter_xlsx_columns(path, sheets, IMPORT_CHUNK_SIZE))
+
+
+def run(label: str, fn: Callable[[], int]) -> float:
+    start = time.perf_counter()
+    n = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<8} {n:>9} rows  {elapsed:8.2f} s  {n / elapsed / 1e3:8.1f} k rows/s  peak {peak / 2**20:7.1f} MiB")
+    return elapsed
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=200_000, help="rows per sheet")
+    p.add_argument("--sheets", type=int, default=1)
+    p.add_argument("--file", help="workbook to read (written first if missing)")
+    args = p.parse_args()
+
+    path = args.file or os.path.join(tempfile.gettempdir(), f"bench_{args.sheets}x{args.rows}.xlsx")
+    if not os.path.exists(path):
+        print(f"writing {path}")
+        write_workbook(path, args.rows, args.sheets)
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    sheets = wb.sheetnames
+    wb.close()
+    print(f"{path}: {len(sheets)} sheet(s), {os.path.getsize(path) / 2**20:.1f} MiB")
+
+    old = run("openpyxl", lambda: _rows(path, sheets))
+    new = run("columns", lambda: _columns(path, sheets))
+    print(f"  speedup  {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Synthetic inputs derived from iv_pv_dataset.csv, at any size.
+
+The dataset's sweep (V, I, P) is repeated, one sample per second from
+2024-01-01, with a tiny per-repetition offset on V so timed samples do not
+collide in deduplication. Every format below carries the same samples.
+"""
+import io
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.utils.columnar import SampleColumns
+
+DATASET = Path(__file__).resolve().parents[2] / "iv_pv_dataset.csv"
+
+# Named sizes of the benchmark suite
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+
+START = np.datetime64("2024-01-01T00:00:00", "us")
+
+
+def _sweep() -> np.ndarray:
+    return np.loadtxt(DATASET, delimiter=";", skiprows=1, ndmin=2)
+
+
+def columns(n: int) -> SampleColumns:
+    """``n`` timed samples with V, I, P and T."""
+    base = _sweep()
+    reps = -(-n // len(base))
+    data = np.tile(base, (reps, 1))[:n]
+    V = data[:, 0] + np.repeat(np.arange(reps) % 1000 * 1e-4, len(base))[:n]
+    t = START + np.arange(n) * np.timedelta64(1, "s")
+    return SampleColumns(V.round(4), data[:, 1], data[:, 2], np.full(n, 25.0), t=t)
+
+
+def _fields(n: int):
+    cols = columns(n)
+    stamps = np.datetime_as_string(cols.t, unit="s").tolist()
+    return stamps, cols.V.tolist(), cols.I.tolist(), cols.P.tolist()
+
+
+def rows(n: int) -> List[Dict[str, Any]]:
+    """Samples as the row dicts of ``utils.parser`` (input of ``compute_mpp``)."""
+    cols = columns(n)
+    t = cols.t.astype(object)
+    return [{"t": ts, "V": v, "I": i, "P": p, "T": 25.0}
+            for ts, v, i, p in zip(t, cols.V.tolist(), cols.I.tolist(), cols.P.tolist())]
+
+
+def csv_bytes(n: int) -> bytes:
+    """Semicolon CSV with a t;V;I;P header, like the dataset file plus timestamps."""
+    stamps, V, I, P = _fields(n)
+    return ("t;V;I;P\n" + "".join(f"{t};{v};{i};{p}\n" for t, v, i, p in zip(stamps, V, I, P))).encode()
+
+
+def text(n: int) -> str:
+    """Serial-monitor lines, ``V:..V I:..A P:..W``."""
+    _, V, I, P = _fields(n)
+    return "\n".join(f"V:{v}V I:{i}A P:{p}W" for v, i, p in zip(V, I, P))
+
+
+def json_payload(n: int) -> List[Dict[str, Any]]:
+    """Body of ``POST /api/samples``."""
+    stamps, V, I, P = _fields(n)
+    return [{"t": t, "V": v, "I": i, "P": p} for t, v, i, p in zip(stamps, V, I, P)]
+
+
+def xlsx_bytes(n: int) -> bytes:
+    """Workbook with one sheet of t, V, I, P, T rows."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("samples")
+    ws.append(["t", "V", "I", "P", "T"])
+    for r in rows(n):
+        ws.append([r["t"], r["V"], r["I"], r["P"], r["T"]])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
@@ -0,0 +1,341 @@
+"""Microbenchmarks of the hot paths, with JSON baselines.
+
+Usage (from backend/):
+    python -m benchmarks.suite [--sizes 1k 100k] [--cases parse_csv_bytes list_samples] \\
+        [--save baseline.json] [--compare baseline.json --threshold 0.25]
+
+Each case runs ``--repeat`` times per size (``benchmarks.datasets.SIZES``)
+on inputs derived from iv_pv_dataset.csv; the median and best times are
+printed and, with ``--save``, written to a JSON baseline. ``--compare``
+reads a baseline and flags every case whose median is more than
+``--threshold`` slower; the exit status is 1 when one is. Endpoints are
+called through the ASGI app (no network) on a scratch SQLite database,
+with the event bus subscribers running as in the server. Cases skip sizes
+above their ``max_rows`` (row dicts or openpyxl would take minutes or GBs)
+unless ``--no-limits`` is given.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import datasets
+
+# Setup of one case at one size: (run, reset); ``run`` returns the rows it handled
+Setup = Callable[[int], Awaitable[Tuple[Callable[[], Any], Optional[Callable[[], Any]]]]]
+
+CASES: Dict[str, Tuple[Setup, Optional[int]]] = {}
+
+TOKEN = "bench"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+# Samples per POST /api/samples request
+POST_BATCH = 1000
+# Connected /ws/live clients of the broadcast case
+SOCKETS = 100
+
+
+def case(max_rows: Optional[int] = None):
+    def register(setup: Setup) -> Setup:
+        CASES[setup.__name__] = (setup, max_rows)
+        return setup
+    return register
+
+
+class _Env:
+    """The app on a scratch database, imported on first use."""
+
+    client = None
+
+    @classmethod
+    def app_client(cls):
+        if cls.client is None:
+            import httpx
+            from app.main import app
+
+            cls.client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=None)
+        return cls.client
+
+    @staticmethod
+    async def reset():
+        r = await _Env.app_client().delete("/api/samples", headers=AUTH)
+        r.raise_for_status()
+
+    @staticmethod
+    async def load(n: int):
+        from app.database import SessionLocal
+        from app.services.ingest import ingest_columns
+
+        await _Env.reset()
+        with SessionLocal() as db:
+            ingest_columns(db, datasets.columns(n))
+            db.commit()
+
+    @staticmethod
+    def uncached():
+        from app.services.response_cache import response_cache
+
+        # Queried every time, not answered from the response cache
+        response_cache.clear()
+
+
+async def _call(fn):
+    result = fn()
+    return await result if inspect.isawaitable(result) else result
+
+
+@case(max_rows=1_000_000)
+async def parse_text_samples(n: int):
+    from app.utils.parser import parse_text_samples as parse
+
+    text = datasets.text(n)
+    return (lambda: len(parse(text))), None
+
+
+@case(max_rows=1_000_000)
+async def parse_csv_bytes(n: int):
+    from app.utils.parser import parse_csv_bytes as parse
+
+    data = datasets.csv_bytes(n)
+    return (lambda: len(parse(data))), None
+
+
+@case(max_rows=100_000)
+async def parse_xlsx_bytes(n: int):
+    from app.utils.parser import parse_xlsx_bytes as parse
+
+    data = datasets.xlsx_bytes(n)
+    return (lambda: len(parse(data))), None
+
+
+@case(max_rows=1_000_000)
+async def compute_mpp(n: int):
+    from app.services.mpp import compute_mpp as compute
+
+    rows = datasets.rows(n)
+
+    def run():
+        compute(rows)
+        return n
+
+    return run, None
+
+
+@case(max_rows=100_000)
+async def create_samples(n: int):
+    payload = datasets.json_payload(n)
+    client = _Env.app_client()
+
+    async def run():
+        for i in range(0, n, POST_BATCH):
+            r = await client.post("/api/samples", json=payload[i:i + POST_BATCH], headers=AUTH)
+            r.raise_for_status()
+        return n
+
+    return run, _Env.reset
+
+
+@case()
+async def import_file(n: int):
+    data = datasets.csv_bytes(n)
+    client = _Env.app_client()
+
+    async def run():
+        r = await client.post("/api/import/file", files={"file": ("bench.csv", data, "text/csv")}, headers=AUTH)
+        r.raise_for_status()
+        return r.json()["imported"]
+
+    return run, _Env.reset
+
+
+@case()
+async def list_samples(n: int):
+    await _Env.load(n)
+    client = _Env.app_client()
+    # A full page from the middle of the history
+    start = str(datasets.START + (n // 2) * np.timedelta64(1, "s"))
+    params = {"from": start, "limit": min(n, 10_000)}
+
+    async def run():
+        r = await client.get("/api/samples", params=params)
+        r.raise_for_status()
+        return len(r.json())
+
+    return run, _Env.uncached
+
+
+@case()
+async def list_samples_cached(n: int):
+    run, _ = await list_samples(n)
+    await run()
+    client = _Env.app_client()
+    start = str(datasets.START + (n // 2) * np.timedelta64(1, "s"))
+    params = {"from": start, "limit": min(n, 10_000)}
+    etag = (await client.get("/api/samples", params=params)).headers["etag"]
+
+    async def revalidate():
+        # What a polling dashboard sends: answered 304 from the cache
+        r = await client.get("/api/samples", params=params, headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        return min(n, 10_000)
+
+    return revalidate, None
+
+
+@case()
+async def get_mpp(n: int):
+    await _Env.load(n)
+    client = _Env.app_client()
+
+    async def run():
+        # A window: queried, not the running maximum of the cache
+        r = await client.get("/api/mpp", params={"from": "2000-01-01T00:00:00"})
+        r.raise_for_status()
+        return n
+
+    return run, _Env.uncached
+
+
+class FakeSocket:
+    """Just enough of a starlette WebSocket for ``ConnectionManager``."""
+
+    def __init__(self):
+        self.frames = 0
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text: str):
+        self.frames += 1
+
+    async def send_bytes(self, data: bytes):
+        self.frames += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+@case(max_rows=1_000_000)
+async def broadcast(n: int):
+    from app.services.events import SamplesCommitted
+    from app.services.websocket import ConnectionManager
+
+    manager = ConnectionManager()
+    for _ in range(SOCKETS):
+        await manager.connect(FakeSocket())
+    cols = datasets.columns(n)
+    cols.device_id = "bench"
+
+    async def run():
+        # A committed batch fanned out to every client, then a control message
+        await manager.on_committed(SamplesCommitted(columns=cols, source="IMPORT"))
+        await manager.broadcast({"type": "reset", "deleted": 0})
+        await manager.drain()
+        return n
+
+    return run, None
+
+
+async def measure(name: str, n: int, repeat: int) -> Dict[str, Any]:
+    setup, _ = CASES[name]
+    run, reset = await setup(n)
+    times = []
+    handled = 0
+    for _ in range(repeat):
+        if reset is not None:
+            await _call(reset)
+        start = time.perf_counter()
+        handled = await _call(run)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {"rows": n, "handled": handled, "repeat": repeat, "median_s": median, "min_s": min(times),
+            "rows_per_s": n / median if median else None}
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[str]:
+    """Keys of the results whose median is more than ``threshold`` above the baseline's."""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"  {key:<28} (no baseline)")
+            continue
+        ratio = res["median_s"] / base["median_s"]
+        flag = ratio > 1 + threshold
+        if flag:
+            regressions.append(key)
+        print(f"  {key:<28} {base['median_s'] * 1e3:10.2f} ms -> {res['median_s'] * 1e3:10.2f} ms  "
+              f"{ratio:6.2f}x{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+async def _main(args) -> int:
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for name in args.cases:
+            _, max_rows = CASES[name]
+            for size in args.sizes:
+                n = datasets.SIZES[size]
+                key = f"{name}[{size}]"
+                if max_rows is not None and n > max_rows and not args.no_limits:
+                    print(f"  {key:<28} skipped (above {max_rows} rows)")
+                    continue
+                res = results[key] = await measure(name, n, args.repeat)
+                print(f"  {key:<28} median {res['median_s'] * 1e3:10.2f} ms  best {res['min_s'] * 1e3:10.2f} ms  "
+                      f"{res['rows_per_s'] / 1e3:10.1f} k rows/s")
+    finally:
+        if _Env.client is not None:
+            await _Env.client.aclose()
+            from app.services.events import bus
+
+            await bus.stop()
+
+    if args.save:
+        doc = {"meta": {"date": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+                        "platform": platform.platform(), "machine": platform.machine(), "repeat": args.repeat},
+               "results": results}
+        with open(args.save, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print(f"against {args.compare} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    p.add_argument("--sizes", nargs="+", choices=list(datasets.SIZES), default=["1k", "100k"])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--save", help="write the results to this JSON baseline")
+    p.add_argument("--compare", help="JSON baseline to compare the results with")
+    p.add_argument("--threshold", type=float, default=0.25, help="tolerated slowdown of the median (0.25: 25%%)")
+    p.add_argument("--no-limits", action="store_true", help="run every case at every size")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before the app is imported: it creates its schema on DATABASE_URL
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/suite.db"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ["API_TOKEN"] = TOKEN
+        sys.exit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    main()
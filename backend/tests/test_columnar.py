@@ -0,0 +1,76 @@
+import io
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.columnar import TextParser, concat, iter_csv_columns, parse_text_columns
+from app.utils.parser import parse_csv_bytes, parse_text_samples
+
+DATASET = Path(__file__).resolve().parents[2] / "iv_pv_dataset.csv"
+
+
+def test_csv_columns_match_row_parser():
+    data = DATASET.read_bytes()
+    rows = parse_csv_bytes(data)
+    cols = concat(list(iter_csv_columns(io.BytesIO(data), block_rows=16)))
+    assert len(cols) == len(rows)
+    assert np.allclose(cols.V, [r["V"] for r in rows])
+    assert np.allclose(cols.P, [r["P"] for r in rows])
+
+
+def test_text_columns_header_aliases_and_fallback():
+    text = "timestamp,voltage,current,temp\n2024-01-01T00:00:00,10,2,25\n2024-01-01T00:00:01,5,1,26\n"
+    cols = parse_text_columns(text)
+    assert cols.P.tolist() == [20.0, 5.0]
+    assert cols.T.tolist() == [25.0, 26.0]
+    assert str(cols.t[1]) == "2024-01-01T00:00:01.000000"
+
+    # Empty cells and key-value lines go through the row parser
+    export = b"V;I;P\n1;2;\n3;4;5\n"
+    assert concat(list(iter_csv_columns(io.BytesIO(export)))).P.tolist() == [2.0, 5.0]
+    kv = "V:20.2V I:0.10A P:2.1W\nnoise\nV:10V I:2A"
+    assert parse_text_columns(kv).P.tolist() == [r["P"] for r in parse_text_samples(kv)]
+
+
+def test_concat_stamps_parts_without_times():
+    timed = parse_text_columns("t,V,I\n2024-01-01T00:00:00,1,2\n")
+    untimed = parse_text_columns("1,2\n3,4\n")
+    cols = concat([timed, untimed])
+    assert len(cols) == 3
+    assert str(cols.t[0]) == "2024-01-01T00:00:00.000000"
+    assert not np.isnat(cols.t).any()
+
+
+def test_sniffs_format_from_prefix_and_reports_errors():
+    # A banner line does not decide the format; other formats are still read
+    cols = parse_text_columns("booting v1.2\nV:1V I:2A\n\nV:3V I:4A T:25C\n5,6\n")
+    assert cols.V.tolist() == [1.0, 3.0, 5.0]
+    assert cols.T[1] == 25.0 and cols.t is not None
+    assert cols.skipped == 1 and cols.errors == [(1, "no V:..V I:..A values")]
+
+    cols = parse_text_columns("t,V,I\n2024-01-01T00:00:00,1,2\nbad,3,4\n1,2\n2024-01-01T00:00:02,x,4\n")
+    assert cols.V.tolist() == [1.0]
+    assert cols.errors == [(3, "invalid timestamp"), (4, "expected 3 fields, got 2"), (5, "invalid number 'x'")]
+
+
+def test_json_lines_and_key_value_block_paths():
+    cols = parse_text_columns('{"V": 1, "I": 2, "P": 9}\n{"V": 3, "I": 4, "T": 30}\n')
+    assert cols.P.tolist() == [9.0, 12.0] and cols.T[1] == 30.0 and cols.t is None
+    cols = parse_text_columns('{"V": 1, "I": 2}\n{"V": 3, "I": 4, "t": "2024-01-01T00:00:00"}\n{"V": "x"}')
+    assert len(cols) == 2 and str(cols.t[1]) == "2024-01-01T00:00:00.000000"
+    assert cols.errors == [(3, "non-numeric V, I, P or T")]
+
+    text = "\n".join(f"V:{v}V I:{v / 10}A P:{v}W T:2{v % 10}°C" for v in range(50))
+    assert parse_text_columns(text).T.tolist() == [r["T"] for r in parse_text_samples(text)]
+
+
+def test_parser_reuses_sniffed_layout():
+    parser = TextParser()
+    assert parser.parse("t,V,I\n2024-01-01T00:00:00,1,2").V.tolist() == [1.0]
+    # Later texts continue the header CSV until one starts with another format
+    assert str(parser.parse("2024-01-01T00:00:01,3,4").t[0]) == "2024-01-01T00:00:01.000000"
+    assert parser.parse("5,6\n7,8").V.tolist() == [5.0, 7.0]
+    assert parser.layout.header is None
+
+    rows = list(TextParser().rows(["V:1V I:2A", "3,4", "junk", '{"V": 1, "I": 1}']))
+    assert [(r["V"], r["I"]) for r in rows] == [(1.0, 2.0), (3.0, 4.0), (1.0, 1.0)]
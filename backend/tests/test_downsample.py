@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.services.downsample import downsample_indices, lttb_indices, minmax_indices
+
+
+def test_lttb_keeps_endpoints_and_size():
+    y = np.sin(np.linspace(0, 20, 10_000))
+    idx = lttb_indices(y, 500)
+    assert len(idx) == 500
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert np.all(np.diff(idx) > 0)
+
+
+def test_minmax_keeps_bucket_extremes():
+    y = np.zeros(1000)
+    y[123], y[456] = 5.0, -5.0
+    idx = minmax_indices(y, 20)
+    assert 123 in idx and 456 in idx
+    assert len(idx) <= 20
+
+
+def test_downsample_always_keeps_mpp():
+    rng = np.random.default_rng(1)
+    p = rng.random(100_000)
+    p[54_321] = 10.0
+    for method in ("lttb", "minmax"):
+        idx = downsample_indices(p, 1000, method)
+        assert 54_321 in idx
+        assert len(idx) <= 1001
+    assert len(downsample_indices(p[:10], 1000)) == 10
+
+
+
+def test_lttb_uses_time_axis():
+    # Irregular sampling (idle periods between sweeps): areas must be taken on t
+    rng = np.random.default_rng(0)
+    p = rng.random(1000)
+    t = np.cumsum(rng.exponential(1.0, 1000) ** 3)
+    by_time = downsample_indices(p, 50, "lttb", t)
+    assert np.array_equal(by_time, np.union1d(lttb_indices(p, 50, t), [int(np.argmax(p))]))
+    assert not np.array_equal(by_time, downsample_indices(p, 50, "lttb"))
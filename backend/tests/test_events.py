@@ -0,0 +1,45 @@
+import asyncio
+
+from app.services.events import EventBus
+
+
+def test_background_subscribers_run_in_order_without_blocking_publish():
+    async def run():
+        bus = EventBus()
+        inline, fast, slow = [], [], []
+        gate = asyncio.Event()
+
+        async def stalled(event):
+            await gate.wait()
+            slow.append(event)
+
+        def broken(event):
+            raise RuntimeError("boom")
+
+        bus.subscribe("t", inline.append, inline=True)
+        bus.subscribe("t", broken)
+        bus.subscribe("t", fast.append)
+        bus.subscribe("t", stalled)
+        for i in range(3):
+            bus.publish("t", i)
+        # Inline subscribers have seen the events before publish returns
+        assert inline == [0, 1, 2]
+        await asyncio.sleep(0.01)
+        assert fast == [0, 1, 2] and slow == []
+        gate.set()
+        await bus.stop(timeout=1)
+        return slow
+
+    assert asyncio.run(run()) == [0, 1, 2]
+
+
+def test_full_subscriber_queue_drops_events():
+    async def run():
+        bus = EventBus(queue_size=2)
+        bus.subscribe("t", lambda e: None)
+        for i in range(5):
+            bus.publish("t", i)
+        await bus.stop(timeout=1)
+        return bus.dropped
+
+    assert asyncio.run(run()) == 3
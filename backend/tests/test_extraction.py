@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.diode_fit import DiodeFit
+from app.services.diode import diode_current
+from app.services.extraction import clear_diode_fits, extract_diode_params, fit_block
+from app.services.ingest import ingest_columns
+from app.services.sweeps import clear_sweeps
+from app.utils.columnar import SampleColumns
+
+engine = create_engine("sqlite:///:memory:")
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _sweeps(n, points=30):
+    """Rising sweeps 10 min apart; Rs rises from 0.3 to 0.5 ohm as irradiance falls."""
+    V = np.tile(np.linspace(0.0, 36.0, points), n)
+    k = np.repeat(np.arange(n), points)
+    Rs = 0.3 + 0.2 * k / (n - 1)
+    I = diode_current(V[:, None], 8.0 - 0.2 * k, np.full(len(V), 1e-9), Rs,
+                      np.full(len(V), 300.0), np.full(len(V), 1.6))[:, 0]
+    secs = k * 600 + np.tile(np.arange(points), n)
+    t = np.datetime64(datetime(2024, 1, 1), "us") + secs * np.timedelta64(1, "s")
+    return SampleColumns(V, I, T=np.full(len(V), 25.0), t=t)
+
+
+def test_fit_block_warm_starts_along_lanes():
+    V = np.tile(np.linspace(0.0, 36.0, 30), (8, 1))
+    IL = np.linspace(8.0, 6.0, 8)
+    I = diode_current(V, IL, np.full(8, 1e-9), np.full(8, 0.3), np.full(8, 300.0), np.full(8, 1.6))
+    mask = np.ones(V.shape, dtype=bool)
+    warm = fit_block(V, I, mask, lanes=2)
+    cold = fit_block(V, I, mask, lanes=8)
+    assert warm["converged"].all() and np.allclose(warm["IL"], IL, rtol=1e-6)
+    assert warm["iterations"].sum() < cold["iterations"].sum()
+
+
+def test_extract_writes_one_fit_per_closed_sweep():
+    with TestingSessionLocal() as db:
+        ingest_columns(db, _sweeps(12))
+        db.commit()
+
+        r = extract_diode_params(db, workers=1, lanes=3)
+        # The last sweep is still open
+        assert r["sweeps"] == 11 and r["converged"] == 11
+        fits = db.scalars(select(DiodeFit).order_by(DiodeFit.start_time)).all()
+        rs = [f.series_resistance for f in fits]
+        assert np.allclose(rs, 0.3 + 0.2 * np.arange(11) / 11, rtol=1e-6)
+        # a = 1.6 V over 36 cells at 25 °C
+        assert abs(fits[0].ideality - 1.6 / (36 * 8.617333262e-5 * 298.15)) < 1e-3
+        assert fits[0].n_points == 30 and fits[0].temperature == 25.0
+
+        assert extract_diode_params(db, workers=1)["sweeps"] == 0
+
+        # Same results through the process pool
+        clear_diode_fits(db)
+        db.commit()
+        assert extract_diode_params(db, workers=2, lanes=3)["converged"] == 11
+        assert np.allclose([f.series_resistance for f in db.scalars(
+            select(DiodeFit).order_by(DiodeFit.start_time))], rs)
+
+        clear_sweeps(db)
+        db.commit()
+        assert db.scalar(select(func.count()).select_from(DiodeFit)) == 0
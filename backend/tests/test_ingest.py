@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.sample import Sample
+from app.services.ingest import _insert_returning, ingest_rows, make_row
+
+engine = create_engine("sqlite:///:memory:")
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_ingest_rows_dedupes_and_updates_existing():
+    t0 = datetime(2024, 1, 1, 12, 0, 0)
+    db = TestingSessionLocal()
+    try:
+        db.query(Sample).delete()
+        first = ingest_rows(db, [make_row(10.0, 3.0, t=t0), make_row(5.0, 4.0)])
+        db.commit()
+        assert [s["P"] for s in first] == [30.0, 20.0]
+
+        # Same (t, V, I) as an existing row plus an in-batch duplicate of a new row
+        again = ingest_rows(db, [
+            make_row(10.0, 3.0, T=41.5, t=t0),
+            make_row(1.0, 1.0, t=t0),
+            make_row(1.0, 1.0, T=25.0, t=t0),
+        ])
+        db.commit()
+
+        assert again[0]["id"] == first[0]["id"]
+        assert again[0]["T"] == 41.5
+        assert again[1]["id"] == again[2]["id"]
+        assert db.query(Sample).count() == 3
+        assert db.get(Sample, again[1]["id"]).temperature == 25.0
+    finally:
+        db.close()
+
+
+def test_ingest_rows_without_dedupe_inserts_everything():
+    t0 = datetime(2024, 1, 2)
+    db = TestingSessionLocal()
+    try:
+        db.query(Sample).delete()
+        rows = [make_row(float(i), 0.5, t=t0) for i in range(2000)]
+        created = ingest_rows(db, rows + rows, dedupe=False)
+        db.commit()
+        assert len({s["id"] for s in created}) == 4000
+        assert created[1]["V"] == 1.0
+    finally:
+        db.close()
+
+
+def test_insert_returning_matches_ids_whatever_the_returned_order():
+    t0 = datetime(2024, 1, 3)
+    db = TestingSessionLocal()
+    try:
+        db.query(Sample).delete()
+        conn = db.connection()
+
+        class Shuffled:
+            # PostgreSQL may return the rows of a multi-row INSERT in any order
+            def execute(self, stmt, params):
+                rows = conn.execute(stmt, params).all()
+                return type("Result", (), {"all": lambda _: rows[::-1]})()
+
+        rows = [make_row(float(i), 0.5, t=t0) for i in range(5)] + [make_row(1.0, 0.5, t=t0)]
+        ids = _insert_returning(Shuffled(), rows)
+        db.commit()
+        assert [db.get(Sample, i).voltage for i in ids] == [0.0, 1.0, 2.0, 3.0, 4.0, 1.0]
+        assert ids[1] < ids[5]
+    finally:
+        db.close()
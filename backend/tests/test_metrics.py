@@ -0,0 +1,36 @@
+import time
+
+from app.utils import metrics
+from app.utils.profiler import SlowRequestProfiler
+
+
+def test_histogram_and_counter_exposition():
+    hist = metrics.Histogram("test_latency_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, '/a"b')
+    counter = metrics.Counter("test_rows_total", "Test rows.")
+    counter.inc(amount=5)
+    text = metrics.render()
+    assert "# TYPE test_latency_seconds histogram\n" in text
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 1\n' in text
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="1"} 3\n' in text
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4\n' in text
+    assert 'test_latency_seconds_sum{route="/a\\"b"} 4.05\n' in text
+    assert 'test_latency_seconds_count{route="/a\\"b"} 4\n' in text
+    assert "test_rows_total 5\n" in text
+
+
+def test_slow_request_profiler_writes_collapsed_stacks(tmp_path):
+    profiler = SlowRequestProfiler(0.05, str(tmp_path), interval=0.001)
+    fast = profiler.start()
+    assert profiler.stop(fast, 0.001, "GET /fast") is None
+
+    capture = profiler.start()
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    path = profiler.stop(capture, 0.1, "GET /api/samples")
+    assert path is not None and "GET_api_samples" in path
+    lines = open(path).read().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("test_slow_request_profiler_writes_collapsed_stacks" in line for line in lines)
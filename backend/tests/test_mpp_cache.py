@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from app.services import mpp
+from app.services.events import EventBus
+
+
+def _stale_query(cache, committed, reset=False):
+    """A query_mpp that returns what the table held before ``committed`` landed mid-query."""
+    def query(db, dt_from=None, dt_to=None, device_id=None):
+        if reset:
+            cache.on_deleted(1)
+        cache.observe(*committed)
+        return {"id": 1, "device_id": "a", "V": 10.0, "I": 1.0, "P": 10.0, "t": datetime(2024, 1, 1), "index": 0}
+    return query
+
+
+def test_batches_committed_during_the_first_load_are_folded_in(monkeypatch):
+    monkeypatch.setattr(mpp, "bus", EventBus())
+    cache = mpp.MPPCache()
+    batch = ([2], [datetime(2024, 1, 2)], [20.0], [1.0], [20.0], "a")
+    monkeypatch.setattr(mpp, "query_mpp", _stale_query(cache, batch))
+    cache._load(None, "a")
+    assert cache._best["a"]["P"] == 20.0 and not cache._loading
+
+    # A reset during the load: the loaded row is gone, the batch after it stays
+    cache = mpp.MPPCache()
+    small = ([3], [datetime(2024, 1, 3)], [5.0], [1.0], [5.0], "a")
+    monkeypatch.setattr(mpp, "query_mpp", _stale_query(cache, small, reset=True))
+    cache._load(None, None)
+    assert cache._best[None]["P"] == 5.0 and cache._best[None]["id"] == 3
@@ -1,29 +1,48 @@
+import asyncio
+import io
 import os
+import numpy as np
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from app.database import Base, get_db
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import app.models.sample  # noqa: F401 ensure models are registered
+from app.services.diode import diode_current
+from app.services.group_commit import committer
+from app.utils import wire
+from app.utils.columnar import SampleColumns
+from app.database import Base, get_async_db
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.models import sample as _sample_model  # noqa: F401 ensure models are registered
 
 # Create a new SQLite in-memory database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+# StaticPool: every session shares the one in-memory database, whatever the thread
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=StaticPool)
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+async def _create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
 
 # Create the tables in the test database
-Base.metadata.create_all(bind=engine)
+asyncio.run(_create_tables())
 
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_db
+
+
+@pytest.fixture(scope="module", autouse=True)
+def dispose_engine():
+    yield
+    # The StaticPool connection's aiosqlite thread would keep the process alive
+    asyncio.run(engine.dispose())
 
 client = TestClient(app)
 
@@ -55,3 +74,440 @@ def test_mpp_flow():
     assert mpp["Pmp"] == 30.0
     assert mpp["Vmp"] == 10.0
     assert mpp["Imp"] == 3.0
+
+
+def test_import_file_commits_in_chunks(monkeypatch):
+    from app.routers import samples as samples_router
+    monkeypatch.setattr(samples_router, "IMPORT_CHUNK_SIZE", 2)
+    client.delete("/api/samples", headers=auth_headers())
+
+    csv = "V;I;P\n20.3;0.0;0.0\n20.2;0.1;2.0\n19.0;1.5;28.5\nbad;row\n18.0;1.6;\n"
+    r = client.post(
+        "/api/import/file",
+        files={"file": ("sweep.csv", csv.encode("utf-8"), "text/csv")},
+        headers=auth_headers(),
+    )
+    assert r.status_code == 200, r.text
+    summary = r.json()
+    assert summary["imported"] == 4
+    assert summary["chunks"] == 3  # chunks of 2 input lines
+    assert summary["skipped"] == 1 and summary["errors"] == [{"line": 5, "reason": "missing V or I value"}]
+
+    mpp = client.get("/api/mpp").json()
+    assert mpp["Pmp"] == 28.8
+
+
+def test_mpp_cache_and_window():
+    client.delete("/api/samples", headers=auth_headers())
+    assert client.get("/api/mpp").status_code == 404
+
+    payload = [
+        {"t": "2024-01-01T00:00:01", "V": 5.0, "I": 4.0},
+        {"t": "2024-01-01T00:00:02", "V": 10.0, "I": 3.0},  # P = 30
+        {"t": "2024-01-01T00:00:03", "V": 15.0, "I": 1.0},
+    ]
+    client.post("/api/samples", json=payload, headers=auth_headers())
+    assert client.get("/api/mpp").json()["index"] == 1
+
+    # Backfill before the MPP shifts its index; a later, higher point replaces it
+    client.post("/api/samples", json={"t": "2024-01-01T00:00:00", "V": 1.0, "I": 5.0}, headers=auth_headers())
+    assert client.get("/api/mpp").json()["index"] == 2
+    client.post("/api/samples", json={"t": "2024-01-01T00:00:04", "V": 8.0, "I": 4.5}, headers=auth_headers())
+    mpp = client.get("/api/mpp").json()
+    assert (mpp["Pmp"], mpp["index"]) == (36.0, 4)
+
+    windowed = client.get("/api/mpp", params={"from": "2024-01-01T00:00:01", "to": "2024-01-01T00:00:03"}).json()
+    assert (windowed["Pmp"], windowed["index"]) == (30.0, 1)
+
+
+def test_list_samples_downsampled():
+    client.delete("/api/samples", headers=auth_headers())
+    payload = [{"t": f"2024-01-02T00:{i // 60:02d}:{i % 60:02d}", "V": float(i), "I": 1.0} for i in range(1000)]
+    payload[700]["I"] = 3.0  # MPP
+    client.post("/api/samples", json=payload, headers=auth_headers())
+
+    r = client.get("/api/samples", params={"max_points": 50, "method": "minmax"})
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert len(data) <= 51
+    assert max(s["P"] for s in data) == 2100.0
+    assert [s["t"] for s in data] == sorted(s["t"] for s in data)
+
+    # Downsampled pages continue after the last row read, not the last point kept
+    seen, cursor = 0, None
+    while True:
+        params = {"limit": 300, "max_points": 50, **({"cursor": cursor} if cursor else {})}
+        r = client.get("/api/samples", params=params)
+        assert len(r.json()) <= 51
+        seen += 1
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert seen == 4
+
+
+def test_keyset_pagination_and_export():
+    client.delete("/api/samples", headers=auth_headers())
+    # Same timestamp for several rows: the id breaks ties
+    payload = [{"t": "2024-01-03T00:00:00", "V": float(i), "I": 1.0} for i in range(5)]
+    payload += [{"t": "2024-01-03T00:00:01", "V": float(i), "I": 2.0} for i in range(5, 7)]
+    client.post("/api/samples", json=payload, headers=auth_headers())
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        r = client.get("/api/samples", params=params)
+        assert r.status_code == 200, r.text
+        seen += [s["V"] for s in r.json()]
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert seen == [float(i) for i in range(7)]
+    assert client.get("/api/samples", params={"cursor": "not-a-cursor"}).status_code == 400
+
+    r = client.get("/api/samples/export", params={"format": "csv", "from": "2024-01-03T00:00:01"})
+    lines = r.text.strip().splitlines()
+    assert lines[0] == "id,t,V,I,P,T,source,device_id"
+    assert len(lines) == 3
+    ndjson = client.get("/api/samples/export").text.strip().splitlines()
+    assert len(ndjson) == 7
+
+
+def test_list_samples_rows_and_columns():
+    client.delete("/api/samples", headers=auth_headers())
+    payload = [{"t": "2024-01-04T00:00:00.250000", "V": 10.0, "I": 2.0, "T": 25.0, "device_id": "roof"},
+               {"t": "2024-01-04T00:00:01", "V": 12.0, "I": 1.5, "P": 17.0}]
+    created = client.post("/api/samples", json=payload, headers=auth_headers()).json()
+
+    # Same documents as the SampleOut models of the write path
+    rows = client.get("/api/samples").json()
+    assert rows == created
+    assert rows[0]["t"] == "2024-01-04T00:00:00.250000" and rows[0]["P"] == 20.0
+
+    cols = client.get("/api/samples", params={"format": "columns", "limit": 1}).json()
+    assert cols == {"id": [rows[0]["id"]], "t": [rows[0]["t"]], "V": [10.0], "I": [2.0], "P": [20.0],
+                    "T": [25.0], "source": ["MANUAL"], "device_id": ["roof"]}
+    empty = client.get("/api/samples", params={"format": "columns", "from": "2030-01-01"}).json()
+    assert empty["V"] == [] and set(empty) == set(cols)
+    assert client.get("/api/samples", params={"format": "xml"}).status_code == 422
+
+
+def test_read_responses_are_cached_with_etags():
+    client.delete("/api/samples", headers=auth_headers())
+    old = [{"t": f"2024-01-01T00:00:0{i}", "V": 10.0 + i, "I": 1.0} for i in range(5)]
+    client.post("/api/samples", json=old, headers=auth_headers())
+    params = {"from": "2024-01-01T00:00:00", "to": "2024-01-01T00:01:00"}
+
+    first = client.get("/api/samples", params=params)
+    etag = first.headers["etag"]
+    assert len(first.json()) == 5
+    assert client.get("/api/samples", params=params, headers={"If-None-Match": etag}).status_code == 304
+    mpp = client.get("/api/mpp", params=params)
+    assert mpp.json()["Vmp"] == 14.0
+    assert client.get("/api/mpp", params=params, headers={"If-None-Match": mpp.headers["etag"]}).status_code == 304
+
+    # Live data after the window leaves it cached
+    client.post("/api/samples", json={"t": "2024-01-02T00:00:00", "V": 50.0, "I": 1.0}, headers=auth_headers())
+    from app.services.response_cache import REQUESTS, response_cache
+    hits = REQUESTS.value("samples", "hit")
+    again = client.get("/api/samples", params=params)
+    assert again.content == first.content and REQUESTS.value("samples", "hit") == hits + 1
+    assert client.get("/api/mpp").json()["Vmp"] == 50.0
+
+    # A write inside the window invalidates it
+    client.post("/api/samples", json={"t": "2024-01-01T00:00:30", "V": 40.0, "I": 1.0}, headers=auth_headers())
+    after = client.get("/api/samples", params=params, headers={"If-None-Match": etag})
+    assert after.status_code == 200 and len(after.json()) == 6 and after.headers["etag"] != etag
+    assert client.get("/api/mpp", params=params).json()["Vmp"] == 40.0
+
+    # Paginated pages are cached with their cursor
+    page = client.get("/api/samples", params={**params, "limit": 2})
+    assert page.headers["x-next-cursor"]
+    assert client.get("/api/samples", params={**params, "limit": 2}).headers["x-next-cursor"] == page.headers["x-next-cursor"]
+
+    client.delete("/api/samples", headers=auth_headers())
+    assert len(response_cache) == 0
+    assert client.get("/api/samples", params=params).json() == []
+
+
+def test_metrics_endpoint():
+    from app.utils import metrics
+    metrics.instrument_engine(engine.sync_engine)
+    client.delete("/api/samples", headers=auth_headers())
+    client.post("/api/import/text", content="V,I\n10,2\n12,1.5\n",
+                headers={**auth_headers(), "Content-Type": "text/plain"})
+    client.get("/api/samples", params={"device_id": "nope"})
+
+    r = client.get("/api/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    assert 'pv_http_request_duration_seconds_count{method="GET",route="/api/samples",status="200"}' in text
+    assert 'pv_parsed_lines_total{format="delimited"}' in text
+    assert "pv_ingested_rows_total" in text and "pv_ws_live_clients 0" in text
+    queries = [line for line in text.splitlines() if line.startswith('pv_http_request_db_queries_count{route="/api/samples"}')]
+    assert queries and int(queries[0].split()[-1]) >= 1
+    assert metrics.INGESTED_ROWS.value() >= 2
+
+
+def test_live_samples_are_batched_into_frames():
+    # One event loop for the WebSocket and the requests
+    with client, client.websocket_connect("/ws/live") as ws:
+        payload = [{"V": float(i), "I": 1.0} for i in range(3)]
+        client.post("/api/samples", json=payload, headers=auth_headers())
+        msg = ws.receive_json()
+        client.delete("/api/samples", headers=auth_headers())
+        reset = ws.receive_json()
+    assert msg["type"] == "samples"
+    assert [s["V"] for s in msg["data"]] == [0.0, 1.0, 2.0]
+    assert reset["type"] == "reset" and reset["deleted"] >= 3
+    assert client.get("/api/mpp").status_code == 404
+
+
+def test_import_text_uses_columnar_ingest():
+    client.delete("/api/samples", headers=auth_headers())
+    r = client.post("/api/import/text", json={"text": "V,I\n10,2\n5,1\n", "source": "SERIAL"}, headers=auth_headers())
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert [(s["P"], s["source"]) for s in data] == [(20.0, "SERIAL"), (5.0, "SERIAL")]
+    assert all(s["id"] for s in data)
+    assert client.post("/api/import/text", json={"text": "noise"}, headers=auth_headers()).status_code == 400
+
+
+def test_import_file_error_reports_committed_rows(monkeypatch):
+    from app.routers import samples as samples_router
+    from app.utils.columnar import SampleColumns
+    client.delete("/api/samples", headers=auth_headers())
+
+    def batches(stream, size):
+        yield SampleColumns([1.0, 2.0], [1.0, 1.0])
+        raise ValueError("corrupt block")
+
+    monkeypatch.setattr(samples_router, "iter_csv_columns", batches)
+    r = client.post("/api/import/file", files={"file": ("a.csv", b"V;I\n", "text/csv")}, headers=auth_headers())
+    assert r.status_code == 400
+    assert "2 rows in 1 chunks were already imported" in r.json()["detail"]
+    assert r.headers["x-imported-rows"] == "2"
+    assert len(client.get("/api/samples").json()) == 2
+
+
+def test_import_file_storage_error_is_a_server_error(monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from app.routers import samples as samples_router
+    monkeypatch.setattr(samples_router, "IMPORT_CHUNK_SIZE", 2)
+    client.delete("/api/samples", headers=auth_headers())
+    ingest = samples_router.ingest_columns
+    calls = []
+
+    def flaky_ingest(db, cols, source=None):
+        calls.append(len(cols))
+        if len(calls) == 2:
+            raise OperationalError("INSERT INTO samples", {}, Exception("disk I/O error"))
+        return ingest(db, cols, source)
+
+    monkeypatch.setattr(samples_router, "ingest_columns", flaky_ingest)
+    csv = b"V;I\n1;1\n2;1\n3;1\n4;1\n"
+    r = client.post("/api/import/file", files={"file": ("a.csv", csv, "text/csv")}, headers=auth_headers())
+    assert r.status_code == 500
+    assert r.json()["detail"].startswith("Failed to store samples")
+    # The first chunk (header line and one row) was committed
+    assert r.headers["x-imported-rows"] == "1"
+    assert len(client.get("/api/samples").json()) == 1
+
+
+def test_aggregates_follow_ingest_and_reset():
+    client.delete("/api/samples", headers=auth_headers())
+    payload = [{"t": f"2024-02-01T10:{m:02d}:00", "V": 10.0, "I": 1.0 + m} for m in range(30)]
+    client.post("/api/samples", json=payload, headers=auth_headers())
+
+    r = client.get("/api/aggregates", params={"bucket": "15m"})
+    assert r.status_code == 200, r.text
+    buckets = r.json()
+    assert [b["count"] for b in buckets] == [15, 15]
+    assert buckets[1]["peak_P"] == 300.0 and buckets[1]["P_mean"] == 230.0
+    assert len(client.get("/api/aggregates", params={"bucket": "1m", "from": "2024-02-01T10:10:00"}).json()) == 20
+    assert client.get("/api/aggregates", params={"bucket": "2h"}).status_code == 422
+
+    client.delete("/api/samples", headers=auth_headers())
+    assert client.get("/api/aggregates", params={"bucket": "1d"}).json() == []
+
+
+def test_sweeps_follow_ingest_and_reset():
+    client.delete("/api/samples", headers=auth_headers())
+    up = [{"t": f"2024-02-01T11:00:{s:02d}", "V": float(s), "I": 10.0 - s} for s in range(11)]
+    down = [{"t": f"2024-02-01T11:00:{11 + s:02d}", "V": 9.0 - s, "I": 1.0 + s} for s in range(10)]
+    client.post("/api/samples", json=up + down, headers=auth_headers())
+
+    r = client.get("/api/sweeps")
+    assert r.status_code == 200, r.text
+    (sweep,) = r.json()
+    assert sweep["direction"] == 1 and sweep["n_points"] == 11
+    assert sweep["Pmp"] == 25.0 and sweep["Voc"] == 10.0 and sweep["Isc"] == 10.0
+    assert sweep["FF"] == 0.25
+    assert [s["closed"] for s in client.get("/api/sweeps", params={"include_open": True}).json()] == [True, False]
+    assert client.get("/api/sweeps", params={"from": "2024-02-01T12:00:00"}).json() == []
+
+    client.delete("/api/samples", headers=auth_headers())
+    assert client.get("/api/sweeps", params={"include_open": True}).json() == []
+
+
+def test_mpp_fit_methods():
+    client.delete("/api/samples", headers=auth_headers())
+    # Sparse parabolic P-V sweep: the true peak (4.3 V, 50 W) falls between samples
+    payload = [{"t": f"2024-02-01T12:00:{k:02d}", "V": float(v), "I": (50 - (v - 4.3) ** 2) / max(v, 1.0)}
+               for k, v in enumerate(range(11))]
+    client.post("/api/samples", json=payload, headers=auth_headers())
+
+    measured = client.get("/api/mpp").json()
+    assert measured["method"] == "measured" and measured["residual"] is None
+    r = client.get("/api/mpp", params={"method": "quadratic"})
+    assert r.status_code == 200, r.text
+    fit = r.json()
+    assert fit["index"] == measured["index"] and fit["Pmp"] > measured["Pmp"]
+    assert abs(fit["Vmp"] - 4.3) < 1e-6 and abs(fit["Pmp"] - 50.0) < 1e-6
+    # Three-point interpolation has no residual to report
+    assert fit["method"] == "quadratic" and fit["residual"] is None
+    # A parabola is no diode curve: the fit is rejected for the measured point
+    diode = client.get("/api/mpp", params={"method": "diode"}).json()
+    assert diode["method"] == "measured" and diode["residual"] is None and diode["Pmp"] == measured["Pmp"]
+    assert client.get("/api/mpp", params={"method": "spline"}).status_code == 422
+
+    (sweep,) = client.get("/api/sweeps", params={"include_open": True}).json()
+    assert abs(sweep["Pmp_fit"] - 50.0) < 1e-6
+
+    V = np.linspace(0.0, 36.0, 13)
+    I = diode_current(V[None, :], *(np.array([x]) for x in (8.0, 1e-9, 0.3, 300.0, 1.6)))[0]
+    payload = [{"t": f"2024-02-01T13:00:{k:02d}", "V": float(v), "I": float(i), "device_id": "diode"}
+               for k, (v, i) in enumerate(zip(V, I))]
+    client.post("/api/samples", json=payload, headers=auth_headers())
+    measured = client.get("/api/mpp", params={"device_id": "diode"}).json()
+    diode = client.get("/api/mpp", params={"device_id": "diode", "method": "diode"}).json()
+    assert diode["method"] == "diode" and diode["residual"] < 1e-3 and diode["Pmp"] > measured["Pmp"]
+
+
+def test_devices_are_queried_separately():
+    client.delete("/api/samples", headers=auth_headers())
+    rising = [{"t": f"2024-03-01T10:00:{s:02d}", "V": float(s), "I": 10.0 - s} for s in range(11)]
+    client.post("/api/samples", json=[{**s, "device_id": "east"} for s in rising], headers=auth_headers())
+    # Same timestamps and readings on another device are not duplicates
+    r = client.post("/api/samples", json=[{**s, "device_id": "west", "I": 2 * s["I"]} for s in rising],
+                    headers=auth_headers())
+    assert r.status_code == 200, r.text
+    assert {s["device_id"] for s in r.json()} == {"west"}
+    assert client.post("/api/samples", json={"V": 1.0, "I": 1.0, "device_id": "bad id"},
+                       headers=auth_headers()).status_code == 422
+
+    east = client.get("/api/samples", params={"device_id": "east"}).json()
+    assert len(east) == 11 and {s["device_id"] for s in east} == {"east"}
+    assert len(client.get("/api/samples").json()) == 22
+
+    mpp = client.get("/api/mpp", params={"device_id": "east"}).json()
+    assert (mpp["Pmp"], mpp["device_id"], mpp["index"]) == (25.0, "east", 5)
+    assert client.get("/api/mpp").json()["device_id"] == "west"
+    # Cached per device and updated by ingestion
+    client.post("/api/samples", json={"t": "2024-03-01T10:00:30", "V": 6.0, "I": 6.0, "device_id": "east"},
+                headers=auth_headers())
+    assert client.get("/api/mpp", params={"device_id": "east"}).json()["Pmp"] == 36.0
+    assert client.get("/api/mpp").json()["Pmp"] == 50.0
+    windowed = client.get("/api/mpp", params={"device_id": "east", "from": "2024-03-01T10:00:00"}).json()
+    assert windowed["Pmp"] == 36.0 and windowed["index"] == 11
+
+    (one,) = client.get("/api/aggregates", params={"bucket": "1h", "device_id": "east"}).json()
+    assert one["count"] == 12 and one["device_id"] == "east"
+    (merged,) = client.get("/api/aggregates", params={"bucket": "1h"}).json()
+    assert merged["count"] == 23 and merged["device_id"] is None
+    assert merged["peak_P"] == 50.0 and merged["P_min"] == 0.0
+
+    sweeps = client.get("/api/sweeps", params={"device_id": "west", "include_open": True}).json()
+    assert [(s["device_id"], s["Pmp"]) for s in sweeps] == [("west", 50.0)]
+
+    lines = client.get("/api/samples/export", params={"format": "csv", "device_id": "west"}).text.splitlines()
+    assert len(lines) == 12 and all(line.endswith(",west") for line in lines[1:])
+
+
+def test_live_subscription_streams_mpp_updates(monkeypatch):
+    from app.routers import ws as ws_router
+    monkeypatch.setattr(ws_router, "session_factory", TestingSessionLocal)
+    client.delete("/api/samples", headers=auth_headers())
+    with client, client.websocket_connect("/ws/live") as ws:
+        ws.send_json({"type": "subscribe", "devices": ["bad id"]})
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "subscribe", "devices": ["east"], "streams": ["mpp"]})
+        assert ws.receive_json() == {"type": "subscribed", "devices": ["east"], "sources": None,
+                                     "max_rate": None, "streams": ["mpp"]}
+        client.post("/api/samples", json=[{"V": 1.0, "I": 1.0, "device_id": "west"}], headers=auth_headers())
+        client.post("/api/samples", json=[{"V": 10.0, "I": 3.0, "device_id": "east"},
+                                          {"V": 5.0, "I": 4.0, "device_id": "east"}], headers=auth_headers())
+        msg = ws.receive_json()
+        # A new subscription starts from the current maxima
+        ws.send_json({"type": "subscribe", "devices": ["east", "west"], "streams": ["mpp"]})
+        assert ws.receive_json()["type"] == "subscribed"
+        current = [ws.receive_json(), ws.receive_json()]
+    assert msg["type"] == "mpp" and msg["device_id"] == "east"
+    assert (msg["data"]["Vmp"], msg["data"]["Pmp"]) == (10.0, 30.0)
+    assert [(m["device_id"], m["data"]["Pmp"]) for m in current] == [("east", 30.0), ("west", 1.0)]
+
+
+def test_binary_ingest_and_live_stream():
+    client.delete("/api/samples", headers=auth_headers())
+    cols = SampleColumns([10.0, 20.0], [3.0, 2.0], device_id="south")
+    cols.t = np.array(["2024-05-01T10:00:00", "2024-05-01T10:00:01"], dtype="datetime64[us]")
+    body = wire.encode_columns(cols, "SERIAL") + wire.encode_columns(SampleColumns([5.0], [1.0]))
+    headers = {**auth_headers(), "Content-Type": wire.MEDIA_TYPE}
+    with client, client.websocket_connect("/ws/live", subprotocols=[wire.WS_SUBPROTOCOL]) as ws:
+        r = client.post("/api/samples", params={"device_id": "north"}, content=body, headers=headers)
+        frame = ws.receive_bytes()
+    assert r.status_code == 200, r.text
+    assert r.json() == {"filename": None, "imported": 3, "skipped": 0, "chunks": 2, "errors": []}
+    blocks = [(c.device_id, s, c.V.tolist(), c.id is not None) for c, s in wire.decode(frame)]
+    assert blocks[0] == ("south", "SERIAL", [10.0, 20.0], True)
+    assert client.get("/api/mpp", params={"device_id": "north"}).json()["Pmp"] == 5.0
+    assert client.post("/api/samples", content=b"garbage", headers=headers).status_code == 400
+    assert client.post("/api/samples", content=b"{", headers=auth_headers()).status_code == 422
+
+
+def test_ws_ingest_group_commits_and_acks(monkeypatch):
+    client.delete("/api/samples", headers=auth_headers())
+    monkeypatch.setattr(committer, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(committer, "max_delay", 0.2)
+    commits = committer.commits
+    with client:
+        with pytest.raises(Exception):
+            with client.websocket_connect("/ws/ingest?token=wrong") as ws:
+                ws.receive_json()
+        with client.websocket_connect("/ws/ingest?device_id=stream", headers=auth_headers()) as ws:
+            ws.send_text("V:10V I:2A\nV:12V I:2A P:24W")
+            ws.send_text("5,1\n6,1\nnoise\n7,1")
+            ws.send_bytes(wire.encode_columns(SampleColumns([20.0], [2.0], device_id="other"), "MANUAL"))
+            ws.send_bytes(b"nope")
+            replies = [ws.receive_json() for _ in range(4)]
+    assert [(r["type"], r["seq"]) for r in replies] == [("ack", 1), ("ack", 2), ("ack", 3), ("error", 4)]
+    assert [r.get("accepted") for r in replies[:3]] == [2, 3, 1]
+    assert replies[1]["skipped"] == 1 and replies[1]["errors"] == [{"line": 3, "reason": "expected V,I[,P][,T] numbers"}]
+    # Three frames, one transaction
+    assert committer.commits == commits + 1
+    stream = client.get("/api/samples", params={"device_id": "stream"}).json()
+    assert [s["V"] for s in stream] == [10.0, 12.0, 5.0, 6.0, 7.0] and {s["source"] for s in stream} == {"SERIAL"}
+    assert client.get("/api/mpp", params={"device_id": "other"}).json()["Pmp"] == 40.0
+
+
+def test_import_xlsx_selects_sheets():
+    from openpyxl import Workbook
+    wb = Workbook()
+    wb.active.title = "notes"
+    wb.active.append(["measured on the roof"])
+    for name, rows in (("east", [[20.0, 0.5], [10.0, 3.0]]), ("west", [["V", "I"], [15.0, 1.0]])):
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    client.delete("/api/samples", headers=auth_headers())
+
+    files = {"file": ("sweep.xlsx", buf.getvalue(), "application/octet-stream")}
+    r = client.post("/api/import/file", params={"sheet": ["east", "west"]}, files=files, headers=auth_headers())
+    assert r.status_code == 200, r.text
+    assert r.json()["imported"] == 3
+    assert client.get("/api/mpp").json()["Pmp"] == 30.0
+
+    r = client.post("/api/import/file", params={"sheet": "north"}, files=files, headers=auth_headers())
+    assert r.status_code == 400 and "No sheet named 'north'" in r.json()["detail"]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from app.services.diode import PARAMS, diode_current, fit_diode, lambertw_exp
+from app.services.mppfit import diode_fit_mpp, quadratic_mpp
+
+TRUE = {"IL": 8.0, "I0": 1e-9, "Rs": 0.3, "Rsh": 300.0, "a": 1.6}
+
+
+def _curve(n):
+    V = np.linspace(0.0, 36.0, n)
+    return V, diode_current(V[None, :], *(np.array([TRUE[k]]) for k in PARAMS))[0]
+
+
+def test_lambertw_exp_solves_w_plus_log_w():
+    z = np.linspace(-40.0, 5000.0, 20001)
+    w = lambertw_exp(z)
+    assert np.all(w > 0)
+    assert np.allclose(w + np.log(w), z, rtol=1e-14, atol=1e-14)
+
+
+def test_fit_diode_recovers_parameters_in_batch():
+    V, I = _curve(60)
+    scale = np.array([1.0, 0.6, 1.1])
+    fit = fit_diode(np.tile(V, (3, 1)), I[None, :] * scale[:, None], I[None, :] > -0.01)
+    assert fit["converged"].all()
+    assert np.all(fit["rmse"] < 1e-6)
+    assert np.allclose(fit["Rs"], TRUE["Rs"] / scale, rtol=1e-4)
+    assert np.allclose(fit["a"], TRUE["a"], rtol=1e-4)
+
+    # Started from the solution, the fit stops right away
+    again = fit_diode(V[None, :], I[None, :], guess={k: fit[k][:1] for k in PARAMS})
+    assert again["converged"][0] and again["iterations"][0] <= 1
+
+
+def test_fits_land_between_samples():
+    Vd, Id = _curve(36001)
+    true_pmp = (Vd * Id).max()
+    V, I = _curve(13)
+    P = V * I
+    assert true_pmp - P.max() > 0.4
+
+    quad = quadratic_mpp(np.array([0]), np.array([13]), V, I, P)
+    assert quad["fitted"][0] and abs(quad["pmp"][0] - true_pmp) < abs(P.max() - true_pmp) * 6
+    diode = diode_fit_mpp(np.array([0]), np.array([13]), V, I)
+    assert abs(diode["pmp"][0] - true_pmp) < 1e-3
+    assert diode["residual"][0] < 1e-6
+
+
+def test_quadratic_is_exact_on_a_parabola_and_per_segment():
+    V = np.r_[np.linspace(0, 10, 11), np.linspace(0, 10, 6)]
+    P = np.r_[50 - (V[:11] - 4.3) ** 2, 20 - 2 * (V[11:] - 7.1) ** 2]
+    fit = quadratic_mpp(np.array([0, 11]), np.array([11, 17]), V, P / np.maximum(V, 1), P, half_width=2)
+    assert np.allclose(fit["vmp"], [4.3, 7.1])
+    assert np.allclose(fit["pmp"], [50.0, 20.0])
+    assert np.allclose(fit["residual"], 0.0, atol=1e-9)
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.services.events import SamplesCommitted
+from app.services.response_cache import ENTRY_OVERHEAD, ResponseCache, narrow, window
+from app.utils.columnar import SampleColumns
+
+DAY = datetime(2024, 1, 1)
+
+
+def _batch(device, *stamps):
+    n = len(stamps)
+    cols = SampleColumns(np.ones(n), np.ones(n), np.ones(n), np.full(n, np.nan),
+                         t=np.array(stamps, dtype="datetime64[us]"))
+    cols.device_id = device
+    return SamplesCommitted(columns=cols, source="IMPORT")
+
+
+def test_only_overlapping_writes_invalidate():
+    cache = ResponseCache(1 << 20)
+    closed = window("a", DAY, DAY + timedelta(hours=1))
+    cache.store("closed", cache.version, closed, b"[1]")
+    cache.store("open", cache.version, window("a", DAY), b"[2]")
+    cache.store("other", cache.version, window("b"), b"[3]")
+
+    # Live data of device a, after the closed window
+    cache.on_committed(_batch("a", DAY + timedelta(hours=2)))
+    assert cache.get("closed") is not None and cache.get("other") is not None
+    assert cache.get("open") is None
+
+    cache.on_committed(SamplesCommitted(rows=[{"device_id": "a", "t": DAY + timedelta(minutes=30)}]))
+    assert cache.get("closed") is None and cache.get("other") is not None
+
+    cache.on_deleted(3)
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_store_skips_responses_raced_by_a_write():
+    cache = ResponseCache(1 << 20)
+    since = cache.version
+    cache.on_committed(_batch("a", DAY + timedelta(days=1)))
+    # Written during the query, outside its window: still valid
+    cache.store("before", since, window("a", DAY, DAY + timedelta(hours=1)), b"[]")
+    assert cache.get("before") is not None
+    cache.on_committed(_batch("a", DAY))
+    cache.store("raced", since, window("a", DAY, DAY + timedelta(hours=1)), b"[]")
+    assert cache.get("raced") is None
+
+
+def test_lru_eviction_within_the_byte_bound():
+    body = b"x" * 1000
+    cache = ResponseCache(4 * (len(body) + ENTRY_OVERHEAD))
+    for key in "abcd":
+        cache.store(key, cache.version, window(), body)
+    cache.get("a")
+    cache.store("e", cache.version, window(), body)
+    assert cache.get("b") is None and cache.get("a") is not None
+    assert cache.size == 4 * (len(body) + ENTRY_OVERHEAD)
+    # Bodies above a quarter of the budget are never kept
+    cache.store("big", cache.version, window(), body * 2)
+    assert cache.get("big") is None
+
+
+def test_window_bounds():
+    aware = datetime(2024, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+    _, lo, hi = window(None, aware, aware)
+    assert lo == np.datetime64("2024-01-01T10:00:00") and hi == np.datetime64("2024-01-01T12:00:00")
+    assert narrow(window("a", DAY), hi=DAY + timedelta(hours=1)) == (
+        "a", np.datetime64(DAY, "us"), np.datetime64(DAY + timedelta(hours=1), "us"))
@@ -0,0 +1,131 @@
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from app.models.rollup import SampleRollup
+from app.services.partitions import month_ranges, partitioned_table_ddl
+from app.services.schema import create_schema
+
+# samples and sample_rollups as they were before device_id
+OLD_SCHEMA = [
+    "CREATE TABLE samples (id INTEGER PRIMARY KEY, timestamp DATETIME, voltage FLOAT NOT NULL, "
+    "current FLOAT NOT NULL, power FLOAT, temperature FLOAT, source VARCHAR(6) NOT NULL)",
+    "CREATE INDEX idx_sample_composite ON samples (timestamp, voltage, current)",
+    "CREATE TABLE sample_rollups (bucket VARCHAR(8), bucket_start DATETIME, count INTEGER NOT NULL, "
+    "PRIMARY KEY (bucket, bucket_start))",
+]
+
+
+def test_create_schema_upgrades_a_database_without_devices(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for ddl in OLD_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text(
+            "INSERT INTO samples (timestamp, voltage, current, power, source) VALUES "
+            "('2024-01-01 10:00:00.000000', 10, 2, 20, 'SERIAL'), ('2024-01-01 10:00:30.000000', 12, 2, 24, 'SERIAL')"
+        ))
+
+    create_schema(engine)
+    create_schema(engine)  # idempotent
+
+    insp = inspect(engine)
+    assert "device_id" in {c["name"] for c in insp.get_columns("samples")}
+    indexes = {i["name"] for i in insp.get_indexes("samples")}
+    assert "idx_sample_device_time" in indexes and "idx_sample_composite" not in indexes
+    with sessionmaker(bind=engine)() as db:
+        assert set(db.scalars(text("SELECT device_id FROM samples"))) == {"default"}
+        (hour,) = db.scalars(select(SampleRollup).where(SampleRollup.bucket == "1h"))
+        assert (hour.device_id, hour.count, hour.peak_p) == ("default", 2, 24.0)
+    engine.dispose()
+
+
+def test_partitioned_samples_ddl():
+    ddl = partitioned_table_ddl(postgresql.dialect())
+    assert "PRIMARY KEY (id, timestamp)" in ddl
+    assert "device_id VARCHAR(64)" in ddl
+    assert ddl.endswith("PARTITION BY RANGE (timestamp)")
+
+
+def test_month_ranges_cover_the_batch():
+    ranges = month_ranges(datetime(2023, 11, 30, 23), datetime(2024, 2, 1))
+    assert ranges == [
+        (datetime(2023, 11, 1), datetime(2023, 12, 1)),
+        (datetime(2023, 12, 1), datetime(2024, 1, 1)),
+        (datetime(2024, 1, 1), datetime(2024, 2, 1)),
+        (datetime(2024, 2, 1), datetime(2024, 3, 1)),
+    ]
+
+
+def test_partitions_are_cached_once_their_transaction_commits(tmp_path, monkeypatch):
+    from app.services import partitions
+
+    created = []
+    monkeypatch.setattr(partitions, "_known", set())
+    monkeypatch.setattr(partitions, "is_partitioned", lambda conn: True)
+    monkeypatch.setattr(partitions, "_partition_ddl", lambda start, end: created.append(start) or ["SELECT 1"])
+    engine = create_engine(f"sqlite:///{tmp_path / 'p.db'}")
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        partitions.ensure_partitions(db.connection(), datetime(2024, 1, 5), datetime(2024, 2, 5))
+        partitions.ensure_partitions(db.connection(), datetime(2024, 1, 6), datetime(2024, 1, 7))
+        db.commit()
+    assert created == [datetime(2024, 1, 1), datetime(2024, 2, 1)] and partitions._known == {"202401", "202402"}
+
+    # Closing a read-only session rolls back: known partitions stay known
+    with Session() as db:
+        db.execute(text("SELECT 1"))
+    with Session() as db:
+        partitions.ensure_partitions(db.connection(), datetime(2024, 1, 1), datetime(2024, 3, 1))
+        db.rollback()
+    assert created[2:] == [datetime(2024, 3, 1)] and partitions._known == {"202401", "202402"}
+    with Session() as db:
+        partitions.ensure_partitions(db.connection(), datetime(2024, 3, 1), datetime(2024, 3, 2))
+        db.commit()
+    assert created[3:] == [datetime(2024, 3, 1)] and "202403" in partitions._known
+    engine.dispose()
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL (a scratch PostgreSQL database) not set")
+def test_ingest_into_partitioned_samples(monkeypatch):
+    import numpy as np
+
+    from app.database import Base
+    from app.services import partitions
+    from app.services.ingest import ingest_columns, ingest_rows, make_row
+    from app.utils.columnar import SampleColumns
+
+    monkeypatch.setattr(partitions, "_known", set())
+    monkeypatch.setattr(partitions, "_partitioned", None)
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    Base.metadata.drop_all(engine)
+    create_schema(engine)
+    Session = sessionmaker(bind=engine)
+
+    t = np.array(["2024-01-31T23:59:59", "2024-02-01T00:00:00", "2024-02-15T12:00:00"], dtype="datetime64[us]")
+    cols = SampleColumns(np.array([1.0, 2.0, 3.0]), np.ones(3), np.array([1.0, 2.0, 3.0]), np.full(3, np.nan), t=t)
+    cols.device_id = "east"
+    with Session() as db:
+        ingest_columns(db, cols)
+        db.commit()
+        stored = dict(db.execute(text("SELECT id, voltage FROM samples")).all())
+        assert [stored[i] for i in cols.id.tolist()] == [1.0, 2.0, 3.0]
+        parts = set(db.scalars(text("SELECT inhrelid::regclass::text FROM pg_inherits "
+                                    "WHERE inhparent = 'samples'::regclass")))
+        assert {"samples_y2024m01", "samples_y2024m02"} <= parts
+
+    # A rolled-back month is created again by the next batch
+    with Session() as db:
+        ingest_rows(db, [make_row(5.0, 1.0, t=datetime(2024, 3, 1))])
+        db.rollback()
+    with Session() as db:
+        (row,) = ingest_rows(db, [make_row(5.0, 1.0, t=datetime(2024, 3, 1))])
+        db.commit()
+        assert db.execute(text("SELECT voltage FROM samples_y2024m03 WHERE id = :i"), {"i": row["id"]}).scalar_one() == 5.0
+    Base.metadata.drop_all(engine)
+    engine.dispose()
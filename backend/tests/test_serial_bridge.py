@@ -0,0 +1,81 @@
+import threading
+
+from app.scripts.serial_bridge import Bridge, Journal, SendError, parse_line
+
+
+class FlakyApi:
+    """Fails while ``down`` is set; records delivered batches."""
+
+    def __init__(self):
+        self.down = threading.Event()
+        self.batches = []
+
+    def __call__(self, batch):
+        if self.down.is_set():
+            raise SendError("connection refused")
+        self.batches.append(batch)
+
+
+def test_parse_line_stamps_and_tags_samples():
+    (kv,) = parse_line("V:20.2V I:0.10A P:2.1W", "east")
+    assert (kv["V"], kv["device_id"], kv["source"]) == (20.2, "east", "SERIAL") and kv["t"]
+    (csv,) = parse_line("10,2")
+    assert (csv["V"], csv["I"]) == (10.0, 2.0) and csv["t"]
+    (obj,) = parse_line('{"V": 1, "I": 2, "t": "2024-01-01T00:00:00"}')
+    assert obj["t"] == "2024-01-01T00:00:00"
+    assert parse_line("garbage") == []
+
+
+def test_invalid_json_samples_are_dropped_alone(tmp_path):
+    errors = []
+    line = ('[{"V": 1, "I": 2}, {"V": "abc", "I": 1}, {"temp": 3}, {"V": 1, "I": NaN},'
+            ' {"V": 1, "I": 1, "source": "NOPE"}, {"V": 1, "I": 1, "t": "yesterday"}, {"V": 3, "I": 1, "source": "BLYNK"}]')
+    good = parse_line(line, errors=errors)
+    assert [(s["V"], s["source"]) for s in good] == [(1.0, "SERIAL"), (3.0, "BLYNK")] and len(errors) == 5
+
+    api = FlakyApi()
+    bridge = Bridge(api, Journal(str(tmp_path / "j")), batch_size=10, batch_delay=5.0)
+    bridge.start_reader(iter(['{"V": "abc", "I": 1}', '{"V": 2, "I": 1}', "V:1V I:1A"])).join()
+    bridge.run()
+    assert [len(b) for b in api.batches] == [2] and bridge.stats["invalid"] == 1 and bridge.stats["rejected"] == 0
+
+
+def test_batches_by_size():
+    api = FlakyApi()
+    bridge = Bridge(api, Journal("unused"), batch_size=4, batch_delay=5.0)
+    bridge.start_reader(iter([f"{i},1" for i in range(10)])).join()
+    bridge.run()
+    assert [len(b) for b in api.batches] == [4, 4, 2]
+    assert [s["V"] for b in api.batches for s in b] == list(map(float, range(10)))
+
+
+def test_outage_is_journaled_and_replayed(tmp_path):
+    api = FlakyApi()
+    journal = Journal(str(tmp_path / "bridge.journal"))
+    api.down.set()
+    bridge = Bridge(api, journal, batch_size=2, batch_delay=0.01, retries=1, backoff=0.001)
+    bridge.start_reader(iter([f"{i},1" for i in range(6)])).join()
+    bridge.run()
+    assert api.batches == [] and bridge.stats["journaled"] == 6 and journal
+
+    # Next run: the journal goes first, then the new samples
+    api.down.clear()
+    bridge = Bridge(api, Journal(journal.path), batch_size=2, batch_delay=0.01)
+    bridge.start_reader(iter(["6,1"])).join()
+    bridge.run()
+    assert [s["V"] for b in api.batches for s in b] == list(map(float, range(7)))
+    assert bridge.stats["replayed"] == 6 and not Journal(journal.path)
+    assert not (tmp_path / "bridge.journal").exists()
+
+
+def test_rejected_batches_are_not_retried(tmp_path):
+    calls = []
+
+    def reject(batch):
+        calls.append(batch)
+        raise SendError("HTTP 422", retryable=False)
+
+    bridge = Bridge(reject, Journal(str(tmp_path / "j")), batch_size=10, batch_delay=0.01)
+    bridge.start_reader(iter(["1,1", "2,1"])).join()
+    bridge.run()
+    assert len(calls) == 1 and bridge.stats["rejected"] == 2 and not bridge.journal
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.sweep import Sweep
+from app.services import ingest
+from app.services.ingest import ingest_columns, ingest_rows, make_row
+from app.services.sweeps import rebuild_sweeps, segment_sweeps, sweep_metrics, update_sweeps
+from app.utils.columnar import SampleColumns
+
+engine = create_engine("sqlite:///:memory:")
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+T0 = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def _iv_curve(n=41, voc=40.0, isc=8.0):
+    """A diode-like I-V curve from Isc at 0 V to 0 A at Voc."""
+    V = np.linspace(0.0, voc, n)
+    I = isc * (1 - (np.exp(V / voc * 8) - 1) / (np.exp(8) - 1))
+    return V, I
+
+
+def _snapshot(db, device_id="default"):
+    rows = db.scalars(select(Sweep).where(Sweep.device_id == device_id).order_by(Sweep.start_time, Sweep.start_id))
+    return [(s.closed, s.start_id, s.end_id, s.direction, s.mpp_id, round(s.voc, 6)) for s in rows]
+
+
+def test_segment_sweeps_on_reversals_and_gaps():
+    V = np.array([0, 1, 2, 3, 2, 1, 0, 1, 2, 5, 6], dtype=float)
+    t = np.datetime64(T0, "us") + np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 200, 201]) * np.timedelta64(1, "s")
+    starts, ends, direction = segment_sweeps(t, V, max_gap=60)
+    # Runs share the turning point; the step across the 192 s gap belongs to none
+    assert starts.tolist() == [0, 3, 6, 9]
+    assert ends.tolist() == [4, 7, 9, 11]
+    assert direction.tolist() == [1, -1, 1, 1]
+
+
+def test_sweep_metrics_match_curve():
+    V, I = _iv_curve()
+    V2, I2 = V[::-1], I[::-1] * 0.5
+    V, I = np.r_[V, V2[1:]], np.r_[I, I2[1:]]
+    starts, ends = np.array([0, 40]), np.array([41, 81])
+    mt = sweep_metrics(starts, ends, np.arange(len(V)) + 100, V, I, V * I)
+    p = V * I
+    assert mt["mpp"][0] == np.argmax(p[:41])
+    assert mt["mpp_id"][0] == 100 + np.argmax(p[:41])
+    assert np.allclose(mt["isc"], [8.0, 4.0])
+    assert np.allclose(mt["voc"], [40.0, 40.0])
+    assert np.allclose(mt["fill_factor"], mt["pmp"] / (mt["voc"] * mt["isc"]))
+    assert 0.5 < mt["fill_factor"][0] < 1
+
+
+def test_incremental_sweeps_equal_rebuild():
+    V, I = _iv_curve()
+    # Forward sweep, reverse sweep, then a pause and another forward sweep
+    V_all = np.r_[V, V[::-1][1:], V]
+    I_all = np.r_[I, I[::-1][1:], I]
+    secs = np.r_[np.arange(81), 500 + np.arange(41)]
+    t = np.datetime64(T0, "us") + secs * np.timedelta64(1, "s")
+    with TestingSessionLocal() as db:
+        # Batches split mid-sweep, one of them row-wise
+        ingest_columns(db, SampleColumns(V_all[:30], I_all[:30], t=t[:30]))
+        ingest_rows(db, [make_row(float(V_all[k]), float(I_all[k]), t=t[k].astype(datetime))
+                         for k in range(30, 60)])
+        ingest_columns(db, SampleColumns(V_all[60:100], I_all[60:100], t=t[60:100]))
+        ingest_columns(db, SampleColumns(V_all[100:], I_all[100:], t=t[100:]))
+        db.commit()
+        incremental = _snapshot(db)
+
+        assert [s[0] for s in incremental] == [True, True, False]
+        assert [s[3] for s in incremental] == [1, -1, 1]
+        assert all(abs(s[5] - 40.0) < 1e-6 for s in incremental)
+
+        assert rebuild_sweeps(db) == 2
+        db.commit()
+        assert _snapshot(db) == incremental
+
+
+def test_open_sweep_is_not_read_again(monkeypatch):
+    reads = []
+    monkeypatch.setattr(ingest, "update_sweeps", lambda *a, **kw: reads.append(update_sweeps(*a, **kw)))
+    V, I = _iv_curve()
+    V_all, I_all = np.r_[V, V[::-1][1:]], np.r_[I, I[::-1][1:]]
+    t = np.datetime64(T0, "us") + np.arange(81) * np.timedelta64(1, "s")
+
+    def batch(db, lo, hi):
+        ingest_columns(db, SampleColumns(V_all[lo:hi], I_all[lo:hi], t=t[lo:hi], device_id="west"))
+
+    with TestingSessionLocal() as db:
+        batch(db, 0, 20)
+        batch(db, 20, 35)
+        db.commit()
+        batch(db, 35, 60)
+        db.rollback()
+        # The open sweep cached by the rolled-back call no longer matches: read from its start
+        batch(db, 35, 60)
+        batch(db, 60, 81)
+        db.commit()
+        assert reads == [20, 15, 25, 60, 21]
+        incremental = _snapshot(db, "west")
+
+        rebuild_sweeps(db)
+        db.commit()
+        assert _snapshot(db, "west") == incremental
+        assert [s[0] for s in incremental] == [True, False]
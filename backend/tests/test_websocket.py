@@ -0,0 +1,174 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.websocket import CLOSE_TOO_SLOW, ConnectionManager, Subscription
+from app.utils import wire
+
+
+class FakeSocket:
+    def __init__(self, stalled: bool = False):
+        self.sent = []
+        self.closed = None
+        self.stalled = stalled
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, data):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        self.sent.append([(cols, source) for cols, source in wire.decode(data)])
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def test_publish_coalesces_samples_into_frames():
+    async def run():
+        manager = ConnectionManager(max_batch=3, max_delay=0.01)
+        ws = FakeSocket()
+        await manager.connect(ws)
+        manager.publish({"id": i} for i in range(7))
+        await asyncio.sleep(0.05)
+        return ws.sent
+
+    frames = asyncio.run(run())
+    assert [f["type"] for f in frames] == ["samples"] * 3
+    assert [len(f["data"]) for f in frames] == [3, 3, 1]
+    assert [s["id"] for f in frames for s in f["data"]] == list(range(7))
+
+
+def test_slow_client_is_disconnected_without_blocking_others():
+    async def run():
+        manager = ConnectionManager(max_batch=1, queue_size=2)
+        fast, slow = FakeSocket(), FakeSocket(stalled=True)
+        await manager.connect(fast)
+        await manager.connect(slow)
+        for i in range(10):
+            manager.publish([{"id": i}])
+            await manager.drain(timeout=0.01)
+        await asyncio.sleep(0)
+        return manager, fast, slow, list(manager.clients)
+
+    manager, fast, slow, connected = asyncio.run(run())
+    assert len(fast.sent) == 10
+    assert connected == [fast]
+    assert manager.dropped > 0
+    assert slow.closed == CLOSE_TOO_SLOW
+
+
+def test_device_clients_only_get_their_device():
+    async def run():
+        manager = ConnectionManager(max_batch=10, max_delay=0.01)
+        everything, east = FakeSocket(), FakeSocket()
+        await manager.connect(everything)
+        await manager.connect(east, "east")
+        manager.publish({"id": i, "device_id": "east" if i % 2 else "west"} for i in range(6))
+        await asyncio.sleep(0.05)
+        return everything.sent, east.sent
+
+    everything, east = asyncio.run(run())
+    assert [s["id"] for f in everything for s in f["data"]] == list(range(6))
+    assert [s["id"] for f in east for s in f["data"]] == [1, 3, 5]
+
+
+def test_subscriptions_filter_and_share_encodings():
+    async def run():
+        manager = ConnectionManager(max_batch=10, max_delay=0.01)
+        a, b, serial, idle = FakeSocket(), FakeSocket(), FakeSocket(), FakeSocket()
+        for ws in (a, b, serial, idle):
+            await manager.connect(ws)
+        manager.subscribe(a, Subscription(devices=["east"]))
+        manager.subscribe(b, Subscription(devices=["east"]))
+        manager.subscribe(serial, Subscription(sources=["SERIAL"]))
+        manager.subscribe(idle, Subscription(devices=["north"]))
+        assert manager.wants("east") and not manager.wants("south", "IMPORT")
+        manager.publish({"id": i, "device_id": "east" if i < 3 else "west",
+                         "source": "SERIAL" if i % 2 else "IMPORT"} for i in range(6))
+        await asyncio.sleep(0.05)
+        return manager, a.sent, b.sent, serial.sent, idle.sent
+
+    manager, a, b, serial, idle = asyncio.run(run())
+    ids = lambda frames: [s["id"] for f in frames if f["type"] == "samples" for s in f["data"]]
+    assert a[0]["type"] == "subscribed" and a[0]["devices"] == ["east"]
+    assert ids(a) == ids(b) == [0, 1, 2]
+    assert ids(serial) == [1, 3, 5]
+    assert ids(idle) == []
+    # east once for both of its clients, each device once for the source filter
+    assert manager.encoded == 3
+
+
+def test_max_rate_sends_the_latest_sample_per_device():
+    async def run():
+        manager = ConnectionManager(max_batch=100, max_delay=0.001)
+        ws = FakeSocket()
+        await manager.connect(ws)
+        manager.subscribe(ws, Subscription(max_rate=20))
+        for i in range(10):
+            manager.publish([{"id": i, "device_id": "east"}])
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.1)
+        return ws.sent[1:]
+
+    frames = asyncio.run(run())
+    sent = [s["id"] for f in frames for s in f["data"]]
+    assert sent[0] == 0 and sent[-1] == 9
+    assert len(sent) < 5
+
+
+def test_mpp_stream_goes_to_its_subscribers():
+    async def run():
+        manager = ConnectionManager()
+        east, overall, samples_only = FakeSocket(), FakeSocket(), FakeSocket()
+        for ws in (east, overall, samples_only):
+            await manager.connect(ws)
+        manager.subscribe(east, Subscription(devices=["east"], streams=["mpp"]))
+        manager.subscribe(overall, Subscription(streams=["samples", "mpp"]))
+        best = {"id": 7, "device_id": "east", "V": 10.0, "I": 3.0, "P": 30.0, "t": "2024-01-01T10:00:00"}
+        manager.on_mpp(dict(best, key="east"))
+        manager.on_mpp(dict(best, key=None))
+        manager.on_mpp(dict(best, key="west"))
+        await asyncio.sleep(0.01)
+        return east.sent[1:], overall.sent[1:], samples_only.sent
+
+    east, overall, samples_only = asyncio.run(run())
+    assert [(m["type"], m["device_id"], m["data"]["Pmp"]) for m in east] == [("mpp", "east", 30.0)]
+    assert [m["device_id"] for m in overall] == [None]
+    assert samples_only == []
+
+
+@pytest.mark.parametrize("msg", [
+    {"devices": "east"},
+    {"devices": ["bad id"]},
+    {"sources": ["FTP"]},
+    {"streams": ["power"]},
+    {"max_rate": -1},
+    {"max_rate": "fast"},
+])
+def test_invalid_subscriptions_are_rejected(msg):
+    with pytest.raises(ValueError):
+        Subscription.parse(dict(msg, type="subscribe"))
+
+
+def test_binary_clients_get_column_frames():
+    async def run():
+        manager = ConnectionManager(max_batch=10, max_delay=0.01)
+        text, binary = FakeSocket(), FakeSocket()
+        await manager.connect(text)
+        await manager.connect(binary, binary=True)
+        manager.publish({"id": i, "device_id": "east", "t": f"2024-01-01T10:00:0{i}", "V": float(i), "I": 1.0,
+                         "P": float(i), "T": None, "source": "SERIAL"} for i in range(3))
+        await asyncio.sleep(0.05)
+        return text.sent, binary
+
+    text, binary = asyncio.run(run())
+    assert binary.subprotocol == wire.WS_SUBPROTOCOL
+    ((cols, source),) = binary.sent[0]
+    assert source == "SERIAL" and cols.device_id == "east"
+    assert cols.id.tolist() == [0, 1, 2] and cols.V.tolist() == [s["V"] for s in text[0]["data"]]
+    assert str(cols.t[2]) == "2024-01-01T10:00:02.000000"
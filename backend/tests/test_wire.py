@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from app.utils import wire
+from app.utils.columnar import SampleColumns
+
+
+def _columns(n, step="1s", device="east"):
+    cols = SampleColumns(np.linspace(0, 40, n), np.linspace(8, 0, n), T=np.full(n, np.nan), device_id=device)
+    cols.t = np.datetime64("2024-06-01T12:00:00", "us") + np.arange(n) * np.timedelta64(1, step[-1]) * int(step[:-1])
+    return cols
+
+
+def test_round_trip_keeps_columns():
+    cols = _columns(5)
+    cols.T[2] = 31.5
+    cols.P[1] = 99.0
+    cols.id = np.arange(10, 15)
+    ((out, source),) = wire.decode(wire.encode_columns(cols, "SERIAL"))
+    assert source == "SERIAL" and out.device_id == "east"
+    assert np.array_equal(out.V, cols.V) and np.array_equal(out.I, cols.I) and np.array_equal(out.P, cols.P)
+    assert np.array_equal(out.T, cols.T, equal_nan=True)
+    assert np.array_equal(out.t, cols.t) and out.id.tolist() == list(range(10, 15))
+
+
+def test_blocks_concatenate_and_wide_deltas():
+    blocks = [_columns(3), _columns(1, device=None), _columns(4, step="1D"), SampleColumns.empty()]
+    data = b"".join(wire.encode_columns(c) for c in blocks)
+    out = list(wire.decode(data))
+    assert [len(c) for c, _ in out] == [3, 1, 4, 0]
+    assert out[1][0].device_id is None and out[0][1] is None
+    assert np.array_equal(out[2][0].t, blocks[2].t)
+    # P = V*I and unknown T are not sent: 16 bytes per sample plus a 4 byte time delta
+    assert len(wire.encode_columns(_columns(1001))) < 1001 * 20 + 40
+
+
+def test_rows_are_split_by_device_and_source():
+    rows = [{"id": i, "device_id": "a" if i < 2 else "b", "t": "2024-01-01T00:00:00", "V": 1.0, "I": 2.0,
+             "P": 2.0, "T": None, "source": "SERIAL"} for i in range(3)]
+    out = list(wire.decode(wire.encode_rows(rows)))
+    assert [(c.device_id, c.id.tolist()) for c, _ in out] == [("a", [0, 1]), ("b", [2])]
+
+
+@pytest.mark.parametrize("data", [b"PVB1", b"JSON" + bytes(8), wire.encode_columns(_columns(3))[:-8]])
+def test_malformed_input_is_rejected(data):
+    with pytest.raises(ValueError):
+        list(wire.decode(data))
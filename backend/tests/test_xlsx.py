@@ -0,0 +1,68 @@
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+from openpyxl import Workbook
+
+from app.utils.columnar import SampleColumns, concat
+from app.utils.parser import iter_xlsx_rows
+from app.utils.xlsx import iter_xlsx_columns, sheet_names
+
+
+def _workbook(sheets) -> io.BytesIO:
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+
+def test_header_aliases_dates_and_bad_rows():
+    rows = [["Timestamp", "Voltage", "Current", "Temp"],
+            [datetime(2024, 5, 1, 12, 0, 0, 250000), 20.5, 0.1, 25],
+            [datetime(2024, 5, 1, 12, 0, 1), "18.0", 1.5, 26],
+            [datetime(2024, 5, 1, 12, 0, 2), None, 1.6, 26],
+            [],
+            ["not a time", 17.0, 1.7, 27]]
+    cols = concat(list(iter_xlsx_columns(_workbook({"Data": rows}))))
+    assert cols.V.tolist() == [20.5, 18.0]
+    assert np.allclose(cols.P, [2.05, 27.0])
+    assert cols.T.tolist() == [25.0, 26.0]
+    assert str(cols.t[0]) == "2024-05-01T12:00:00.250000"
+    # Blank rows are not errors
+    assert cols.skipped == 2
+    assert cols.errors == [(4, "missing V or I value"), (6, "invalid timestamp")]
+
+
+def test_sheet_selection():
+    buf = _workbook({"east": [["V", "I"], [10, 2]], "west": [[1, 3, 3, 20], [2, 4, 8, 21]]})
+    assert sheet_names(buf) == ["east", "west"]
+    buf.seek(0)
+    assert concat(list(iter_xlsx_columns(buf, ["west"]))).T.tolist() == [20.0, 21.0]
+    buf.seek(0)
+    cols = concat(list(iter_xlsx_columns(buf, ["*"])))
+    assert cols.V.tolist() == [10.0, 1.0, 2.0]
+    buf.seek(0)
+    with pytest.raises(ValueError, match="No sheet named 'north'"):
+        next(iter_xlsx_columns(buf, ["north"]))
+
+
+def test_batches_match_row_reader():
+    rows = [["t", "V", "I", "P"]] + [[datetime(2024, 1, 1, 0, k // 60, k % 60), k / 10, 5 - k / 100, None]
+                                     for k in range(250)]
+    rows[100][2] = "bad"
+    buf = _workbook({"sweep": rows})
+    batches = list(iter_xlsx_columns(buf, block_rows=64))
+    assert [len(b) for b in batches] == [64, 64, 64, 57]
+    assert sum(b.skipped for b in batches) == 1
+    buf.seek(0)
+    old = SampleColumns.from_rows(list(iter_xlsx_rows(buf)))
+    new = concat(batches)
+    assert np.allclose(new.P, old.P)
+    assert (new.t == old.t).all()
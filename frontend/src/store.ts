@@ -28,6 +28,9 @@ type State = {
 
 let socket: WebSocket | null = null
 
+// Plotly can't usefully draw more than a few thousand points per trace
+const MAX_CHART_POINTS = 5000
+
 export const useStore = create<State>((set, get) => ({
   samples: [],
   mpp: undefined,
@@ -39,13 +42,25 @@ export const useStore = create<State>((set, get) => ({
     if (socket && (socket.readyState === WebSocket.OPEN || socket.readyState === WebSocket.CONNECTING)) return
     set({ wsStatus: 'connecting' })
     socket = new WebSocket(wsUrl)
-    socket.onopen = () => set({ wsStatus: 'connected' })
+    socket.onopen = () => {
+      set({ wsStatus: 'connected' })
+      // Samples plus the running MPP, so the KPI follows ingestion without polling
+      socket?.send(JSON.stringify({ type: 'subscribe', streams: ['samples', 'mpp'] }))
+    }
     socket.onclose = () => set({ wsStatus: 'disconnected' })
     socket.onerror = () => set({ wsStatus: 'disconnected' })
     socket.onmessage = (ev) => {
       try {
         const msg = JSON.parse(ev.data)
-        if (msg?.type === 'sample' && msg?.data) {
+        if (msg?.type === 'samples' && Array.isArray(msg?.data)) {
+          set((s) => ({ samples: s.samples.concat(msg.data as Sample[]) }))
+        } else if (msg?.type === 'reset') {
+          set({ samples: [], mpp: undefined })
+        } else if (msg?.type === 'mpp' && msg?.data) {
+          // The live MPP covers all samples; a time window keeps the fetched one
+          const { filters } = get()
+          if (!filters.from && !filters.to) set({ mpp: msg.data as MPP })
+        } else if (msg?.type === 'sample' && msg?.data) {
           set((s) => ({ samples: [...s.samples, msg.data as Sample] }))
         }
       } catch {}
@@ -65,6 +80,8 @@ export const useStore = create<State>((set, get) => ({
     const params: any = {}
     if (filters.from) params.from = filters.from
     if (filters.to) params.to = filters.to
+    // Let the server reduce long windows (keeps peaks and the MPP)
+    params.max_points = MAX_CHART_POINTS
     const r = await api.get<Sample[]>('/api/samples', { params })
     set({ samples: r.data })
   },
@@ -6,12 +6,15 @@ export type Sample = {
   P?: number
   T?: number | null
   source?: 'SERIAL' | 'BLYNK' | 'IMPORT' | 'MANUAL'
+  device_id?: string
 }
 
 export type MPP = {
   Vmp: number
   Imp: number
   Pmp: number
-  index: number
+  // Not sent by the live mpp stream
+  index?: number
   t?: string
+  device_id?: string | null
 }
@@ -1,4 +1,5 @@
 import { Sample } from '../types'
+import { api } from '../api/client'
 import * as XLSX from 'xlsx'
 import jsPDF from 'jspdf'
 import autoTable from 'jspdf-autotable'
@@ -48,3 +49,14 @@ export function exportPDF(samples: Sample[], filename = 'samples.pdf') {
   })
   doc.save(filename)
 }
+
+// Full history export, streamed by the server (not limited to loaded samples)
+export function exportAllCSV(from?: string, to?: string) {
+  const params = new URLSearchParams({ format: 'csv' })
+  if (from) params.set('from', from)
+  if (to) params.set('to', to)
+  const a = document.createElement('a')
+  a.href = `${api.defaults.baseURL}/api/samples/export?${params.toString()}`
+  a.download = 'samples.csv'
+  a.click()
+}